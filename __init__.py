@@ -1,2 +1,11 @@
+from . import controllers
 from . import models
 from . import wizards
+
+from odoo import api, SUPERUSER_ID
+
+
+def post_init_hook(cr, registry):
+    """Monta a estrutura explodida das BOMs já existentes na instalação"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['mrp.bom.closure']._rebuild_all()
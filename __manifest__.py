@@ -1,6 +1,6 @@
 {
     'name': 'Custom BOM - Relatórios de Custo',
-    'version': '14.0.1.0.0',
+    'version': '14.0.1.5.0',
     'category': 'Manufacturing',
     'summary': 'Módulo personalizado para gerenciamento de BOM e relatórios de custo detalhados',
     'description': """
@@ -21,12 +21,21 @@
     'depends': ['base', 'mrp', 'purchase'],
     'data': [
         'security/ir.model.access.csv',
+        'views/assets.xml',
         'views/custom_bom_views.xml',
         'views/cost_report_wizard_views.xml',
+        'views/custom_bom_import_wizard_views.xml',
         'views/cost_report_views.xml',
+        'views/cost_simulation_views.xml',
+        'views/mrp_bom_closure_views.xml',
         'data/custom_bom_data.xml',
+        'data/cost_report_cron.xml',
+    ],
+    'qweb': [
+        'static/src/xml/cost_report_tree.xml',
     ],
     'demo': [],
+    'post_init_hook': 'post_init_hook',
     'installable': True,
     'auto_install': False,
     'application': False,
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from odoo import http
+from odoo.http import request, content_disposition
+
+
+class CostReportController(http.Controller):
+
+    @http.route('/custom_bom/cost_report/download/<int:attachment_id>', type='http', auth='user')
+    def download_cost_report(self, attachment_id, **kwargs):
+        """Envia o arquivo exportado em blocos, lendo direto do filestore"""
+        attachment = request.env['ir.attachment'].browse(attachment_id).exists()
+        if not attachment:
+            return request.not_found()
+        attachment.check('read')
+
+        if attachment.store_fname:
+            full_path = attachment._full_path(attachment.store_fname)
+            return http.send_file(
+                full_path,
+                filename=attachment.name,
+                mimetype=attachment.mimetype,
+                as_attachment=True,
+                # Exportação confidencial: sem o cache público de arquivos estáticos
+                cache_timeout=0,
+            )
+
+        # Anexo armazenado no banco de dados
+        return request.make_response(attachment.raw, headers=[
+            ('Content-Type', attachment.mimetype or 'application/octet-stream'),
+            ('Content-Disposition', content_disposition(attachment.name)),
+        ])
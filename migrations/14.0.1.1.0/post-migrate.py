@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Converte as colunas level_1..level_10 das linhas gravadas em caminhos
+(cost.report.path) e remove as colunas desnormalizadas"""
+from psycopg2.extras import execute_values
+
+from odoo import api, SUPERUSER_ID
+from odoo.tools.sql import column_exists
+
+_LEVEL_COLUMNS = ['level_{}'.format(i) for i in range(1, 11)]
+_FORMATTED_COLUMNS = ['unit_cost_formatted', 'total_cost_formatted', 'operation_cost_formatted']
+_BATCH_SIZE = 5000
+
+
+def migrate(cr, version):
+    if not version or not all(column_exists(cr, 'cost_report_line', column) for column in _LEVEL_COLUMNS):
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    path_model = env['cost.report.path']
+
+    cr.execute("SELECT DISTINCT report_id, section_id FROM cost_report_line WHERE path_id IS NULL")
+    for report_id, section_id in cr.fetchall():
+        path_cache = {}
+        last_id = 0
+        while True:
+            cr.execute("""
+                SELECT id, {}
+                  FROM cost_report_line
+                 WHERE report_id = %s AND section_id IS NOT DISTINCT FROM %s AND id > %s
+                 ORDER BY id
+                 LIMIT %s
+            """.format(', '.join(_LEVEL_COLUMNS)), (report_id, section_id, last_id, _BATCH_SIZE))
+            rows = cr.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            paths = path_model._intern_level_rows(
+                report_id, section_id, [[level or '' for level in row[1:]] for row in rows], path_cache
+            )
+            execute_values(cr, """
+                UPDATE cost_report_line AS line
+                   SET path_id = data.path_id, level_name = data.level_name
+                  FROM (VALUES %s) AS data (id, path_id, level_name)
+                 WHERE line.id = data.id
+            """, [(row[0], path_id, level_name) for row, (path_id, level_name) in zip(rows, paths)],
+                template='(%s, %s::integer, %s)', page_size=_BATCH_SIZE)
+
+    for column in _LEVEL_COLUMNS + _FORMATTED_COLUMNS:
+        cr.execute('ALTER TABLE cost_report_line DROP COLUMN IF EXISTS "{}"'.format(column))
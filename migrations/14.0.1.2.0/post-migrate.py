@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""Preenche os subtotais por tipo de linha dos relatórios existentes"""
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['cost.report'].with_context(active_test=False).search([])._recompute_report_totals()
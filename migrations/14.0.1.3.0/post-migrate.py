@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Liga as linhas já gravadas às suas BOMs superiores (parent_id e depth)
+
+A profundidade é obtida do caminho da linha; abaixo do último nível exibido
+os itens ficam ligados à última BOM visível.
+"""
+from psycopg2.extras import execute_values
+
+from odoo import api, SUPERUSER_ID
+
+_BATCH_SIZE = 5000
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    line_model = env['cost.report.line']
+
+    cr.execute("SELECT DISTINCT report_id, section_id FROM cost_report_line WHERE parent_id IS NULL")
+    for report_id, section_id in cr.fetchall():
+        cr.execute("""
+            SELECT line.id, line.line_type, COALESCE(path.depth, 0)
+              FROM cost_report_line line
+              LEFT JOIN cost_report_path path ON path.id = line.path_id
+             WHERE line.report_id = %s AND line.section_id IS NOT DISTINCT FROM %s
+             ORDER BY line.section_sequence, line.sequence, line.id
+        """, (report_id, section_id))
+        entries = cr.fetchall()
+        parent_ids = line_model._link_parent_lines(entries, [])
+        values = [
+            (line_id, parent_id, depth)
+            for (line_id, _line_type, depth), parent_id in zip(entries, parent_ids)
+        ]
+        execute_values(cr, """
+            UPDATE cost_report_line AS line
+               SET parent_id = data.parent_id, depth = data.depth
+              FROM (VALUES %s) AS data (id, parent_id, depth)
+             WHERE line.id = data.id
+        """, values, template='(%s, %s::integer, %s)', page_size=_BATCH_SIZE)
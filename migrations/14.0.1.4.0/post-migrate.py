@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""Calcula o custo consolidado dos BOMs já gravados
+
+Primeiro liga as linhas aos sub-BOMs dos seus produtos; depois recalcula
+todos os BOMs de uma vez, dos componentes para as montagens.
+"""
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['custom.bom.line'].search([])._resolve_sub_boms()
+    env['custom.bom'].with_context(active_test=False).search([])._recompute_costs()
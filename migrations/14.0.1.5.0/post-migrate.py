@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""Monta a estrutura explodida (mrp.bom.closure) de todas as BOMs existentes"""
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['mrp.bom.closure']._rebuild_all()
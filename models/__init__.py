@@ -1,3 +1,11 @@
 from . import custom_bom
 from . import cost_report
 from . import cost_report_line
+from . import cost_report_section
+from . import cost_report_path
+from . import cost_simulation
+from . import cost_report_run
+from . import cost_report_cache
+from . import product_product
+from . import mrp_bom_closure
+from . import mrp_bom
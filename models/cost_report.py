@@ -1,6 +1,23 @@
 # -*- coding: utf-8 -*-
+import io
+import json
+import logging
+import time
+
+from psycopg2.extensions import TransactionRollbackError
+from psycopg2.extras import execute_values
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from odoo.tools import config
+
+from ..tools.attachments import create_streamed_attachment
+from ..tools.cold_storage import read_chunks, write_chunks
+from ..tools.cost_snapshot import CostSnapshot
+from ..tools.report_sinks import ReportLineSink
+from ..tools.run_recorder import RunRecorder
+
+_logger = logging.getLogger(__name__)
 
 
 class CostReport(models.Model):
@@ -9,76 +26,107 @@ class CostReport(models.Model):
     _rec_name = 'name'
     _order = 'create_date desc'
 
+    # Quantidade de linhas inseridas por comando INSERT
+    _report_line_chunk_size = 1000
+    # Folga (segundos) entre o tempo da execução em segundo plano e o limite do worker
+    _job_time_margin = 15
+    # Tentativas de uma mesma BOM (conflitos ou worker encerrado) antes de desistir do relatório
+    _job_max_bom_attempts = 3
+
     name = fields.Char(string='Nome do Relatório', required=True, default='Relatório de Custo')
     bom_ids = fields.Many2many('mrp.bom', string='BOMs Analisados', readonly=True)
     max_display_levels = fields.Integer(string='Níveis de Hierarquia', readonly=True)
     include_operations = fields.Boolean(string='Inclui Operações', readonly=True)
     include_components = fields.Boolean(string='Inclui Componentes', readonly=True)
     include_taxes = fields.Boolean(string='Inclui Taxas', readonly=True)
+    catalog_rollup = fields.Boolean(string='Somente Custo Consolidado', readonly=True)
+    operation_time_source = fields.Selection([
+        ('standard', 'Tempo Padrão da Operação'),
+        ('actual', 'Tempo Real das Ordens de Trabalho'),
+    ], string='Tempo das Operações', readonly=True, default='standard')
+    actual_time_days = fields.Integer(string='Período do Tempo Real (dias)', readonly=True)
+    freeze_costs = fields.Boolean(string='Congelar Custos', copy=False,
+                                  help='Grava custos, nomes e unidades na geração e os reutiliza nas '
+                                       'regenerações seguintes, sem consultar os cadastros atuais')
+    snapshot_data = fields.Text(string='Snapshot de Custos', readonly=True, copy=False, prefetch=False)
+    snapshot_date = fields.Datetime(string='Custos Congelados em', readonly=True, copy=False)
     
-    # Campos de resultado
-    total_cost = fields.Float(string='Custo Total', compute='_compute_total_cost', store=True)
-    total_operations = fields.Integer(string='Total de Operações', compute='_compute_counts', store=True)
-    total_components = fields.Integer(string='Total de Componentes', compute='_compute_counts', store=True)
-    total_products = fields.Integer(string='Total de Produtos', compute='_compute_counts', store=True)
+    # Campos de resultado, agregados em SQL ao final da geração
+    total_cost = fields.Float(string='Custo Total', readonly=True, copy=False)
+    total_operations = fields.Integer(string='Total de Operações', readonly=True, copy=False)
+    total_components = fields.Integer(string='Total de Componentes', readonly=True, copy=False)
+    total_products = fields.Integer(string='Total de Produtos', readonly=True, copy=False)
+    cost_main_products = fields.Float(string='Custo Produtos Principais', readonly=True, copy=False)
+    cost_subassemblies = fields.Float(string='Custo Subconjuntos', readonly=True, copy=False)
+    cost_operations = fields.Float(string='Custo Operações', readonly=True, copy=False)
+    cost_components = fields.Float(string='Custo Componentes', readonly=True, copy=False)
     
     # Relacionamentos
     line_ids = fields.One2many('cost.report.line', 'report_id', string='Linhas do Relatório')
+    section_ids = fields.One2many('cost.report.section', 'report_id', string='Seções por BOM', readonly=True)
+    run_ids = fields.One2many('cost.report.run', 'report_id', string='Execuções', readonly=True)
+    lines_packed = fields.Boolean(string='Linhas Compactadas', readonly=True, copy=False,
+                                  help='As linhas estão em um anexo compactado e voltam ao banco ao abrir as linhas ou a hierarquia.')
+    packed_attachment_id = fields.Many2one('ir.attachment', string='Arquivo das Linhas', readonly=True, copy=False,
+                                           ondelete='set null')
+    packed_size = fields.Integer(related='packed_attachment_id.file_size', string='Tamanho Compactado (bytes)')
+    profile_runs = fields.Boolean(string='Gerar Perfil (cProfile)', groups='base.group_system',
+                                  help='Grava o perfil de cada execução como anexo do registro de execução.')
     
     # Campos de controle
     state = fields.Selection([
         ('draft', 'Rascunho'),
+        ('queued', 'Na Fila'),
+        ('running', 'Em Processamento'),
         ('generated', 'Gerado'),
+        ('cancelled', 'Cancelado'),
         ('archived', 'Arquivado')
     ], string='Status', default='draft', tracking=True)
     
+    # Campos de processamento em segundo plano
+    job_done_bom_ids = fields.Many2many('mrp.bom', 'cost_report_job_done_bom_rel', 'report_id', 'bom_id',
+                                        string='BOMs Processados', readonly=True, copy=False)
+    job_lines_written = fields.Integer(string='Linhas Gravadas', readonly=True, copy=False)
+    job_progress = fields.Float(string='Progresso', readonly=True, copy=False)
+    job_started_at = fields.Datetime(string='Início do Processamento', readonly=True, copy=False)
+    job_eta = fields.Datetime(string='Previsão de Término', readonly=True, copy=False)
+    job_cancel_requested = fields.Boolean(string='Cancelamento Solicitado', readonly=True, copy=False)
+    job_bom_id = fields.Many2one('mrp.bom', string='BOM em Processamento', readonly=True, copy=False)
+    job_bom_attempts = fields.Integer(string='Tentativas da BOM', readonly=True, copy=False)
+    job_error = fields.Text(string='Erro do Processamento', readonly=True, copy=False)
+    
     company_id = fields.Many2one('res.company', string='Empresa', 
                                  default=lambda self: self.env.company)
     create_date = fields.Datetime(string='Data de Criação', readonly=True)
     create_uid = fields.Many2one('res.users', string='Criado por', readonly=True)
     
-    @api.depends('line_ids.total_cost')
-    def _compute_total_cost(self):
-        """Calcula o custo total do relatório"""
-        for record in self:
-            record.total_cost = sum(record.line_ids.mapped('total_cost'))
-    
-    @api.depends('line_ids.line_type')
-    def _compute_counts(self):
-        """Calcula os totais de cada tipo de linha"""
-        for record in self:
-            lines = record.line_ids
-            record.total_operations = len(lines.filtered(lambda l: l.line_type == 'operacao'))
-            record.total_components = len(lines.filtered(lambda l: l.line_type == 'componente'))
-            record.total_products = len(lines.filtered(lambda l: l.line_type in ['produto_principal', 'subconjunto']))
-    
     def action_generate_report(self):
         """Gera o relatório de custo e armazena os dados"""
         if not self.bom_ids:
             raise UserError(_('Selecione pelo menos um BOM para gerar o relatório.'))
         
+        recorder = self._new_run_recorder()
+
         # Limpa linhas existentes
-        self.line_ids.unlink()
-        
-        # Gera o relatório usando o wizard
-        wizard = self.env['cost.report.wizard'].create({
-            'name': self.name,
-            'bom_ids': [(6, 0, self.bom_ids.ids)],
-            'max_display_levels': self.max_display_levels,
-            'include_operations': self.include_operations,
-            'include_components': self.include_components,
-            'include_taxes': self.include_taxes,
-        })
-        
-        # Gera os dados do relatório
-        csv_data_rows = []
-        wizard._generate_report_data_raw(csv_data_rows)
+        self._delete_report_lines()
         
-        # Converte os dados CSV para linhas do relatório
-        self._create_report_lines(csv_data_rows)
+        # Gera o relatório usando o wizard, uma seção por BOM principal; um relatório
+        # idêntico já gerado tem as linhas copiadas do cache
+        wizard = self._get_report_wizard()
+        explosion = self._prepare_explosion(wizard, recorder)
+        with recorder.phase('resolution'):
+            fingerprints = wizard._get_bom_fingerprints(explosion)
+        if not self._copy_lines_from_cache(wizard, fingerprints, recorder):
+            self._write_sections(wizard, self.bom_ids, explosion=explosion, recorder=recorder,
+                                 fingerprints=fingerprints)
+            with recorder.phase('aggregation'):
+                self._recompute_report_totals()
+            self._store_in_cache(wizard, fingerprints)
+        self._save_snapshot(explosion)
         
         # Atualiza o status
         self.write({'state': 'generated'})
+        self.env['cost.report.run']._log_run(recorder, 'generate', self.name, report=self)
         
         return {
             'type': 'ir.actions.act_window',
@@ -88,87 +136,615 @@ class CostReport(models.Model):
             'target': 'current',
         }
     
-    def _create_report_lines(self, csv_data_rows):
-        """Cria as linhas do relatório a partir dos dados CSV"""
-        if not csv_data_rows or len(csv_data_rows) < 2:  # Pula o cabeçalho
+    def _get_report_wizard(self):
+        """Cria o assistente com as opções do relatório, usado para a explosão das BOMs"""
+        return self.env['cost.report.wizard'].create({
+            'name': self.name,
+            'bom_ids': [(6, 0, self.bom_ids.ids)],
+            'max_display_levels': self.max_display_levels,
+            'include_operations': self.include_operations,
+            'include_components': self.include_components,
+            'include_taxes': self.include_taxes,
+            'catalog_rollup': self.catalog_rollup,
+            'operation_time_source': self.operation_time_source,
+            'actual_time_days': self.actual_time_days,
+        })
+
+    def _prepare_explosion(self, wizard, recorder):
+        """Explosão do relatório; com custos congelados, usa o snapshot gravado"""
+        snapshot = None
+        if self.freeze_costs and self.snapshot_data:
+            snapshot = CostSnapshot.from_data(self.env, json.loads(self.snapshot_data))
+        return wizard._prepare_explosion(recorder, snapshot=snapshot)
+
+    def _save_snapshot(self, explosion):
+        """Grava o snapshot da execução se os custos estão congelados; senão descarta o anterior
+
+        Um snapshot restaurado só é regravado quando a estrutura passou a usar
+        produtos, unidades ou centros que ele não continha.
+        """
+        self.ensure_one()
+        if not self.freeze_costs:
+            if self.snapshot_date:
+                self.write({'snapshot_data': False, 'snapshot_date': False})
             return
-        
-        # Pula o cabeçalho (primeira linha)
-        data_rows = csv_data_rows[1:]
-        
-        for sequence, row in enumerate(data_rows, 1):
-            if not row or all(not cell for cell in row):  # Pula linhas vazias
+        snapshot = explosion['snapshot']
+        if self.snapshot_date and not snapshot.changed:
+            return
+        vals = {'snapshot_data': json.dumps(snapshot.to_data())}
+        if not self.snapshot_date:
+            vals['snapshot_date'] = fields.Datetime.now()
+        self.write(vals)
+
+    def _new_run_recorder(self):
+        """Coletor de métricas da execução; o perfil é restrito a administradores"""
+        return RunRecorder(self.env.cr, profile=self.sudo().profile_runs)
+
+    def _write_sections(self, wizard, boms, explosion=None, recorder=None, fingerprints=None):
+        """Explode as BOMs informadas gravando uma seção com impressão digital para cada uma"""
+        recorder = recorder or RunRecorder(self.env.cr)
+        if explosion is None:
+            explosion = self._prepare_explosion(wizard, recorder)
+        if fingerprints is None:
+            with recorder.phase('resolution'):
+                fingerprints = wizard._get_bom_fingerprints(explosion, boms)
+        sink = ReportLineSink(self, fingerprints, recorder)
+        wizard._run_report_sinks([sink], boms=boms, explosion=explosion, recorder=recorder)
+        return sink
+
+    def _store_in_cache(self, wizard, fingerprints):
+        """Registra o relatório gerado para ser copiado por pedidos idênticos"""
+        self.ensure_one()
+        cache_model = self.env['cost.report.cache']
+        return cache_model._store(cache_model._make_key(wizard, fingerprints, 'report'), 'report', self.name,
+                                  report=self)
+
+    def _copy_lines_from_cache(self, wizard, fingerprints, recorder):
+        """Copia as linhas de um relatório idêntico do cache; False quando não há"""
+        self.ensure_one()
+        cache_model = self.env['cost.report.cache']
+        source = cache_model._lookup(cache_model._make_key(wizard, fingerprints, 'report')).report_id
+        if not source or source == self:
+            return False
+        with recorder.phase('insertion'):
+            self._copy_lines_from(source)
+        with recorder.phase('aggregation'):
+            self._recompute_report_totals()
+        return True
+
+    def _copy_lines_from(self, source):
+        """Copia seções, caminhos e linhas de outro relatório com INSERT ... SELECT
+
+        Os ids de cada tabela são reservados antes da cópia para remapear as
+        referências entre seções, caminhos e linhas.
+        """
+        self.ensure_one()
+        self.flush()
+        source.flush()
+        cr = self.env.cr
+        now = fields.Datetime.now()
+        log_values = {'create_uid': self.env.uid, 'create_date': now, 'write_uid': self.env.uid, 'write_date': now}
+
+        def reserve_ids(model):
+            cr.execute("SELECT id, nextval(%s) FROM {} WHERE report_id = %s".format(model._table),
+                       ('{}_id_seq'.format(model._table), source.id))
+            rows = cr.fetchall()
+            return [row[0] for row in rows], [row[1] for row in rows]
+
+        def copy_table(model, id_maps):
+            # id_maps: coluna -> (ids antigos, ids novos) da tabela referenciada
+            ids_map = id_maps['id']
+            mapped_columns = [column for column in id_maps if column != 'id']
+            copied_columns = [
+                name for name, field in model._fields.items()
+                if field.store and field.column_type and name not in id_maps
+                and name not in ['report_id'] + models.MAGIC_COLUMNS
+            ]
+            log_columns = list(log_values) if model._log_access else []
+            select_values = ['map_id.new_id', '%(report_id)s'] + [
+                'map_{0}.new_id'.format(column) for column in mapped_columns
+            ] + ['src."{}"'.format(column) for column in copied_columns] + [
+                '%({})s'.format(column) for column in log_columns
+            ]
+            joins = ['JOIN unnest(%(id_old)s::int[], %(id_new)s::int[]) AS map_id (old_id, new_id) '
+                     'ON map_id.old_id = src.id']
+            params = dict(log_values, report_id=self.id, id_old=ids_map[0], id_new=ids_map[1])
+            for column in mapped_columns:
+                joins.append(
+                    'LEFT JOIN unnest(%({0}_old)s::int[], %({0}_new)s::int[]) AS map_{0} (old_id, new_id) '
+                    'ON map_{0}.old_id = src."{0}"'.format(column))
+                params['%s_old' % column], params['%s_new' % column] = id_maps[column]
+            cr.execute("""
+                INSERT INTO "{table}" ({columns})
+                SELECT {select_values}
+                  FROM "{table}" src {joins}
+                 WHERE src.report_id = %(source_id)s
+            """.format(
+                table=model._table,
+                columns=', '.join('"{}"'.format(column) for column in
+                                  ['id', 'report_id'] + mapped_columns + copied_columns + log_columns),
+                select_values=', '.join(select_values),
+                joins=' '.join(joins),
+            ), dict(params, source_id=source.id))
+
+        section_model = self.env['cost.report.section']
+        path_model = self.env['cost.report.path']
+        line_model = self.env['cost.report.line']
+        section_ids = reserve_ids(section_model)
+        path_ids = reserve_ids(path_model)
+        line_ids = reserve_ids(line_model)
+        copy_table(section_model, {'id': section_ids})
+        copy_table(path_model, {'id': path_ids, 'section_id': section_ids, 'parent_id': path_ids})
+        copy_table(line_model, {'id': line_ids, 'section_id': section_ids, 'path_id': path_ids,
+                                'parent_id': line_ids})
+        section_model.invalidate_cache()
+        path_model.invalidate_cache()
+        line_model.invalidate_cache()
+        self.invalidate_cache(['line_ids', 'section_ids'], self.ids)
+
+    def _create_section(self, bom, fingerprint):
+        """Nova seção do relatório para as linhas de uma BOM principal"""
+        self.ensure_one()
+        return self.env['cost.report.section'].create({
+            'report_id': self.id,
+            'bom_id': bom.id,
+            'sequence': self.bom_ids.ids.index(bom.id),
+            'fingerprint': fingerprint,
+        })
+
+    def action_refresh_report(self):
+        """Atualiza o relatório regenerando apenas as BOMs cuja estrutura ou custos mudaram"""
+        for record in self:
+            if record.state != 'generated' or not record.section_ids:
+                record.action_generate_report()
                 continue
-            
-            # Mapeia os campos baseado na estrutura do CSV
-            line_vals = {
-                'report_id': self.id,
-                'sequence': sequence,
-                'bom_main_code': row[0] if len(row) > 0 else '',
-                'item_code': row[1] if len(row) > 1 else '',
-            }
-            
-            # Campos de hierarquia (posições 2 a 11)
-            for i in range(10):
-                if len(row) > 2 + i:
-                    line_vals[f'level_{i+1}'] = row[2 + i] or ''
-            
-            # Campos de detalhes (posições 12 em diante)
-            if len(row) > 12:
-                line_vals.update({
-                    'bom_reference': row[12] or '',
-                    'item_qty': self._safe_float_convert(row[13]) if len(row) > 13 else 0.0,
-                    'uom_name': row[14] if len(row) > 14 else '',
-                    'unit_cost': self._safe_float_convert(row[15]) if len(row) > 15 else 0.0,
-                    'total_cost': self._safe_float_convert(row[16]) if len(row) > 16 else 0.0,
-                    'purchase_taxes': row[17] if len(row) > 17 else '',
-                    'line_type': self._map_line_type(row[18]) if len(row) > 18 else 'componente',
-                })
-            
-            # Campos específicos de operação
-            if len(row) > 19:
-                line_vals.update({
-                    'operation_name': row[19] if len(row) > 19 else '',
-                    'workcenter_name': row[20] if len(row) > 20 else '',
-                    'operation_time': row[21] if len(row) > 21 else '',
-                    'operation_cost': self._safe_float_convert(row[22]) if len(row) > 22 else 0.0,
-                })
-            
-            # Cria a linha do relatório
-            self.env['cost.report.line'].create(line_vals)
-    
-    def _safe_float_convert(self, value):
-        """Converte valor para float de forma segura, tratando formatos brasileiros"""
-        if not value:
-            return 0.0
-        
-        try:
-            # Remove espaços e substitui vírgula por ponto
-            clean_value = str(value).strip().replace(',', '.')
-            return float(clean_value)
-        except (ValueError, TypeError):
-            return 0.0
-    
-    def _map_line_type(self, type_str):
-        """Mapeia o tipo de linha do CSV para o campo selection"""
-        type_mapping = {
-            'Produto Principal': 'produto_principal',
-            'Subconjunto': 'subconjunto',
-            'Operação': 'operacao',
-            'Componente': 'componente'
+            record._unpack_lines()
+            record._refresh_sections()
+        return True
+
+    def _refresh_sections(self):
+        """Substitui as seções com impressão digital desatualizada, mantendo as demais"""
+        self.ensure_one()
+        recorder = self._new_run_recorder()
+        wizard = self._get_report_wizard()
+        explosion = self._prepare_explosion(wizard, recorder)
+        with recorder.phase('resolution'):
+            fingerprints = wizard._get_bom_fingerprints(explosion)
+        sections_by_bom = {section.bom_id.id: section for section in self.section_ids}
+
+        stale_sections = self.section_ids.filtered(
+            lambda section: fingerprints.get(section.bom_id.id) != section.fingerprint
+        )
+        stale_boms = self.bom_ids.filtered(
+            lambda bom: bom.id not in sections_by_bom or sections_by_bom[bom.id] in stale_sections
+        )
+        if not stale_sections and not stale_boms:
+            return False
+
+        self._save_snapshot(explosion)
+        _logger.info("Relatório de custo %s: regenerando %s de %s BOMs",
+                     self.id, len(stale_boms), len(self.bom_ids))
+        stale_sections._delete_with_lines()
+        self._write_sections(wizard, stale_boms, explosion=explosion, recorder=recorder)
+        with recorder.phase('aggregation'):
+            self._recompute_report_totals()
+        self.env['cost.report.cache']._invalidate_reports(self)
+        self._store_in_cache(wizard, fingerprints)
+        self.env['cost.report.run']._log_run(recorder, 'refresh', self.name, report=self)
+        return True
+
+    @api.model
+    def _cron_refresh_reports(self):
+        """Atualiza incrementalmente todos os relatórios gerados"""
+        for report in self.search([('state', '=', 'generated')]):
+            report.action_refresh_report()
+            self.env.cr.commit()
+
+    def _reset_job(self):
+        """Limpa o progresso do processamento em segundo plano"""
+        self.write({
+            'job_done_bom_ids': [(5, 0, 0)],
+            'job_lines_written': 0,
+            'job_progress': 0.0,
+            'job_started_at': False,
+            'job_eta': False,
+            'job_cancel_requested': False,
+            'job_bom_id': False,
+            'job_bom_attempts': 0,
+            'job_error': False,
+        })
+
+    def action_enqueue(self):
+        """Coloca o relatório na fila de geração em segundo plano"""
+        for record in self:
+            if not record.bom_ids:
+                raise UserError(_('Selecione pelo menos um BOM para gerar o relatório.'))
+        self._delete_report_lines()
+        self._reset_job()
+        self.write({'state': 'queued'})
+        return True
+
+    def action_cancel_job(self):
+        """Cancela a geração em segundo plano"""
+        queued = self.filtered(lambda r: r.state == 'queued')
+        queued.write({'state': 'cancelled'})
+        (self - queued).filtered(lambda r: r.state == 'running').write({'job_cancel_requested': True})
+        return True
+
+    @api.model
+    def _get_job_time_budget(self):
+        """Tempo (segundos) de cada execução em segundo plano
+
+        Com workers, fica abaixo dos limites que encerram o processo do cron
+        (limit_time_real_cron, ou limit_time_real quando -1, e limit_time_cpu),
+        para que o progresso seja gravado antes disso.
+        """
+        time_budget = float(self.env['ir.config_parameter'].sudo().get_param(
+            'custom_bom.report_job_time_budget', 45))
+        if not config.get('workers'):
+            return time_budget
+        real_limit = config.get('limit_time_real_cron') or 0
+        if real_limit < 0:
+            real_limit = config.get('limit_time_real') or 0
+        limits = [limit for limit in (real_limit, config.get('limit_time_cpu') or 0) if limit > 0]
+        if limits:
+            time_budget = min(time_budget, max(min(limits) - self._job_time_margin, min(limits) / 2.0))
+        return time_budget
+
+    @api.model
+    def _cron_run_report_jobs(self):
+        """Processa os relatórios na fila respeitando o tempo limite da execução"""
+        deadline = time.time() + self._get_job_time_budget()
+        while time.time() < deadline:
+            report = self.search([('state', 'in', ['queued', 'running'])], order='id', limit=1)
+            if not report:
+                break
+            if not report._as_job_owner()._run_job(deadline):
+                break
+
+    def _as_job_owner(self):
+        """O relatório com o usuário que o criou e as empresas dele, como na geração pela tela"""
+        self.ensure_one()
+        owner = self.create_uid
+        companies = owner.company_ids
+        company = self.company_id if self.company_id in companies else owner.company_id
+        return self.with_user(owner).with_context(
+            allowed_company_ids=[company.id] + (companies - company).ids)
+
+    def _run_job(self, deadline):
+        """Processa as BOMs pendentes do relatório, gravando o progresso a cada BOM
+
+        Retorna True quando o relatório terminou (gerado, cancelado ou com erro) e
+        False quando o tempo acabou antes, para continuar na próxima execução.
+        """
+        self.ensure_one()
+        if self.state == 'queued':
+            self.write({'state': 'running', 'job_started_at': fields.Datetime.now()})
+            self.env.cr.commit()
+
+        recorder = self._new_run_recorder()
+        wizard = self._get_report_wizard()
+        # Confirma o assistente: um rollback na primeira BOM não pode removê-lo
+        self.env.cr.commit()
+        explosion = self._prepare_explosion(wizard, recorder)
+        with recorder.phase('resolution'):
+            fingerprints = wizard._get_bom_fingerprints(explosion)
+        while True:
+            self.env.cr.execute("SELECT job_cancel_requested FROM cost_report WHERE id = %s", (self.id,))
+            if self.env.cr.fetchone()[0]:
+                self._delete_report_lines()
+                self._reset_job()
+                self.write({'state': 'cancelled'})
+                self.env.cr.commit()
+                return True
+
+            pending_boms = self.bom_ids - self.job_done_bom_ids
+            if not pending_boms:
+                break
+            if time.time() >= deadline:
+                self.env['cost.report.run']._log_run(recorder, 'job', self.name, report=self)
+                self.env.cr.commit()
+                return False
+
+            bom = pending_boms[0]
+            # A tentativa é gravada antes do processamento: conta também o worker encerrado por tempo
+            attempts = self.job_bom_attempts + 1 if self.job_bom_id == bom else 1
+            if attempts > self._job_max_bom_attempts:
+                _logger.warning("Relatório de custo %s: BOM %s excedeu as tentativas", self.id, bom.id)
+                return self._fail_job(_(
+                    'A BOM %s não foi concluída após %s tentativas de %s segundos. Divida a estrutura em '
+                    'sub-BOMs menores ou aumente o parâmetro custom_bom.report_job_time_budget (e, com '
+                    'workers, os limites limit_time_real_cron e limit_time_cpu).'
+                ) % (bom.display_name, self._job_max_bom_attempts, int(self._get_job_time_budget())))
+            self.write({'job_bom_id': bom.id, 'job_bom_attempts': attempts})
+            self.env.cr.commit()
+            try:
+                # Um destino por BOM: após um rollback o cache de caminhos não vale mais
+                sink = ReportLineSink(self, fingerprints, recorder)
+                wizard._run_report_sinks([sink], boms=bom, explosion=explosion, recorder=recorder)
+                self._update_job_progress(bom, sink.line_count)
+                self.env.cr.commit()
+            except TransactionRollbackError:
+                # Conflito com uma escrita concorrente (ex.: cancelamento): repete a BOM
+                self.env.cr.rollback()
+                self.env.clear()
+            except Exception as error:
+                self.env.cr.rollback()
+                self.env.clear()
+                _logger.exception("Falha ao gerar o relatório de custo %s", self.id)
+                return self._fail_job(str(error))
+
+        with recorder.phase('aggregation'):
+            self._recompute_report_totals()
+        self._store_in_cache(wizard, fingerprints)
+        self._save_snapshot(explosion)
+        self.write({'state': 'generated', 'job_progress': 100.0, 'job_eta': False})
+        self.env['cost.report.run']._log_run(recorder, 'job', self.name, report=self)
+        self.env.cr.commit()
+        return True
+
+    def _fail_job(self, message):
+        """Interrompe o processamento em segundo plano, descartando as linhas parciais e registrando o erro"""
+        self._delete_report_lines()
+        self._reset_job()
+        self.write({'state': 'draft', 'job_error': message})
+        self.env.cr.commit()
+        return True
+
+    def _update_job_progress(self, done_bom, lines_written):
+        """Registra a BOM concluída, as linhas gravadas e a previsão de término"""
+        done_count = len(self.job_done_bom_ids) + 1
+        total_count = len(self.bom_ids)
+        job_eta = False
+        if self.job_started_at and done_count < total_count:
+            elapsed = fields.Datetime.now() - self.job_started_at
+            job_eta = fields.Datetime.now() + elapsed / done_count * (total_count - done_count)
+        self.write({
+            'job_done_bom_ids': [(4, done_bom.id)],
+            'job_lines_written': self.job_lines_written + lines_written,
+            'job_progress': 100.0 * done_count / total_count,
+            'job_eta': job_eta,
+        })
+
+    def _delete_report_lines(self):
+        """Remove as linhas do relatório diretamente no banco"""
+        if not self.ids:
+            return
+        self.flush()
+        self.env.cr.execute("DELETE FROM cost_report_line WHERE report_id IN %s", (tuple(self.ids),))
+        self.env.cr.execute("DELETE FROM cost_report_path WHERE report_id IN %s", (tuple(self.ids),))
+        self.env.cr.execute("DELETE FROM cost_report_section WHERE report_id IN %s", (tuple(self.ids),))
+        self.env['cost.report.section'].invalidate_cache()
+        self.env['cost.report.path'].invalidate_cache()
+        self.invalidate_cache(['section_ids'], self.ids)
+        self.env['cost.report.line'].invalidate_cache()
+        self.invalidate_cache(['line_ids'], self.ids)
+        self.env['cost.report.cache']._invalidate_reports(self)
+        self._drop_packed_lines()
+        self._recompute_report_totals()
+
+    def _recompute_report_totals(self):
+        """Recalcula os totais com uma única agregação por tipo de linha, após a gravação das linhas"""
+        if not self.ids:
+            return
+        self.env['cost.report.line'].flush(['report_id', 'line_type', 'total_cost'])
+        self.env.cr.execute("""
+            SELECT report_id, line_type, SUM(total_cost), COUNT(*)
+              FROM cost_report_line
+             WHERE report_id IN %s
+             GROUP BY report_id, line_type
+        """, (tuple(self.ids),))
+        totals_by_report = {report_id: dict(
+            total_cost=0.0, total_operations=0, total_components=0, total_products=0,
+            cost_main_products=0.0, cost_subassemblies=0.0, cost_operations=0.0, cost_components=0.0,
+        ) for report_id in self.ids}
+        type_cost_fields = {
+            'produto_principal': 'cost_main_products',
+            'subconjunto': 'cost_subassemblies',
+            'operacao': 'cost_operations',
+            'componente': 'cost_components',
         }
-        return type_mapping.get(type_str, 'componente')
+        for report_id, line_type, type_cost, type_count in self.env.cr.fetchall():
+            totals = totals_by_report[report_id]
+            type_cost = type_cost or 0.0
+            totals['total_cost'] += type_cost
+            if line_type in type_cost_fields:
+                totals[type_cost_fields[line_type]] += type_cost
+            if line_type == 'operacao':
+                totals['total_operations'] += type_count
+            elif line_type == 'componente':
+                totals['total_components'] += type_count
+            elif line_type in ('produto_principal', 'subconjunto'):
+                totals['total_products'] += type_count
+        for report in self:
+            report.write(totals_by_report[report.id])
+    
+    def _format_operation_time(self, minutes):
+        """Tempo da operação, em minutos, no formato gravado nas linhas"""
+        if minutes is None:
+            return ''
+        return self.env['cost.report.wizard']._format_duration(minutes)
     
     def action_archive(self):
         """Arquiva o relatório"""
         self.write({'state': 'archived'})
-    
+
+    def action_archive_packed(self):
+        """Arquiva o relatório e move as linhas para um anexo compactado"""
+        self.action_archive()
+        for record in self:
+            record._pack_lines()
+        return True
+
+    @api.model
+    def _get_packed_models(self):
+        """Tabelas movidas para o anexo, na ordem de restauração"""
+        return [self.env['cost.report.path'], self.env['cost.report.line']]
+
+    @api.model
+    def _get_packed_columns(self, model):
+        """Colunas gravadas no anexo: o id e os campos armazenados, exceto o relatório e os de log"""
+        return ['id'] + [
+            name for name, field in model._fields.items()
+            if field.store and field.column_type and name not in ['report_id'] + models.MAGIC_COLUMNS
+        ]
+
+    def _pack_lines(self):
+        """Move caminhos e linhas do relatório para um anexo JSON colunar compactado com gzip
+
+        As seções e os totais continuam no banco e podem ser consultados sem
+        restaurar as linhas. Cada tabela é lida em blocos ordenados por
+        profundidade, para que os pais sejam restaurados antes dos filhos.
+        """
+        self.ensure_one()
+        if self.lines_packed:
+            return False
+        self.flush()
+        self.env['cost.report.path'].flush()
+        self.env['cost.report.line'].flush()
+        cr = self.env.cr
+        cr.execute("SELECT 1 FROM cost_report_line WHERE report_id = %s LIMIT 1", (self.id,))
+        if not cr.fetchone():
+            return False
+
+        def chunks():
+            for model in self._get_packed_models():
+                columns = self._get_packed_columns(model)
+                depth_index = columns.index('depth')
+                last_key = (-1, 0)
+                while True:
+                    cr.execute("""
+                        SELECT {columns}
+                          FROM "{table}"
+                         WHERE report_id = %s AND (depth, id) > (%s, %s)
+                         ORDER BY depth, id
+                         LIMIT %s
+                    """.format(columns=', '.join('"{}"'.format(column) for column in columns), table=model._table),
+                        (self.id, last_key[0], last_key[1], self._report_line_chunk_size))
+                    rows = cr.fetchall()
+                    if not rows:
+                        break
+                    last_key = (rows[-1][depth_index], rows[-1][0])
+                    yield model._table, columns, rows
+
+        attachment = create_streamed_attachment(
+            self.env, 'cost_report_%s_lines.json.gz' % self.id, 'application/gzip',
+            lambda binary_file: write_chunks(binary_file, chunks()),
+            res_model=self._name, res_id=self.id,
+        )
+        cr.execute("DELETE FROM cost_report_line WHERE report_id = %s", (self.id,))
+        cr.execute("DELETE FROM cost_report_path WHERE report_id = %s", (self.id,))
+        self.env['cost.report.path'].invalidate_cache()
+        self.env['cost.report.line'].invalidate_cache()
+        self.invalidate_cache(['line_ids'], self.ids)
+        # As linhas não podem mais ser copiadas por pedidos idênticos
+        self.env['cost.report.cache']._invalidate_reports(self)
+        self.write({'lines_packed': True, 'packed_attachment_id': attachment.id})
+        _logger.info("Relatório de custo %s: linhas compactadas em %s bytes", self.id, attachment.file_size)
+        return True
+
+    def _unpack_lines(self):
+        """Restaura as linhas compactadas com os ids originais e remove o anexo"""
+        for report in self.sudo().filtered('lines_packed'):
+            report.flush()
+            cr = self.env.cr
+            # Bloqueia o relatório para que aberturas simultâneas não restaurem duas vezes
+            cr.execute("SELECT lines_packed FROM cost_report WHERE id = %s FOR UPDATE", (report.id,))
+            row = cr.fetchone()
+            report.invalidate_cache(['lines_packed', 'packed_attachment_id'])
+            if not row or not row[0]:
+                continue
+            attachment = report.packed_attachment_id
+            if not attachment:
+                raise UserError(_('O arquivo com as linhas do relatório "%s" não foi encontrado.') % report.name)
+            if attachment.store_fname:
+                binary_file = open(attachment._full_path(attachment.store_fname), 'rb')
+            else:
+                binary_file = io.BytesIO(attachment.raw or b'')
+            models_by_table = {model._table: model for model in self._get_packed_models()}
+            now = fields.Datetime.now()
+            with binary_file:
+                for table, columns, rows in read_chunks(binary_file):
+                    model = models_by_table[table]
+                    log_columns = ['create_uid', 'create_date', 'write_uid', 'write_date'] if model._log_access else []
+                    log_values = (self.env.uid, now, self.env.uid, now) if model._log_access else ()
+                    execute_values(cr, 'INSERT INTO "{}" ({}) VALUES %s'.format(
+                        model._table,
+                        ', '.join('"{}"'.format(column) for column in ['report_id'] + columns + log_columns),
+                    ), [(report.id,) + tuple(values) + log_values for values in rows], page_size=len(rows))
+            self.env['cost.report.path'].invalidate_cache()
+            self.env['cost.report.line'].invalidate_cache()
+            report.invalidate_cache(['line_ids'])
+            report.write({'lines_packed': False, 'packed_attachment_id': False})
+            attachment.unlink()
+
+    def _drop_packed_lines(self):
+        """Descarta os anexos de linhas compactadas, quando as linhas são regeneradas"""
+        packed = self.filtered('lines_packed')
+        if packed:
+            attachments = packed.mapped('packed_attachment_id')
+            packed.write({'lines_packed': False, 'packed_attachment_id': False})
+            attachments.sudo().unlink()
+
     def action_draft(self):
         """Retorna para rascunho"""
+        self._reset_job()
         self.write({'state': 'draft'})
     
+    def action_view_tree(self):
+        """Abre o visualizador hierárquico, que carrega os filhos sob demanda"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'cost_report_tree',
+            'name': _('Hierarquia: %s') % self.name,
+            'params': {'report_id': self.id},
+        }
+
+    def get_tree_rows(self, parent_line_id=False, offset=0, limit=80):
+        """Uma página dos filhos de parent_line_id (ou dos produtos principais) para o visualizador"""
+        self.ensure_one()
+        self._unpack_lines()
+        line_model = self.env['cost.report.line']
+        if parent_line_id:
+            domain = [('report_id', '=', self.id), ('parent_id', '=', parent_line_id)]
+        else:
+            domain = [('report_id', '=', self.id), ('line_type', '=', 'produto_principal')]
+        total = line_model.search_count(domain)
+        lines = line_model.search(domain, offset=offset, limit=limit)
+
+        bom_lines = lines.filtered(lambda line: line.line_type in ('produto_principal', 'subconjunto'))
+        child_counts = {}
+        if bom_lines:
+            for group in line_model.read_group([('parent_id', 'in', bom_lines.ids)], ['parent_id'], ['parent_id']):
+                child_counts[group['parent_id'][0]] = group['parent_id_count']
+
+        max_levels = self.max_display_levels or 10
+        rows = []
+        for line in lines:
+            name = line.level_name or ''
+            if line.depth >= max_levels:
+                # Além do último nível exibido, a coluna traz o caminho "pai > item"
+                name = name.rsplit(' > ', 1)[-1]
+            rows.append({
+                'id': line.id,
+                'name': name,
+                'item_code': line.item_code or '',
+                'line_type': line.line_type,
+                'item_qty': line.item_qty,
+                'uom_name': line.uom_name or '',
+                'unit_cost': line.unit_cost,
+                'total_cost': line.total_cost,
+                'purchase_taxes': line.purchase_taxes or '',
+                'workcenter_name': line.workcenter_name or '',
+                'operation_time': line.operation_time or '',
+                'child_count': child_counts.get(line.id, 0),
+            })
+        return {'rows': rows, 'total': total, 'offset': offset, 'limit': limit}
+
     def action_view_lines(self):
         """Abre a view das linhas do relatório"""
+        self._unpack_lines()
         return {
             'type': 'ir.actions.act_window',
             'name': f'Linhas do Relatório: {self.name}',
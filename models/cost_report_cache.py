@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import hashlib
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+
+
+class CostReportCache(models.Model):
+    _name = 'cost.report.cache'
+    _description = 'Cache de Resultados do Relatório de Custo'
+    _order = 'last_used desc, id desc'
+    _rec_name = 'name'
+
+    name = fields.Char(string='Relatório', readonly=True)
+    key = fields.Char(string='Chave', required=True, index=True, readonly=True,
+                      help='Hash das BOMs, das opções e das impressões digitais da estrutura e dos custos')
+    kind = fields.Selection([
+        ('csv', 'Arquivo CSV'),
+        ('xlsx', 'Arquivo Excel'),
+        ('report', 'Relatório Persistente'),
+    ], string='Tipo', required=True, readonly=True)
+    attachment_id = fields.Many2one('ir.attachment', string='Arquivo', readonly=True, ondelete='cascade')
+    report_id = fields.Many2one('cost.report', string='Relatório Persistente', readonly=True, ondelete='cascade',
+                                index=True)
+    size = fields.Integer(string='Tamanho (bytes)', readonly=True)
+    hit_count = fields.Integer(string='Reaproveitamentos', readonly=True)
+    last_used = fields.Datetime(string='Último Uso', readonly=True, index=True)
+
+    @api.model
+    def _get_limits(self):
+        """(idade máxima, bytes máximos) do cache; idade zero desativa o cache"""
+        params = self.env['ir.config_parameter'].sudo()
+        max_age = timedelta(hours=float(params.get_param('custom_bom.report_cache_max_age_hours', 24)))
+        max_bytes = int(params.get_param('custom_bom.report_cache_max_bytes', 1024 * 1024 * 1024))
+        return max_age, max_bytes
+
+    @api.model
+    def _make_key(self, wizard, fingerprints, kind):
+        """Chave do resultado; False quando o cache está desativado
+
+        As BOMs entram ordenadas por id; as impressões digitais cobrem as datas
+        de alteração da estrutura, os custos e as opções do relatório. Os grupos
+        do usuário e as empresas permitidas também entram, pois as buscas (ex.:
+        taxas de compra) passam pelas regras de acesso: usuários com os mesmos
+        grupos e empresas compartilham o resultado. Regras que dependem do
+        próprio usuário (ex.: somente seus documentos) não são cobertas.
+        """
+        max_age, _max_bytes = self._get_limits()
+        if not max_age:
+            return False
+        groups_digest = hashlib.sha1(str(sorted(self.env.user.groups_id.ids)).encode('utf-8')).hexdigest()
+        digest = hashlib.sha1()
+        digest.update(('%s:%s:%s:%s:%s:%s:%s:%s:%s:%s:%s:%s' % (
+            kind, groups_digest, self.env.su, self.env.company.id, sorted(self.env.companies.ids),
+            sorted(wizard.bom_ids.ids), wizard.max_display_levels,
+            wizard.include_operations, wizard.include_components, wizard.include_taxes, wizard.catalog_rollup,
+            wizard._get_actual_time_params()[0],
+        )).encode('utf-8'))
+        for bom_id in sorted(fingerprints):
+            digest.update(('\n%s:%s' % (bom_id, fingerprints[bom_id])).encode('utf-8'))
+        return digest.hexdigest()
+
+    @api.model
+    def _lookup(self, key):
+        """Entrada válida para a chave, marcada como usada; vazia quando não há"""
+        if not key:
+            return self.browse()
+        max_age, _max_bytes = self._get_limits()
+        entry = self.sudo().search([
+            ('key', '=', key),
+            ('last_used', '>=', fields.Datetime.now() - max_age),
+        ], limit=1)
+        if entry.kind == 'report' and entry.report_id.state not in ('generated', 'archived'):
+            entry.unlink()
+            return self.browse()
+        if entry:
+            entry.write({'hit_count': entry.hit_count + 1, 'last_used': fields.Datetime.now()})
+        return entry
+
+    @api.model
+    def _store(self, key, kind, name, attachment=None, report=None):
+        """Registra um resultado; o anexo passa a pertencer ao cache"""
+        if not key:
+            return self.browse()
+        entry = self.sudo().create({
+            'key': key,
+            'kind': kind,
+            'name': name,
+            'attachment_id': attachment.id if attachment else False,
+            'report_id': report.id if report else False,
+            'size': attachment.file_size if attachment else 0,
+            'last_used': fields.Datetime.now(),
+        })
+        if attachment:
+            # Fora do assistente, o anexo não é removido pela limpeza das exportações
+            attachment.sudo().write({'res_model': self._name, 'res_id': entry.id})
+        self._evict()
+        return entry
+
+    @api.model
+    def _evict(self):
+        """Remove as entradas vencidas e, das restantes, as menos usadas além do limite de bytes
+
+        Entradas de relatórios persistentes não ocupam espaço próprio: apenas
+        deixam de ser reaproveitadas.
+        """
+        max_age, max_bytes = self._get_limits()
+        entries = self.sudo().search([])
+        limit_date = fields.Datetime.now() - max_age
+        expired = entries.filtered(lambda entry: not entry.last_used or entry.last_used < limit_date)
+        total_size = 0
+        for entry in entries - expired:
+            total_size += entry.size
+            if total_size > max_bytes:
+                expired |= entry
+        expired.unlink()
+
+    @api.model
+    def _invalidate_reports(self, reports):
+        """Descarta as entradas de relatórios cujas linhas foram apagadas ou alteradas"""
+        self.sudo().search([('report_id', 'in', reports.ids)]).unlink()
+
+    def unlink(self):
+        attachments = self.mapped('attachment_id')
+        result = super(CostReportCache, self).unlink()
+        attachments.unlink()
+        return result
+
+    @api.autovacuum
+    def _gc_cache(self):
+        self._evict()
+
+    def action_clear_cache(self):
+        """Esvazia o cache"""
+        self.sudo().search([]).unlink()
+        return True
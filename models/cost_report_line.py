@@ -1,32 +1,43 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
+from psycopg2.extras import execute_values
 
 
 class CostReportLine(models.Model):
     _name = 'cost.report.line'
     _description = 'Linha do Relatório de Custo'
-    _order = 'sequence, id'
+    _order = 'section_sequence, sequence, id'
     _rec_name = 'item_code'
 
     # Campos de identificação
     report_id = fields.Many2one('cost.report', string='Relatório', required=True, ondelete='cascade')
     sequence = fields.Integer(string='Sequência', default=10)
+    section_id = fields.Many2one('cost.report.section', string='Seção', readonly=True, index=True,
+                                 ondelete='cascade')
+    section_sequence = fields.Integer(string='Sequência da Seção', readonly=True)
+    parent_id = fields.Many2one('cost.report.line', string='Linha Superior', readonly=True, index=True,
+                                ondelete='cascade')
+    child_ids = fields.One2many('cost.report.line', 'parent_id', string='Linhas Filhas', readonly=True)
+    depth = fields.Integer(string='Profundidade', readonly=True)
     
     # Campos principais
     bom_main_code = fields.Char(string='Código LdM Principal', readonly=True)
     item_code = fields.Char(string='Código Item', readonly=True)
     
-    # Campos de hierarquia (Níveis 1-10)
-    level_1 = fields.Char(string='Nível 1', readonly=True)
-    level_2 = fields.Char(string='Nível 2', readonly=True)
-    level_3 = fields.Char(string='Nível 3', readonly=True)
-    level_4 = fields.Char(string='Nível 4', readonly=True)
-    level_5 = fields.Char(string='Nível 5', readonly=True)
-    level_6 = fields.Char(string='Nível 6', readonly=True)
-    level_7 = fields.Char(string='Nível 7', readonly=True)
-    level_8 = fields.Char(string='Nível 8', readonly=True)
-    level_9 = fields.Char(string='Nível 9', readonly=True)
-    level_10 = fields.Char(string='Nível 10', readonly=True)
+    # Campos de hierarquia: os níveis superiores ficam em cost.report.path e a
+    # linha guarda apenas o próprio nível; as colunas 1-10 são montadas na leitura
+    path_id = fields.Many2one('cost.report.path', string='Caminho', readonly=True, ondelete='cascade')
+    level_name = fields.Char(string='Nível do Item', readonly=True)
+    level_1 = fields.Char(string='Nível 1', compute='_compute_levels')
+    level_2 = fields.Char(string='Nível 2', compute='_compute_levels')
+    level_3 = fields.Char(string='Nível 3', compute='_compute_levels')
+    level_4 = fields.Char(string='Nível 4', compute='_compute_levels')
+    level_5 = fields.Char(string='Nível 5', compute='_compute_levels')
+    level_6 = fields.Char(string='Nível 6', compute='_compute_levels')
+    level_7 = fields.Char(string='Nível 7', compute='_compute_levels')
+    level_8 = fields.Char(string='Nível 8', compute='_compute_levels')
+    level_9 = fields.Char(string='Nível 9', compute='_compute_levels')
+    level_10 = fields.Char(string='Nível 10', compute='_compute_levels')
     
     # Campos de detalhes
     bom_reference = fields.Char(string='Ref. LdM Item', readonly=True)
@@ -49,9 +60,25 @@ class CostReportLine(models.Model):
     operation_cost = fields.Float(string='Custo da Operação', readonly=True)
     
     # Campos computados para formatação
-    unit_cost_formatted = fields.Char(string='Custo Unit. Formatado', compute='_compute_formatted_fields', store=True)
-    total_cost_formatted = fields.Char(string='Custo Total Formatado', compute='_compute_formatted_fields', store=True)
-    operation_cost_formatted = fields.Char(string='Custo Op. Formatado', compute='_compute_formatted_fields', store=True)
+    unit_cost_formatted = fields.Char(string='Custo Unit. Formatado', compute='_compute_formatted_fields')
+    total_cost_formatted = fields.Char(string='Custo Total Formatado', compute='_compute_formatted_fields')
+    operation_cost_formatted = fields.Char(string='Custo Op. Formatado', compute='_compute_formatted_fields')
+    
+    def init(self):
+        # Agregações de totais e filtros por tipo dentro do relatório
+        tools.create_index(self._cr, 'cost_report_line_report_id_line_type_index',
+                           self._table, ['report_id', 'line_type'])
+    
+    @api.depends('path_id', 'level_name')
+    def _compute_levels(self):
+        """Monta as colunas de nível a partir do caminho e do nível do item"""
+        columns_by_path = {}
+        for record in self:
+            columns = list(record.path_id._get_columns(columns_by_path)) if record.path_id else []
+            columns.append(record.level_name or '')
+            columns += [''] * (10 - len(columns))
+            for i in range(10):
+                record[f'level_{i+1}'] = columns[i]
     
     @api.depends('unit_cost', 'total_cost', 'operation_cost')
     def _compute_formatted_fields(self):
@@ -71,6 +98,95 @@ class CostReportLine(models.Model):
         except (ValueError, TypeError):
             return 'R$ 0,00'
     
+    @api.model
+    def _bulk_create(self, vals_list, path_cache=None, parent_stacks=None):
+        """Insere as linhas com um único INSERT de múltiplas linhas
+
+        Não passa pelo ORM: as colunas level_1..level_10 dos valores são
+        convertidas em caminho + nível do item, os ids são reservados para
+        ligar cada linha à sua BOM superior e os totais do relatório devem ser
+        recalculados pelo chamador ao final da carga. path_cache e
+        parent_stacks permitem continuar a carga em lotes seguintes.
+        """
+        if not vals_list:
+            return
+        if path_cache is None:
+            path_cache = {}
+        if parent_stacks is None:
+            parent_stacks = {}
+        columns = [
+            'report_id', 'section_id', 'section_sequence', 'sequence', 'bom_main_code', 'item_code',
+            'bom_reference', 'item_qty', 'uom_name', 'unit_cost', 'total_cost',
+            'purchase_taxes', 'line_type', 'operation_name', 'workcenter_name',
+            'operation_time', 'operation_cost',
+        ]
+        tree_columns = ['id', 'parent_id', 'depth', 'path_id', 'level_name']
+        log_columns = ['create_uid', 'create_date', 'write_uid', 'write_date']
+        level_keys = [f'level_{i}' for i in range(1, 11)]
+
+        self.env.cr.execute(
+            "SELECT nextval(%s) FROM generate_series(1, %s)", ('{}_id_seq'.format(self._table), len(vals_list))
+        )
+        line_ids = [line_id for line_id, in self.env.cr.fetchall()]
+
+        # Caminhos e linhas superiores por relatório e seção, na ordem das linhas
+        tree_values = [None] * len(vals_list)
+        indexes_by_scope = {}
+        for index, vals in enumerate(vals_list):
+            indexes_by_scope.setdefault((vals.get('report_id'), vals.get('section_id')), []).append(index)
+        path_model = self.env['cost.report.path']
+        for scope, indexes in indexes_by_scope.items():
+            report_id, section_id = scope
+            level_rows = [[vals_list[index].get(key) or '' for key in level_keys] for index in indexes]
+            # Além do último nível exibido, o item fica na última coluna, após " > "
+            max_levels = min(self.env['cost.report'].browse(report_id).max_display_levels, len(level_keys))
+            entries = []
+            item_columns = []
+            for index, levels in zip(indexes, level_rows):
+                depth = vals_list[index].get('depth')
+                if depth is None:
+                    # Sem a profundidade explícita, usa a quantidade de níveis preenchidos
+                    depth = max(len([level for level in levels if level]) - 1, 0)
+                    item_columns.append(None)
+                else:
+                    item_columns.append(min(depth, max_levels - 1))
+                entries.append((line_ids[index], vals_list[index].get('line_type'), depth))
+            scope_paths = path_model._intern_level_rows(
+                report_id, section_id, level_rows, path_cache.setdefault(scope, {}), item_columns
+            )
+            parent_ids = self._link_parent_lines(entries, parent_stacks.setdefault(scope, []))
+            for index, entry, parent_id, path in zip(indexes, entries, parent_ids, scope_paths):
+                tree_values[index] = (entry[0], parent_id, entry[2]) + tuple(path)
+
+        now = fields.Datetime.now()
+        rows = []
+        for vals, tree_row in zip(vals_list, tree_values):
+            row = [vals.get(column) for column in columns]
+            row += list(tree_row)
+            row += [self.env.uid, now, self.env.uid, now]
+            rows.append(tuple(row))
+
+        query = 'INSERT INTO "{}" ({}) VALUES %s'.format(
+            self._table, ', '.join('"{}"'.format(column) for column in columns + tree_columns + log_columns)
+        )
+        execute_values(self.env.cr, query, rows, page_size=len(rows))
+
+    @api.model
+    def _link_parent_lines(self, entries, stack):
+        """Retorna a linha superior de cada (id, tipo, profundidade), na ordem do relatório
+
+        As linhas chegam em pré-ordem; stack guarda as BOMs abertas como
+        (profundidade, id) e continua válida entre lotes.
+        """
+        parent_ids = []
+        for line_id, line_type, depth in entries:
+            while stack and stack[-1][0] >= depth:
+                stack.pop()
+            parent_ids.append(stack[-1][1] if stack else None)
+            if line_type in ('produto_principal', 'subconjunto'):
+                stack.append((depth, line_id))
+        return parent_ids
+
     def get_level_display(self):
         """Retorna o nível hierárquico para exibição"""
         levels = [self.level_1, self.level_2, self.level_3, self.level_4, self.level_5,
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, _
+from psycopg2.extras import execute_values
+
+
+class CostReportPath(models.Model):
+    _name = 'cost.report.path'
+    _description = 'Caminho Hierárquico do Relatório de Custo'
+    _order = 'report_id, id'
+    _log_access = False
+
+    report_id = fields.Many2one('cost.report', string='Relatório', required=True, ondelete='cascade', index=True)
+    section_id = fields.Many2one('cost.report.section', string='Seção', ondelete='cascade', index=True)
+    parent_id = fields.Many2one('cost.report.path', string='Nível Superior', ondelete='cascade')
+    name = fields.Char(string='Nível', readonly=True)
+    depth = fields.Integer(string='Profundidade', readonly=True)
+
+    def _get_columns(self, columns_by_path):
+        """Colunas de nível do caminho, da raiz até este nó
+
+        columns_by_path guarda os caminhos já montados e é compartilhado entre chamadas.
+        """
+        self.ensure_one()
+        pending = []
+        node = self
+        while node and node.id not in columns_by_path:
+            pending.append(node)
+            node = node.parent_id
+        columns = columns_by_path[node.id] if node else ()
+        for node in reversed(pending):
+            columns = columns + (node.name or '',)
+            columns_by_path[node.id] = columns
+        return columns
+
+    @api.model
+    def _intern_level_rows(self, report_id, section_id, level_rows, path_cache, item_columns=None):
+        """Converte as colunas de nível de cada linha em (path_id, level_name)
+
+        item_columns traz, por linha, o índice da coluna do próprio item, que
+        fica na linha; as colunas anteriores são gravadas uma única vez como
+        nós de caminho. Sem o índice (None), o item é o último nível
+        preenchido, o que não vale para itens sem nome. path_cache mapeia
+        tuplas de nomes para ids e deve ser reaproveitado entre lotes do
+        mesmo relatório e seção.
+        """
+        if item_columns is None:
+            item_columns = [None] * len(level_rows)
+        split_rows = []
+        new_prefixes = []
+        for columns, item_column in zip(level_rows, item_columns):
+            names = list(columns)
+            if item_column is None:
+                while names and not names[-1]:
+                    names.pop()
+                item_column = len(names) - 1
+            if 0 <= item_column < len(names):
+                prefix, level_name = tuple(names[:item_column]), names[item_column]
+            else:
+                prefix, level_name = tuple(names[:max(item_column, 0)]), ''
+            split_rows.append((prefix, level_name))
+            for depth in range(1, len(prefix) + 1):
+                sub_prefix = prefix[:depth]
+                if sub_prefix not in path_cache:
+                    path_cache[sub_prefix] = None
+                    new_prefixes.append(sub_prefix)
+
+        if new_prefixes:
+            # Reserva os ids de uma vez para gravar pais e filhos no mesmo INSERT
+            self.env.cr.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                ('{}_id_seq'.format(self._table), len(new_prefixes))
+            )
+            for prefix, (node_id,) in zip(new_prefixes, self.env.cr.fetchall()):
+                path_cache[prefix] = node_id
+            values = [
+                (path_cache[prefix], report_id, section_id or None,
+                 path_cache[prefix[:-1]] if len(prefix) > 1 else None, prefix[-1], len(prefix))
+                for prefix in new_prefixes
+            ]
+            execute_values(
+                self.env.cr,
+                'INSERT INTO "{}" (id, report_id, section_id, parent_id, name, depth) VALUES %s'.format(self._table),
+                values, page_size=len(values)
+            )
+
+        return [(path_cache[prefix] if prefix else None, level_name) for prefix, level_name in split_rows]
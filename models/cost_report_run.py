@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import base64
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+
+
+class CostReportRun(models.Model):
+    _name = 'cost.report.run'
+    _description = 'Execução do Relatório de Custo'
+    _order = 'started_at desc, id desc'
+    _rec_name = 'name'
+
+    name = fields.Char(string='Relatório', readonly=True)
+    report_id = fields.Many2one('cost.report', string='Relatório Persistente', ondelete='cascade', index=True,
+                                readonly=True)
+    run_type = fields.Selection([
+        ('generate', 'Geração'),
+        ('refresh', 'Atualização'),
+        ('job', 'Segundo Plano'),
+        ('export', 'Exportação CSV'),
+    ], string='Tipo', readonly=True)
+    user_id = fields.Many2one('res.users', string='Usuário', readonly=True, default=lambda self: self.env.user)
+    started_at = fields.Datetime(string='Início', readonly=True)
+    duration = fields.Float(string='Duração (s)', readonly=True, digits=(16, 3))
+
+    # Tempo próprio de cada fase, em segundos
+    resolution_time = fields.Float(string='Resolução das BOMs (s)', readonly=True, digits=(16, 3))
+    explosion_time = fields.Float(string='Explosão (s)', readonly=True, digits=(16, 3))
+    taxes_time = fields.Float(string='Busca de Taxas (s)', readonly=True, digits=(16, 3))
+    insertion_time = fields.Float(string='Gravação das Linhas (s)', readonly=True, digits=(16, 3))
+    aggregation_time = fields.Float(string='Totais (s)', readonly=True, digits=(16, 3))
+    serialization_time = fields.Float(string='Serialização (s)', readonly=True, digits=(16, 3))
+
+    query_count = fields.Integer(string='Consultas SQL', readonly=True)
+    bom_count = fields.Integer(string='BOMs Principais', readonly=True)
+    row_count = fields.Integer(string='Linhas', readonly=True)
+    peak_bom_rows = fields.Integer(string='Maior BOM (linhas)', readonly=True)
+    bom_timings = fields.Text(string='Tempo por BOM Principal', readonly=True)
+    slowest_subtrees = fields.Text(string='Sub-BOMs Mais Lentas', readonly=True)
+    profile_attachment_id = fields.Many2one('ir.attachment', string='Perfil (cProfile)', readonly=True,
+                                            groups='base.group_system')
+
+    @api.model
+    def _log_run(self, recorder, run_type, name, report=None):
+        """Grava as métricas coletadas pelo RunRecorder"""
+        recorder.finish()
+        boms_by_id = {bom.id: bom for bom, _seconds, _rows in recorder.bom_timings}
+        subtree_boms = self.env['mrp.bom'].browse([bom_id for _seconds, bom_id in recorder.slowest_subtrees()])
+        subtree_names = {bom.id: bom.display_name for bom in subtree_boms.exists()}
+        vals = {
+            'name': name,
+            'report_id': report.id if report else False,
+            'run_type': run_type,
+            'started_at': fields.Datetime.now() - timedelta(seconds=recorder.duration),
+            'duration': recorder.duration,
+            'query_count': recorder.query_count,
+            'bom_count': len(boms_by_id),
+            'row_count': recorder.row_count,
+            'peak_bom_rows': recorder.peak_bom_rows,
+            'bom_timings': '\n'.join(
+                '%.3f s  %6d linhas  %s' % (seconds, rows, bom.display_name)
+                for bom, seconds, rows in sorted(recorder.bom_timings, key=lambda timing: -timing[1])
+            ),
+            'slowest_subtrees': '\n'.join(
+                '%.3f s  %s' % (seconds, subtree_names.get(bom_id, bom_id))
+                for seconds, bom_id in recorder.slowest_subtrees()
+            ),
+        }
+        for phase in recorder.PHASES:
+            vals['%s_time' % phase] = recorder.phase_times.get(phase, 0.0)
+        run = self.sudo().create(vals)
+
+        profile_data = recorder.get_profile_data()
+        if profile_data:
+            run.profile_attachment_id = self.env['ir.attachment'].sudo().create({
+                'name': 'cost_report_run_%s.prof' % run.id,
+                'type': 'binary',
+                'mimetype': 'application/octet-stream',
+                'datas': base64.b64encode(profile_data),
+                'res_model': self._name,
+                'res_id': run.id,
+            })
+        return run
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, _
+
+
+class CostReportSection(models.Model):
+    _name = 'cost.report.section'
+    _description = 'Seção do Relatório de Custo por BOM Principal'
+    _order = 'report_id, sequence, id'
+    _rec_name = 'bom_id'
+
+    report_id = fields.Many2one('cost.report', string='Relatório', required=True, ondelete='cascade', index=True)
+    bom_id = fields.Many2one('mrp.bom', string='BOM Principal', required=True, ondelete='cascade')
+    sequence = fields.Integer(string='Sequência', readonly=True)
+    fingerprint = fields.Char(string='Impressão Digital', readonly=True,
+                              help='Hash das datas de alteração e dos custos da estrutura usada na geração')
+    line_count = fields.Integer(string='Linhas', readonly=True)
+    line_ids = fields.One2many('cost.report.line', 'section_id', string='Linhas da Seção')
+
+    def _delete_with_lines(self):
+        """Remove as seções e suas linhas diretamente no banco"""
+        if not self.ids:
+            return
+        self.flush()
+        self.env.cr.execute("DELETE FROM cost_report_line WHERE section_id IN %s", (tuple(self.ids),))
+        self.env.cr.execute("DELETE FROM cost_report_path WHERE section_id IN %s", (tuple(self.ids),))
+        self.env.cr.execute("DELETE FROM cost_report_section WHERE id IN %s", (tuple(self.ids),))
+        self.env['cost.report.line'].invalidate_cache()
+        self.env['cost.report.path'].invalidate_cache()
+        self.invalidate_cache()
+        self.report_id.invalidate_cache(['line_ids', 'section_ids'])
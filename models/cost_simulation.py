@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+from psycopg2.extras import execute_values
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+from ..tools.cost_matrix import BomCostMatrix
+
+
+class CostSimulation(models.Model):
+    _name = 'cost.simulation'
+    _description = 'Simulação de Custos (E se...)'
+    _order = 'create_date desc'
+
+    name = fields.Char(string='Nome da Simulação', required=True, default='Simulação de Custos')
+    company_id = fields.Many2one('res.company', string='Empresa', default=lambda self: self.env.company)
+    bom_ids = fields.Many2many('mrp.bom', 'cost_simulation_bom_rel', 'simulation_id', 'bom_id',
+                               string='BOMs Analisados',
+                               help='Deixe vazio para simular todas as BOMs da empresa; nesse caso '
+                                    'apenas as BOMs afetadas pelos cenários aparecem no resultado.')
+    include_operations = fields.Boolean(string='Inclui Operações', default=True)
+    scenario_ids = fields.One2many('cost.simulation.scenario', 'simulation_id', string='Cenários', copy=True)
+    result_ids = fields.One2many('cost.simulation.result', 'simulation_id', string='Resultados', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Rascunho'),
+        ('done', 'Simulado'),
+    ], string='Status', default='draft', copy=False)
+    simulated_at = fields.Datetime(string='Simulado em', readonly=True, copy=False)
+
+    def _get_simulation_boms(self):
+        """BOMs analisadas: as selecionadas ou todas as da empresa"""
+        self.ensure_one()
+        if self.bom_ids:
+            return self.bom_ids
+        return self.env['mrp.bom'].search([('company_id', 'in', [False, self.company_id.id])])
+
+    def action_run_simulation(self):
+        """Calcula todos os cenários em uma única passada sobre a estrutura"""
+        self.ensure_one()
+        if not self.scenario_ids:
+            raise UserError(_('Adicione pelo menos um cenário para simular.'))
+
+        boms = self._get_simulation_boms()
+        matrix = BomCostMatrix(self.env, include_operations=self.include_operations).load(boms)
+        # O primeiro cenário é o custo atual, usado como base das variações
+        scenario_costs = matrix.solve_scenarios(
+            [{}] + [scenario._get_price_overrides(matrix) for scenario in self.scenario_ids]
+        )
+        base_costs = scenario_costs[0]
+
+        result_vals = []
+        for bom in boms:
+            base_cost = base_costs[bom.id]
+            bom_vals = []
+            for scenario, costs in zip(self.scenario_ids, scenario_costs[1:]):
+                delta = costs[bom.id] - base_cost
+                bom_vals.append({
+                    'simulation_id': self.id,
+                    'scenario_id': scenario.id,
+                    'bom_id': bom.id,
+                    'base_cost': base_cost,
+                    'simulated_cost': costs[bom.id],
+                    'delta': delta,
+                    'delta_percent': 100.0 * delta / base_cost if base_cost else 0.0,
+                })
+            if self.bom_ids or any(abs(vals['delta']) > 1e-9 for vals in bom_vals):
+                result_vals.extend(bom_vals)
+
+        self._delete_results()
+        self.env['cost.simulation.result']._bulk_create(result_vals)
+        self.write({'state': 'done', 'simulated_at': fields.Datetime.now()})
+        return True
+
+    def _delete_results(self):
+        """Remove os resultados anteriores diretamente no banco"""
+        if not self.ids:
+            return
+        self.env.cr.execute("DELETE FROM cost_simulation_result WHERE simulation_id IN %s", (tuple(self.ids),))
+        self.env['cost.simulation.result'].invalidate_cache()
+        self.invalidate_cache(['result_ids'], self.ids)
+
+    def action_draft(self):
+        """Volta para rascunho descartando os resultados"""
+        self._delete_results()
+        self.write({'state': 'draft', 'simulated_at': False})
+
+    def action_view_results(self):
+        """Abre a análise dos resultados da simulação"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Resultados: %s') % self.name,
+            'res_model': 'cost.simulation.result',
+            'view_mode': 'tree,pivot',
+            'domain': [('simulation_id', '=', self.id)],
+            'context': {'search_default_group_scenario': 1},
+        }
+
+
+class CostSimulationScenario(models.Model):
+    _name = 'cost.simulation.scenario'
+    _description = 'Cenário de Simulação de Custos'
+    _order = 'simulation_id, sequence, id'
+
+    simulation_id = fields.Many2one('cost.simulation', string='Simulação', required=True, ondelete='cascade',
+                                    index=True)
+    sequence = fields.Integer(string='Sequência', default=10)
+    name = fields.Char(string='Cenário', required=True)
+    override_ids = fields.One2many('cost.simulation.override', 'scenario_id', string='Alterações', copy=True)
+
+    def _get_price_overrides(self, matrix):
+        """Traduz as alterações do cenário em custos substitutos para a matriz
+
+        Alterações por produto prevalecem sobre as da categoria; entre
+        categorias, vale a mais específica.
+        """
+        self.ensure_one()
+        product_prices = {}
+        workcenter_rates = {}
+        overrides_by_target = defaultdict(lambda: self.env['cost.simulation.override'])
+        for override in self.override_ids:
+            overrides_by_target[override.target] |= override
+
+        category_overrides = overrides_by_target['category'].filtered('categ_id').sorted(
+            lambda override: len(override.categ_id.parent_path or ''))
+        if category_overrides:
+            products = self.env['product.product'].browse(sorted(matrix.product_prices))
+            for override in category_overrides:
+                category_path = override.categ_id.parent_path or ''
+                for product in products:
+                    if (product.categ_id.parent_path or '').startswith(category_path):
+                        product_prices[product.id] = override._apply(matrix.product_prices[product.id])
+
+        for override in overrides_by_target['product'].filtered('product_id'):
+            if override.product_id.id in matrix.product_prices:
+                product_prices[override.product_id.id] = override._apply(
+                    matrix.product_prices[override.product_id.id])
+
+        for override in overrides_by_target['workcenter'].filtered('workcenter_id'):
+            if override.workcenter_id.id in matrix.workcenter_rates:
+                workcenter_rates[override.workcenter_id.id] = override._apply(
+                    matrix.workcenter_rates[override.workcenter_id.id])
+
+        return {'product_prices': product_prices, 'workcenter_rates': workcenter_rates}
+
+
+class CostSimulationOverride(models.Model):
+    _name = 'cost.simulation.override'
+    _description = 'Alteração de Custo do Cenário'
+
+    scenario_id = fields.Many2one('cost.simulation.scenario', string='Cenário', required=True, ondelete='cascade',
+                                  index=True)
+    target = fields.Selection([
+        ('product', 'Produto'),
+        ('category', 'Categoria de Produto'),
+        ('workcenter', 'Centro de Trabalho'),
+    ], string='Aplicar a', required=True, default='product')
+    product_id = fields.Many2one('product.product', string='Produto',
+                                 help='Somente matérias-primas: o custo de produtos fabricados vem da própria BOM.')
+    categ_id = fields.Many2one('product.category', string='Categoria')
+    workcenter_id = fields.Many2one('mrp.workcenter', string='Centro de Trabalho')
+    mode = fields.Selection([
+        ('percent', 'Variação (%)'),
+        ('value', 'Novo Valor'),
+    ], string='Tipo de Alteração', required=True, default='percent')
+    value = fields.Float(string='Valor', help='Percentual de variação ou novo custo (custo/hora para centros de trabalho)')
+
+    def _apply(self, current_value):
+        """Valor simulado a partir do custo atual"""
+        self.ensure_one()
+        if self.mode == 'percent':
+            return current_value * (1.0 + self.value / 100.0)
+        return self.value
+
+
+class CostSimulationResult(models.Model):
+    _name = 'cost.simulation.result'
+    _description = 'Resultado da Simulação de Custos'
+    _order = 'simulation_id, scenario_id, bom_id'
+
+    simulation_id = fields.Many2one('cost.simulation', string='Simulação', required=True, ondelete='cascade',
+                                    index=True)
+    scenario_id = fields.Many2one('cost.simulation.scenario', string='Cenário', ondelete='cascade')
+    bom_id = fields.Many2one('mrp.bom', string='BOM', ondelete='cascade')
+    product_tmpl_id = fields.Many2one(related='bom_id.product_tmpl_id', string='Produto')
+    base_cost = fields.Float(string='Custo Atual', readonly=True, group_operator='sum')
+    simulated_cost = fields.Float(string='Custo Simulado', readonly=True, group_operator='sum')
+    delta = fields.Float(string='Variação', readonly=True, group_operator='sum')
+    delta_percent = fields.Float(string='Variação (%)', readonly=True, group_operator='avg')
+
+    @api.model
+    def _bulk_create(self, vals_list):
+        """Insere os resultados com INSERTs de múltiplas linhas, sem passar pelo ORM"""
+        if not vals_list:
+            return
+        columns = ['simulation_id', 'scenario_id', 'bom_id', 'base_cost', 'simulated_cost', 'delta', 'delta_percent']
+        log_columns = ['create_uid', 'create_date', 'write_uid', 'write_date']
+        now = fields.Datetime.now()
+        rows = [
+            tuple(vals.get(column) for column in columns) + (self.env.uid, now, self.env.uid, now)
+            for vals in vals_list
+        ]
+        query = 'INSERT INTO "{}" ({}) VALUES %s'.format(
+            self._table, ', '.join('"{}"'.format(column) for column in columns + log_columns)
+        )
+        execute_values(self.env.cr, query, rows, page_size=1000)
@@ -1,6 +1,16 @@
+import logging
+from collections import defaultdict
+
+from psycopg2.extras import execute_values
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
+_logger = logging.getLogger(__name__)
+
+# Campos das linhas que alteram o custo da BOM
+LINE_COST_FIELDS = {'bom_id', 'product_id', 'product_qty', 'product_uom_id'}
+
 
 class CustomBOM(models.Model):
     _name = 'custom.bom'
@@ -24,12 +34,183 @@ class CustomBOM(models.Model):
         ('confirmed', 'Confirmado'),
         ('done', 'Concluído')
     ], string='Status', default='draft', tracking=True)
+    # Mantido por _recompute_costs a cada alteração de linhas, BOMs ou custos dos produtos
+    cost = fields.Float(string='Custo Consolidado', readonly=True, copy=False, index=True,
+                        digits='Product Price',
+                        help='Custo de uma unidade do produto: matérias-primas pelo custo padrão e '
+                             'componentes fabricados pelo custo consolidado do seu próprio BOM.')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        pending = [vals for vals in vals_list if vals.get('code', _('New')) == _('New')]
+        for vals, code in zip(pending, self._reserve_codes(len(pending))):
+            vals['code'] = code
+        boms = super(CustomBOM, self).create(vals_list)
+        boms._update_component_lines(boms.product_id)
+        return boms
 
     @api.model
-    def create(self, vals):
-        if vals.get('code', _('New')) == _('New'):
-            vals['code'] = self.env['ir.sequence'].next_by_code('custom.bom') or _('New')
-        return super(CustomBOM, self).create(vals)
+    def _reserve_codes(self, count):
+        """Reserva `count` códigos da sequência em um único acesso ao banco
+
+        Sequências sem lacunas ou por intervalo de datas são consumidas uma a uma.
+        """
+        if not count:
+            return []
+        sequence = self.env['ir.sequence'].sudo().search([
+            ('code', '=', 'custom.bom'),
+            ('company_id', 'in', [self.env.company.id, False]),
+        ], order='company_id', limit=1)
+        if not sequence:
+            return [_('New')] * count
+        if sequence.implementation != 'standard' or sequence.use_date_range:
+            return [sequence._next() for _i in range(count)]
+        self.env.cr.execute("SELECT nextval(%s) FROM generate_series(1, %s)",
+                            ('ir_sequence_%03d' % sequence.id, count))
+        return [sequence.get_next_char(number) for number, in self.env.cr.fetchall()]
+
+    def write(self, vals):
+        products = self.product_id
+        result = super(CustomBOM, self).write(vals)
+        if {'product_id', 'company_id', 'active'} & set(vals):
+            # Linhas que usam estes produtos podem passar a apontar para outro BOM
+            self._update_component_lines(products | self.product_id)
+        if 'company_id' in vals:
+            self._recompute_costs()
+        return result
+
+    def unlink(self):
+        products = self.product_id
+        result = super(CustomBOM, self).unlink()
+        # O banco anulou sub_bom_id das linhas que apontavam para estes BOMs
+        self.env['custom.bom.line'].invalidate_cache(['sub_bom_id'])
+        self._update_component_lines(products)
+        return result
+
+    @api.model
+    def _update_component_lines(self, products):
+        """Revincula as linhas que usam os produtos informados e recalcula seus BOMs"""
+        if not products:
+            return
+        lines = self.env['custom.bom.line'].search([('product_id', 'in', products.ids)])
+        lines._resolve_sub_boms()
+        lines.bom_id._recompute_costs()
+
+    def _get_dependent_bom_ids(self):
+        """Estes BOMs e todos os que os usam, direta ou indiretamente (índice por sub_bom_id)"""
+        if not self.ids:
+            return []
+        self.env['custom.bom.line'].flush(['bom_id', 'sub_bom_id'])
+        self.env.cr.execute("""
+            WITH RECURSIVE dependents(id) AS (
+                SELECT unnest(%s::int[])
+                 UNION
+                SELECT line.bom_id
+                  FROM custom_bom_line line
+                  JOIN dependents ON line.sub_bom_id = dependents.id
+            )
+            SELECT id FROM dependents
+        """, (list(self.ids),))
+        return [bom_id for bom_id, in self.env.cr.fetchall()]
+
+    def _recompute_costs(self):
+        """Recalcula o custo destes BOMs e dos que dependem deles, de baixo para cima
+
+        Somente os BOMs afetados são percorridos; os sub-BOMs fora desse
+        conjunto contribuem com o custo já gravado. Em estruturas cíclicas o
+        componente que fecha o ciclo entra pelo custo padrão do produto.
+        Adiado com skip_bom_cost_recompute: quem grava em lote recalcula ao final.
+        """
+        if self.env.context.get('skip_bom_cost_recompute'):
+            return
+        bom_ids = self.exists()._get_dependent_bom_ids()
+        if not bom_ids:
+            return
+        boms = self.with_context(active_test=False).browse(bom_ids)
+        lines_by_bom = {bom.id: [] for bom in boms}
+        for line in self.env['custom.bom.line'].search([('bom_id', 'in', bom_ids)]):
+            lines_by_bom[line.bom_id.id].append(line)
+
+        # Custo padrão por empresa, lido em lote
+        standard_prices = {}
+        products_by_company = {}
+        for bom in boms:
+            company = bom.company_id or self.env.company
+            for line in lines_by_bom[bom.id]:
+                products_by_company.setdefault(company, set()).add(line.product_id.id)
+        for company, product_ids in products_by_company.items():
+            for product in self.env['product.product'].with_company(company).browse(sorted(product_ids)):
+                standard_prices[company.id, product.id] = product.standard_price
+
+        affected = set(lines_by_bom)
+        costs = {}
+        line_values = []
+        for root in boms:
+            if root.id in costs:
+                continue
+            # Pós-ordem iterativa: o BOM só é calculado depois dos sub-BOMs afetados
+            stack = [root]
+            on_stack = {root.id}
+            while stack:
+                bom = stack[-1]
+                child = next((line.sub_bom_id for line in lines_by_bom[bom.id]
+                              if line.sub_bom_id.id in affected and line.sub_bom_id.id not in costs
+                              and line.sub_bom_id.id not in on_stack), None)
+                if child:
+                    stack.append(child)
+                    on_stack.add(child.id)
+                    continue
+                stack.pop()
+                on_stack.discard(bom.id)
+                costs[bom.id] = self._compute_bom_cost(bom, lines_by_bom[bom.id], affected, costs,
+                                                       standard_prices, line_values)
+
+        self._write_costs(costs, line_values)
+
+    def _compute_bom_cost(self, bom, lines, affected, costs, standard_prices, line_values):
+        """Custo do BOM a partir das linhas; acrescenta (linha, custo unitário, custo total) a line_values"""
+        company = bom.company_id or self.env.company
+        total = 0.0
+        for line in lines:
+            sub_bom = line.sub_bom_id
+            if sub_bom and sub_bom.id in costs:
+                unit_cost = costs[sub_bom.id]
+            elif sub_bom and sub_bom.id not in affected:
+                unit_cost = sub_bom.cost
+            else:
+                if sub_bom:
+                    _logger.warning("BOM %s: estrutura cíclica em %s; usando o custo padrão", bom.code,
+                                    sub_bom.code)
+                unit_cost = standard_prices.get((company.id, line.product_id.id), 0.0)
+            qty = line.product_qty
+            product_uom = line.product_id.uom_id
+            if line.product_uom_id and product_uom and line.product_uom_id != product_uom:
+                qty = line.product_uom_id._compute_quantity(qty, product_uom, round=False)
+            extended_cost = qty * unit_cost
+            line_values.append((line.id, unit_cost, extended_cost))
+            total += extended_cost
+        return total
+
+    def _write_costs(self, costs, line_values):
+        """Grava os custos calculados diretamente no banco, sem alterar write_date"""
+        cr = self.env.cr
+        if line_values:
+            execute_values(cr, """
+                UPDATE custom_bom_line AS line
+                   SET unit_cost = data.unit_cost, extended_cost = data.extended_cost
+                  FROM (VALUES %s) AS data (id, unit_cost, extended_cost)
+                 WHERE line.id = data.id
+            """, line_values, page_size=1000)
+            self.env['custom.bom.line'].invalidate_cache(['unit_cost', 'extended_cost'],
+                                                        [line_id for line_id, _unit, _total in line_values])
+        if costs:
+            execute_values(cr, """
+                UPDATE custom_bom AS bom
+                   SET cost = data.cost
+                  FROM (VALUES %s) AS data (id, cost)
+                 WHERE bom.id = data.id
+            """, list(costs.items()), page_size=1000)
+            self.invalidate_cache(['cost'], list(costs))
 
     def action_confirm(self):
         self.write({'state': 'confirmed'})
@@ -46,16 +227,80 @@ class CustomBOMLine(models.Model):
     _description = 'Custom BOM Line'
     _order = 'sequence, id'
 
-    bom_id = fields.Many2one('custom.bom', string='BOM', required=True, ondelete='cascade')
-    product_id = fields.Many2one('product.product', string='Produto', required=True)
+    bom_id = fields.Many2one('custom.bom', string='BOM', required=True, ondelete='cascade', index=True)
+    product_id = fields.Many2one('product.product', string='Produto', required=True, index=True)
     product_tmpl_id = fields.Many2one('product.template', string='Modelo do Produto', 
                                       related='product_id.product_tmpl_id', store=True)
     product_qty = fields.Float(string='Quantidade', required=True, default=1.0)
     product_uom_id = fields.Many2one('uom.uom', string='Unidade de Medida', required=True)
     sequence = fields.Integer(string='Sequência', default=10)
     notes = fields.Text(string='Observações')
+    # Índice de dependências do custo: BOM que fabrica o produto da linha
+    sub_bom_id = fields.Many2one('custom.bom', string='Sub-BOM', readonly=True, copy=False, index=True,
+                                 ondelete='set null')
+    unit_cost = fields.Float(string='Custo Unitário', readonly=True, copy=False, digits='Product Price')
+    extended_cost = fields.Float(string='Custo Total', readonly=True, copy=False, digits='Product Price')
 
     @api.onchange('product_id')
     def _onchange_product_id(self):
         if self.product_id:
             self.product_uom_id = self.product_id.uom_id.id
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super(CustomBOMLine, self).create(vals_list)
+        lines._resolve_sub_boms()
+        lines.bom_id._recompute_costs()
+        return lines
+
+    def write(self, vals):
+        boms = self.bom_id
+        result = super(CustomBOMLine, self).write(vals)
+        if {'bom_id', 'product_id'} & set(vals):
+            self._resolve_sub_boms()
+        if LINE_COST_FIELDS & set(vals):
+            (boms | self.bom_id)._recompute_costs()
+        return result
+
+    def unlink(self):
+        boms = self.bom_id
+        result = super(CustomBOMLine, self).unlink()
+        boms._recompute_costs()
+        return result
+
+    def _resolve_sub_boms(self):
+        """Vincula cada linha ao BOM ativo do seu produto, preferindo o da mesma empresa"""
+        if not self:
+            return
+        candidates = self.env['custom.bom'].search([('product_id', 'in', self.product_id.ids)],
+                                                   order='company_id, id')
+        # produto -> [(empresa, BOM)], agrupados uma única vez para todas as linhas
+        candidates_by_product = defaultdict(list)
+        for bom in candidates:
+            candidates_by_product[bom.product_id.id].append((bom.company_id.id, bom))
+        values = []
+        for line in self:
+            company_id = line.bom_id.company_id.id
+            sub_boms = [
+                (bom_company_id, bom) for bom_company_id, bom in candidates_by_product.get(line.product_id.id, ())
+                if bom != line.bom_id and (not bom_company_id or not company_id or bom_company_id == company_id)
+            ]
+            # O BOM da mesma empresa tem prioridade sobre o compartilhado
+            preferred = next((bom for bom_company_id, bom in sub_boms if bom_company_id == company_id),
+                             sub_boms[0][1] if sub_boms else self.env['custom.bom'])
+            if preferred != line.sub_bom_id:
+                values.append((line.id, preferred.id or None))
+        if values:
+            execute_values(self.env.cr, """
+                UPDATE custom_bom_line AS line
+                   SET sub_bom_id = data.sub_bom_id
+                  FROM (VALUES %s) AS data (id, sub_bom_id)
+                 WHERE line.id = data.id
+            """, values, template='(%s, %s::int)', page_size=1000)
+            self.invalidate_cache(['sub_bom_id'], [line_id for line_id, _sub in values])
+
+    @api.model
+    def _recompute_for_products(self, products):
+        """Recalcula apenas os BOMs que usam os produtos informados"""
+        if products:
+            self.search([('product_id', 'in', products.ids)]).bom_id._recompute_costs()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, _
+
+# Campos da BOM que mudam qual BOM é encontrada para um produto
+BOM_RESOLUTION_FIELDS = {'product_id', 'product_tmpl_id', 'type', 'company_id', 'active', 'sequence'}
+# Campos das linhas que mudam a explosão
+BOM_LINE_CLOSURE_FIELDS = {'bom_id', 'product_id', 'product_qty'}
+
+
+class MrpBom(models.Model):
+    _inherit = 'mrp.bom'
+
+    raw_material_cost = fields.Float(
+        string='Custo das Matérias-primas', compute='_compute_raw_material_cost', digits='Product Price',
+        help='Custo padrão das matérias-primas de toda a estrutura, por lote da BOM, somado a partir da '
+             'estrutura explodida. Não inclui operações.')
+
+    def _compute_raw_material_cost(self):
+        closure_model = self.env['mrp.bom.closure']
+        for bom in self:
+            flat_components = closure_model._get_flat_components(bom._origin) if bom._origin else {}
+            products = self.env['product.product'].browse(list(flat_components))
+            bom.raw_material_cost = sum(product.standard_price * flat_components[product.id]
+                                        for product in products)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        # As linhas criadas junto com a BOM entram na reconstrução abaixo
+        boms = super(MrpBom, self.with_context(skip_bom_closure=True)).create(vals_list).with_env(self.env)
+        # Linhas que usavam estes produtos como matéria-prima passam a ter sub-BOM
+        closure_model = self.env['mrp.bom.closure']
+        closure_model._rebuild(boms._get_closure_roots() | set(boms.ids))
+        return boms
+
+    def write(self, vals):
+        if not BOM_RESOLUTION_FIELDS & set(vals):
+            return super(MrpBom, self).write(vals)
+        roots = self._get_closure_roots()
+        result = super(MrpBom, self.with_context(skip_bom_closure=True)).write(vals)
+        self.env['mrp.bom.closure']._rebuild(roots | self._get_closure_roots() | set(self.ids))
+        return result
+
+    def unlink(self):
+        roots = self._get_closure_roots() - set(self.ids)
+        result = super(MrpBom, self).unlink()
+        self.env['mrp.bom.closure']._rebuild(roots)
+        return result
+
+    def _get_closure_roots(self):
+        """BOMs raiz afetadas por estas BOMs: as que passam por elas ou usam seus produtos"""
+        return self.env['mrp.bom.closure']._get_roots_containing(
+            boms=self, products=self.product_id, templates=self.product_tmpl_id)
+
+    def action_view_closure(self):
+        """Matérias-primas de toda a estrutura com as quantidades acumuladas"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Estrutura Explodida'),
+            'res_model': 'mrp.bom.closure',
+            'view_mode': 'tree,pivot',
+            'domain': [('root_bom_id', '=', self.id)],
+            'context': {'search_default_components': 1},
+        }
+
+
+class MrpBomLine(models.Model):
+    _inherit = 'mrp.bom.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super(MrpBomLine, self).create(vals_list)
+        lines._rebuild_closure(lines.bom_id)
+        return lines
+
+    def write(self, vals):
+        if not BOM_LINE_CLOSURE_FIELDS & set(vals):
+            return super(MrpBomLine, self).write(vals)
+        boms = self.bom_id
+        result = super(MrpBomLine, self).write(vals)
+        self._rebuild_closure(boms | self.bom_id)
+        return result
+
+    def unlink(self):
+        boms = self.bom_id
+        result = super(MrpBomLine, self).unlink()
+        self._rebuild_closure(boms.exists())
+        return result
+
+    @api.model
+    def _rebuild_closure(self, boms):
+        """Recalcula somente as BOMs raiz que passam pelas BOMs alteradas
+
+        Ignorado quando a própria BOM já reconstrói a estrutura (skip_bom_closure).
+        """
+        if boms and not self.env.context.get('skip_bom_closure'):
+            closure_model = self.env['mrp.bom.closure']
+            closure_model._rebuild(closure_model._get_roots_containing(boms=boms) | set(boms.ids))
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import defaultdict
+
+from psycopg2.extras import execute_values
+
+from odoo import models, fields, api
+
+from ..tools.bom_graph import BomGraph
+
+_logger = logging.getLogger(__name__)
+
+
+class MrpBomClosure(models.Model):
+    """Explosão materializada: para cada BOM, todos os descendentes com quantidade acumulada
+
+    Uma linha por (BOM raiz, sub-BOM, produto, profundidade); a linha de
+    profundidade 0 é a própria BOM. As quantidades são por lote da BOM raiz,
+    multiplicando as quantidades das linhas ao longo do caminho, como na
+    explosão do relatório de custo. Caminhos diferentes até o mesmo item na
+    mesma profundidade são somados.
+    """
+    _name = 'mrp.bom.closure'
+    _description = 'Estrutura Explodida das BOMs'
+    _order = 'root_bom_id, depth, id'
+    _log_access = False
+
+    root_bom_id = fields.Many2one('mrp.bom', string='BOM Raiz', required=True, readonly=True, index=True,
+                                  ondelete='cascade')
+    bom_id = fields.Many2one('mrp.bom', string='Sub-BOM', readonly=True, index=True, ondelete='cascade',
+                             help='BOM do item quando ele é fabricado; vazio para matérias-primas')
+    product_id = fields.Many2one('product.product', string='Produto', readonly=True, index=True,
+                                 ondelete='cascade')
+    product_tmpl_id = fields.Many2one('product.template', string='Modelo do Produto', readonly=True, index=True,
+                                      ondelete='cascade')
+    depth = fields.Integer(string='Nível', readonly=True)
+    quantity = fields.Float(string='Quantidade Acumulada', readonly=True, digits='Product Unit of Measure')
+    is_component = fields.Boolean(string='Matéria-prima', readonly=True)
+
+    def init(self):
+        # Consolidação por BOM raiz e consulta "onde é usado" por produto
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS mrp_bom_closure_root_component_idx
+                ON mrp_bom_closure (root_bom_id, product_id) WHERE is_component
+        """)
+
+    @api.model
+    def _get_roots_containing(self, boms=None, products=None, templates=None):
+        """Ids das BOMs raiz cuja explosão passa pelas BOMs, produtos ou modelos informados"""
+        clauses = []
+        params = []
+        for column, records in (('bom_id', boms), ('product_id', products), ('product_tmpl_id', templates)):
+            if records:
+                clauses.append('%s IN %%s' % column)
+                params.append(tuple(records.ids))
+        if not clauses:
+            return set()
+        self.env.cr.execute("SELECT DISTINCT root_bom_id FROM mrp_bom_closure WHERE %s" % ' OR '.join(clauses),
+                            params)
+        return {root_id for root_id, in self.env.cr.fetchall()}
+
+    @api.model
+    def _rebuild(self, root_ids):
+        """Recalcula a explosão das BOMs raiz informadas, reaproveitando as sub-BOMs comuns"""
+        root_ids = tuple(sorted(set(root_ids)))
+        if not root_ids:
+            return
+        self.flush()
+        cr = self.env.cr
+        cr.execute("DELETE FROM mrp_bom_closure WHERE root_bom_id IN %s", (root_ids,))
+        # Somente BOMs ativas, como o _bom_find
+        roots = self.env['mrp.bom'].sudo().search([('id', 'in', root_ids)])
+        graph = BomGraph(roots.env).load(roots)
+        memo = {}
+        values = []
+        for root in roots:
+            for (bom_id, product_id, template_id, depth), quantity in self._explode(root, graph, memo).items():
+                values.append((root.id, bom_id or None, product_id or None, template_id or None, depth, quantity,
+                               not bom_id))
+        if values:
+            execute_values(cr, """
+                INSERT INTO mrp_bom_closure
+                       (root_bom_id, bom_id, product_id, product_tmpl_id, depth, quantity, is_component)
+                VALUES %s
+            """, values, page_size=1000)
+        self.invalidate_cache()
+
+    @api.model
+    def _rebuild_all(self):
+        """Reconstrói a explosão de todas as BOMs ativas"""
+        self._rebuild(self.env['mrp.bom'].sudo().search([]).ids)
+
+    @api.model
+    def _explode(self, root, graph, memo):
+        """{(sub-BOM, produto, modelo, profundidade): quantidade} de um lote da BOM
+
+        Pós-ordem com pilha explícita; memo guarda a explosão de cada sub-BOM
+        já calculada. Um componente que fecha um ciclo entra como matéria-prima.
+        """
+        stack = [root]
+        on_stack = {root.id}
+        while stack:
+            bom = stack[-1]
+            children = []
+            pending = None
+            for line in bom.bom_line_ids:
+                if not line.product_id:
+                    continue
+                sub_bom = graph.find(line.product_id, company_id=bom.company_id.id, bom_type=bom.type)
+                if sub_bom and sub_bom.id not in memo and sub_bom.id not in on_stack:
+                    pending = sub_bom
+                    break
+                children.append((line, sub_bom))
+            if pending is not None:
+                stack.append(pending)
+                on_stack.add(pending.id)
+                continue
+
+            rows = defaultdict(float)
+            rows[bom.id, bom.product_id.id, bom.product_tmpl_id.id, 0] = 1.0
+            for line, sub_bom in children:
+                if sub_bom and sub_bom.id in memo:
+                    for (bom_id, product_id, template_id, depth), quantity in memo[sub_bom.id].items():
+                        rows[bom_id, product_id, template_id, depth + 1] += line.product_qty * quantity
+                    continue
+                if sub_bom:
+                    _logger.warning("Estrutura cíclica na BOM %s: %s tratado como matéria-prima",
+                                    bom.display_name, line.product_id.display_name)
+                rows[False, line.product_id.id, line.product_id.product_tmpl_id.id, 1] += line.product_qty
+            memo[bom.id] = rows
+            stack.pop()
+            on_stack.discard(bom.id)
+        return memo[root.id]
+
+    @api.model
+    def _get_flat_components(self, bom):
+        """{produto: quantidade total} das matérias-primas de um lote da BOM, em uma consulta"""
+        self.env.cr.execute("""
+            SELECT product_id, SUM(quantity) FROM mrp_bom_closure
+             WHERE root_bom_id = %s AND is_component
+             GROUP BY product_id
+        """, (bom.id,))
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _get_where_used(self, products):
+        """Ids das BOMs que usam os produtos em qualquer nível da estrutura"""
+        if not products:
+            return []
+        self.env.cr.execute("""
+            SELECT DISTINCT root_bom_id FROM mrp_bom_closure
+             WHERE product_id IN %s AND depth > 0
+        """, (tuple(products.ids),))
+        return [root_id for root_id, in self.env.cr.fetchall()]
+
+    def action_rebuild_all(self):
+        """Reconstrói a estrutura explodida de todas as BOMs"""
+        self._rebuild_all()
+        return True
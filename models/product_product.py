@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from odoo import models, _
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    def write(self, vals):
+        result = super(ProductProduct, self).write(vals)
+        if 'standard_price' in vals:
+            # Só os BOMs que usam estes produtos (e os que dependem deles) são recalculados
+            self.env['custom.bom.line'].sudo()._recompute_for_products(self)
+        return result
+
+    def action_view_where_used(self):
+        """BOMs que usam o produto em qualquer nível, pela estrutura explodida"""
+        self.ensure_one()
+        bom_ids = self.env['mrp.bom.closure']._get_where_used(self)
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Onde é Usado: %s') % self.display_name,
+            'res_model': 'mrp.bom',
+            'view_mode': 'tree,form',
+            'domain': [('id', 'in', bom_ids)],
+        }
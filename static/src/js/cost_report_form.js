@@ -0,0 +1,51 @@
+odoo.define('customBom.CostReportForm', function (require) {
+"use strict";
+
+var FormController = require('web.FormController');
+var FormView = require('web.FormView');
+var viewRegistry = require('web.view_registry');
+
+// Intervalo de atualização do progresso da geração em segundo plano (ms)
+var POLL_INTERVAL = 5000;
+
+var CostReportFormController = FormController.extend({
+    /**
+     * @override
+     */
+    start: function () {
+        var self = this;
+        return this._super.apply(this, arguments).then(function () {
+            self._pollTimer = setInterval(self._pollJobProgress.bind(self), POLL_INTERVAL);
+        });
+    },
+    /**
+     * @override
+     */
+    destroy: function () {
+        clearInterval(this._pollTimer);
+        this._super.apply(this, arguments);
+    },
+
+    /**
+     * Recarrega o registro enquanto o relatório estiver na fila ou em processamento.
+     *
+     * @private
+     */
+    _pollJobProgress: function () {
+        var record = this.model.get(this.handle);
+        if (this.mode === 'readonly' && record && ['queued', 'running'].includes(record.data.state)) {
+            this.reload();
+        }
+    },
+});
+
+var CostReportFormView = FormView.extend({
+    config: _.extend({}, FormView.prototype.config, {
+        Controller: CostReportFormController,
+    }),
+});
+
+viewRegistry.add('cost_report_form', CostReportFormView);
+
+return CostReportFormController;
+});
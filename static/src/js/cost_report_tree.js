@@ -0,0 +1,173 @@
+odoo.define('customBom.CostReportTree', function (require) {
+"use strict";
+
+var AbstractAction = require('web.AbstractAction');
+var core = require('web.core');
+var fieldUtils = require('web.field_utils');
+
+var QWeb = core.qweb;
+
+// Quantidade de linhas buscadas por vez em cada nível
+var PAGE_SIZE = 80;
+
+/**
+ * Visualizador hierárquico do relatório de custo: carrega apenas os
+ * produtos principais e busca os filhos de cada BOM ao expandi-la.
+ */
+var CostReportTree = AbstractAction.extend({
+    contentTemplate: 'customBom.CostReportTree',
+    events: {
+        'click .o_cost_tree_toggle': '_onToggle',
+        'click .o_cost_tree_more': '_onLoadMore',
+    },
+
+    /**
+     * @override
+     */
+    init: function (parent, action) {
+        this._super.apply(this, arguments);
+        var params = action.params || {};
+        this.reportId = params.report_id || (action.context && action.context.active_id);
+    },
+    /**
+     * @override
+     */
+    willStart: function () {
+        var self = this;
+        var rowsLoaded = this._fetchRows(false, 0).then(function (result) {
+            self._initialResult = result;
+        });
+        return Promise.all([this._super.apply(this, arguments), rowsLoaded]);
+    },
+    /**
+     * @override
+     */
+    start: function () {
+        var self = this;
+        return this._super.apply(this, arguments).then(function () {
+            self.$('tbody').append(self._renderRows(false, 0, self._initialResult));
+        });
+    },
+
+    //--------------------------------------------------------------------------
+    // Private
+    //--------------------------------------------------------------------------
+
+    /**
+     * @private
+     * @param {integer|false} parentId linha da BOM superior (false = produtos principais)
+     * @param {integer} offset
+     * @returns {Promise}
+     */
+    _fetchRows: function (parentId, offset) {
+        return this._rpc({
+            model: 'cost.report',
+            method: 'get_tree_rows',
+            args: [[this.reportId]],
+            kwargs: {parent_line_id: parentId, offset: offset, limit: PAGE_SIZE},
+        });
+    },
+    /**
+     * @private
+     * @param {integer|false} parentId
+     * @param {integer} level
+     * @param {Object} result resposta de get_tree_rows
+     * @returns {jQuery}
+     */
+    _renderRows: function (parentId, level, result) {
+        var formatFloat = function (value, digits) {
+            return fieldUtils.format.float(value, null, {digits: [16, digits]});
+        };
+        var rows = _.map(result.rows, function (row) {
+            return _.extend({}, row, {
+                item_qty: formatFloat(row.item_qty, 4),
+                unit_cost: formatFloat(row.unit_cost, 2),
+                total_cost: formatFloat(row.total_cost, 2),
+            });
+        });
+        var nextOffset = result.offset + result.rows.length;
+        return $(QWeb.render('customBom.CostReportTree.Rows', {
+            rows: rows,
+            level: level,
+            parentId: parentId,
+            nextOffset: nextOffset,
+            remaining: Math.max(result.total - nextOffset, 0),
+        }));
+    },
+    /**
+     * Linhas exibidas abaixo de $row (descendentes já carregados).
+     *
+     * @private
+     * @param {jQuery} $row
+     * @returns {jQuery}
+     */
+    _getDescendantRows: function ($row) {
+        var level = $row.data('level');
+        var $descendants = $();
+        var $next = $row.next();
+        while ($next.length && $next.data('level') > level) {
+            $descendants = $descendants.add($next);
+            $next = $next.next();
+        }
+        return $descendants;
+    },
+
+    //--------------------------------------------------------------------------
+    // Handlers
+    //--------------------------------------------------------------------------
+
+    /**
+     * Expande (buscando os filhos) ou recolhe uma BOM.
+     *
+     * @private
+     * @param {MouseEvent} ev
+     */
+    _onToggle: function (ev) {
+        ev.preventDefault();
+        var self = this;
+        var $toggle = $(ev.currentTarget);
+        var $row = $toggle.closest('tr');
+        if ($toggle.hasClass('fa-caret-down')) {
+            this._getDescendantRows($row).remove();
+            $toggle.removeClass('fa-caret-down').addClass('fa-caret-right');
+            return;
+        }
+        if ($toggle.hasClass('o_cost_tree_loading')) {
+            return;
+        }
+        $toggle.addClass('o_cost_tree_loading');
+        var parentId = $row.data('id');
+        this._fetchRows(parentId, 0).then(function (result) {
+            $row.after(self._renderRows(parentId, $row.data('level') + 1, result));
+            $toggle.removeClass('fa-caret-right').addClass('fa-caret-down');
+        }).finally(function () {
+            $toggle.removeClass('o_cost_tree_loading');
+        });
+    },
+    /**
+     * Busca a próxima página de um nível e a insere no lugar do link.
+     *
+     * @private
+     * @param {MouseEvent} ev
+     */
+    _onLoadMore: function (ev) {
+        ev.preventDefault();
+        var self = this;
+        var $moreRow = $(ev.currentTarget).closest('tr');
+        if ($moreRow.hasClass('o_cost_tree_loading')) {
+            return;
+        }
+        $moreRow.addClass('o_cost_tree_loading');
+        var parentId = $moreRow.data('parent') || false;
+        this._fetchRows(parentId, $moreRow.data('offset')).then(function (result) {
+            $moreRow.replaceWith(self._renderRows(parentId, $moreRow.data('level'), result));
+        }, function () {
+            $moreRow.removeClass('o_cost_tree_loading');
+        });
+    },
+});
+
+core.action_registry.add('cost_report_tree', CostReportTree);
+
+return CostReportTree;
+});
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+from . import test_query_budget
+from . import test_streamed_attachment
+from . import test_report_job
+from . import test_bom_closure
+from . import test_bom_import
+from . import test_report_paths
+from . import test_report_cache
+from . import test_cost_explosion
+from . import test_cost_report
+from . import test_cost_simulation
+from . import test_custom_bom
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import common
+
+# Linhas da BOM TOP: (tipo, profundidade, código do item, quantidade, custo total)
+TOP_ROWS = [
+    ('produto_principal', 0, 'TOP', 1.0, 122.0),
+    ('subconjunto', 1, 'SUB', 2.0, 78.0),
+    ('operacao', 2, 'SUB', 0.0, 60.0),
+    ('componente', 2, 'R1', 4.0, 8.0),
+    ('componente', 2, 'R2', 2.0, 10.0),
+    ('subconjunto', 1, 'MID', 1.0, 40.0),
+    ('subconjunto', 2, 'SUB', 1.0, 39.0),
+    ('operacao', 3, 'SUB', 0.0, 30.0),
+    ('componente', 3, 'R1', 2.0, 4.0),
+    ('componente', 3, 'R2', 1.0, 5.0),
+    ('componente', 2, 'R3', 1.0, 1.0),
+    ('componente', 1, 'R3', 4.0, 4.0),
+]
+
+
+def row_key(row):
+    """Chave comparável com TOP_ROWS de uma linha (CostRow ou cost.report.line)"""
+    return (row.line_type, row.depth, row.item_code, round(row.item_qty or 0.0, 4), round(row.total_cost or 0.0, 2))
+
+
+class CostBomCase(common.TransactionCase):
+    """Estrutura pequena, com um subconjunto compartilhado, usada pelos testes dos relatórios
+
+    TOP: SUB x2, MID x1, R3 x4
+    MID: SUB x1, R3 x1
+    SUB: R1 x2, R2 x1 e uma operação de 30 minutos a 60,00/h
+
+    Custos: SUB = 2 * 2,00 + 5,00 + 30,00 = 39,00; MID = 39,00 + 1,00 = 40,00;
+    TOP = 2 * 39,00 + 40,00 + 4 * 1,00 = 122,00.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(CostBomCase, cls).setUpClass()
+        cls.workcenter = cls.env['mrp.workcenter'].create({'name': 'Centro de Teste', 'costs_hour': 60.0})
+        cls.raw_1 = cls._create_product('R1', 2.0)
+        cls.raw_2 = cls._create_product('R2', 5.0)
+        cls.raw_3 = cls._create_product('R3', 1.0)
+        cls.sub_product = cls._create_product('SUB', 0.0)
+        cls.mid_product = cls._create_product('MID', 0.0)
+        cls.top_product = cls._create_product('TOP', 0.0)
+        cls.sub_bom = cls._create_bom(cls.sub_product, [(cls.raw_1, 2.0), (cls.raw_2, 1.0)], operation_minutes=30.0)
+        cls.mid_bom = cls._create_bom(cls.mid_product, [(cls.sub_product, 1.0), (cls.raw_3, 1.0)])
+        cls.top_bom = cls._create_bom(cls.top_product, [(cls.sub_product, 2.0), (cls.mid_product, 1.0),
+                                                        (cls.raw_3, 4.0)])
+
+    @classmethod
+    def _create_product(cls, code, price):
+        return cls.env['product.product'].create({
+            'name': 'Produto %s' % code,
+            'default_code': code,
+            'type': 'product',
+            'standard_price': price,
+        })
+
+    @classmethod
+    def _create_bom(cls, product, components, operation_minutes=0.0):
+        vals = {
+            'product_tmpl_id': product.product_tmpl_id.id,
+            'product_id': product.id,
+            'product_qty': 1.0,
+            'type': 'normal',
+            'bom_line_ids': [
+                (0, 0, {'product_id': component.id, 'product_qty': qty}) for component, qty in components
+            ],
+        }
+        if operation_minutes:
+            vals['operation_ids'] = [(0, 0, {
+                'name': 'Montagem %s' % product.default_code,
+                'workcenter_id': cls.workcenter.id,
+                'time_cycle_manual': operation_minutes,
+            })]
+        return cls.env['mrp.bom'].create(vals)
+
+    def _make_cycle(self):
+        """Fecha o ciclo TOP > SUB > TOP direto no banco, sem as validações da BOM"""
+        line = self.env['mrp.bom.line'].create({
+            'bom_id': self.sub_bom.id,
+            'product_id': self.raw_3.id,
+            'product_qty': 1.0,
+        })
+        line.flush()
+        self.env.cr.execute("UPDATE mrp_bom_line SET product_id = %s WHERE id = %s", (self.top_product.id, line.id))
+        self.env['mrp.bom.line'].invalidate_cache(['product_id'], line.ids)
+
+    def _create_wizard(self, boms, **vals):
+        return self.env['cost.report.wizard'].create(dict({
+            'name': 'Teste',
+            'bom_ids': [(6, 0, boms.ids)],
+            'include_taxes': False,
+        }, **vals))
+
+    def _create_report(self, boms, **vals):
+        return self._create_wizard(boms, **vals)._create_cost_report()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import tagged
+
+from .common import CostBomCase
+
+
+@tagged('post_install', '-at_install')
+class TestBomClosure(CostBomCase):
+    """Estrutura explodida mantida pelas alterações nas BOMs e linhas"""
+
+    def _closure_rows(self):
+        roots = self.sub_bom | self.mid_bom | self.top_bom
+        self.env['mrp.bom.closure'].flush()
+        self.env.cr.execute("""
+            SELECT root_bom_id, bom_id, product_id, depth, round(quantity::numeric, 6), is_component
+              FROM mrp_bom_closure
+             WHERE root_bom_id IN %s
+             ORDER BY 1, 2, 3, 4
+        """, (tuple(roots.ids),))
+        return self.env.cr.fetchall()
+
+    def test_flat_components(self):
+        # R1: 2 x 2 (SUB x2) + 2 (SUB em MID); R2: 2 + 1; R3: 4 + 1 (MID)
+        flat_components = self.env['mrp.bom.closure']._get_flat_components(self.top_bom)
+        self.assertEqual(flat_components, {self.raw_1.id: 6.0, self.raw_2.id: 3.0, self.raw_3.id: 5.0})
+        # Igual ao custo das matérias-primas no relatório
+        self.assertAlmostEqual(self.top_bom.raw_material_cost, 32.0)
+        self.assertAlmostEqual(self.sub_bom.raw_material_cost, 9.0)
+
+    def test_closure_after_line_changes(self):
+        raw_4 = self._create_product('R4', 7.0)
+        self.sub_bom.bom_line_ids.filtered(lambda line: line.product_id == self.raw_1).product_qty = 3.0
+        self.env['mrp.bom.line'].create({'bom_id': self.mid_bom.id, 'product_id': raw_4.id, 'product_qty': 2.0})
+        self.top_bom.bom_line_ids.filtered(lambda line: line.product_id == self.raw_3).unlink()
+        incremental = self._closure_rows()
+
+        # A manutenção incremental chega ao mesmo resultado que a reconstrução completa
+        self.env['mrp.bom.closure']._rebuild_all()
+        self.assertEqual(incremental, self._closure_rows())
+        # R1: 3 x 2 (SUB x2) + 3 (SUB em MID); R3 só pelo MID; R4: 2 (MID)
+        self.assertEqual(self.env['mrp.bom.closure']._get_flat_components(self.top_bom),
+                         {self.raw_1.id: 9.0, self.raw_2.id: 3.0, self.raw_3.id: 1.0, raw_4.id: 2.0})
+
+    def test_closure_with_cycle(self):
+        self._make_cycle()
+        closure_model = self.env['mrp.bom.closure']
+        closure_model._rebuild(self.top_bom.ids)
+        # O componente que fecha o ciclo entra como matéria-prima, nas duas ocorrências de SUB
+        self.assertEqual(closure_model._get_flat_components(self.top_bom), {
+            self.raw_1.id: 6.0, self.raw_2.id: 3.0, self.raw_3.id: 5.0, self.top_product.id: 3.0})
+        self.assertIn(self.top_bom.id, closure_model._get_where_used(self.raw_1))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+
+from odoo.tests import tagged
+
+from .common import CostBomCase
+
+
+@tagged('post_install', '-at_install')
+class TestBomImport(CostBomCase):
+    """Importação em lotes: BOMs, linhas e custos consolidados"""
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestBomImport, cls).setUpClass()
+        cls.part_a = cls._create_product('IA', 0.0)
+        cls.part_b = cls._create_product('IB', 0.0)
+
+    def _import(self, content, file_format, chunk_size=1):
+        wizard = self.env['custom.bom.import.wizard'].create({
+            'import_file': base64.b64encode(content),
+            'filename': 'boms.%s' % file_format,
+            'file_format': file_format,
+            'chunk_size': chunk_size,
+            'commit_chunks': False,
+        })
+        wizard.action_import()
+        return wizard
+
+    def _get_bom(self, product):
+        return self.env['custom.bom'].search([('product_id', '=', product.id)])
+
+    def test_import_csv_chunks(self):
+        # IB usa IA, que só é importado no lote seguinte
+        content = (
+            'bom_code;product;component;quantity;uom;notes\n'
+            'B-IB;IB;IA;2;;\n'
+            'B-IB;IB;R3;1;;\n'
+            'B-IA;IA;R1;2;;\n'
+            'B-IA;IA;R2;1,0;;\n'
+        ).encode('utf-8')
+        wizard = self._import(content, 'csv')
+        self.assertFalse(wizard.error_log)
+        self.assertEqual((wizard.bom_count, wizard.line_count), (2, 4))
+        bom_a, bom_b = self._get_bom(self.part_a), self._get_bom(self.part_b)
+        self.assertEqual(bom_b.code, 'B-IB')
+        self.assertEqual(bom_b.bom_line_ids.filtered(lambda line: line.product_id == self.part_a).sub_bom_id, bom_a)
+        # IA = 2 x 2,00 + 5,00; IB = 2 x 9,00 + 1,00
+        self.assertAlmostEqual(bom_a.cost, 9.0)
+        self.assertAlmostEqual(bom_b.cost, 19.0)
+
+    def test_import_json_list_and_lines(self):
+        boms = [
+            {'code': 'J-IA', 'product': 'IA', 'lines': [{'product': 'R1', 'quantity': 2}, {'product': 'R2', 'quantity': 1}]},
+            {'code': 'J-IB', 'product': 'IB', 'lines': [{'product': 'IA', 'quantity': 2}, {'product': 'R3', 'quantity': 1}]},
+        ]
+        for content in (json.dumps(boms, indent=2), '\n'.join(json.dumps(bom) for bom in boms)):
+            with self.subTest(content=content[:1]):
+                self.env['custom.bom'].search([('product_id', 'in', (self.part_a | self.part_b).ids)]).unlink()
+                wizard = self._import(content.encode('utf-8'), 'json', chunk_size=500)
+                self.assertFalse(wizard.error_log)
+                self.assertEqual((wizard.bom_count, wizard.line_count), (2, 4))
+                self.assertAlmostEqual(self._get_bom(self.part_b).cost, 19.0)
+
+    def test_import_reports_missing_product(self):
+        content = 'product;component;quantity\nIA;XX;1\n'.encode('utf-8')
+        wizard = self._import(content, 'csv')
+        self.assertEqual(wizard.bom_count, 0)
+        self.assertIn("'XX'", wizard.error_log)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from ..tools.cost_matrix import BomCostMatrix
+from ..tools.report_sinks import ReportSink
+from .common import TOP_ROWS, CostBomCase, row_key
+
+
+class RecordingSink(ReportSink):
+    """Destino que guarda a sequência de chamadas recebidas"""
+
+    def __init__(self):
+        self.events = []
+
+    def start(self, header):
+        self.events.append(('start', len(header)))
+
+    def begin_bom(self, bom):
+        self.events.append(('begin', bom.id))
+
+    def write_row(self, row):
+        self.events.append(('row', row_key(row)))
+
+    def end_bom(self, bom):
+        self.events.append(('end', bom.id))
+
+    def close(self):
+        self.events.append(('close',))
+
+
+@tagged('post_install', '-at_install')
+class TestCostExplosion(CostBomCase):
+    """Explosão das BOMs: linhas, custos acumulados e ciclos"""
+
+    def _explode(self, wizard, bom):
+        return list(wizard._iter_bom_rows(bom, wizard._prepare_explosion()))
+
+    def test_shared_subassembly_rows(self):
+        wizard = self._create_wizard(self.top_bom)
+        rows = self._explode(wizard, self.top_bom)
+        self.assertEqual([row_key(row) for row in rows], TOP_ROWS)
+        # SUB é explodido nas duas ocorrências, com a quantidade de cada caminho
+        operation = rows[7]
+        self.assertEqual((operation.operation_name, operation.operation_time, operation.operation_cost),
+                         ('Montagem SUB', 30.0, 30.0))
+        self.assertEqual(operation.levels[:5], [
+            '[TOP] Produto TOP', '[MID] Produto MID', '[SUB] Produto SUB', 'Montagem SUB', ''])
+        self.assertEqual(rows[3].unit_cost, 2.0)
+
+    def test_display_levels_limit(self):
+        wizard = self._create_wizard(self.top_bom, max_display_levels=2)
+        rows = self._explode(wizard, self.top_bom)
+        self.assertEqual([row_key(row) for row in rows], TOP_ROWS)
+        # Além do último nível exibido, o item é acrescentado à última coluna exibida
+        self.assertEqual(rows[6].levels, ['[TOP] Produto TOP', '[MID] Produto MID > [SUB] Produto SUB'])
+        self.assertEqual(rows[8].levels, ['[TOP] Produto TOP', '[MID] Produto MID > [R1] Produto R1'])
+
+    def test_row_pipeline(self):
+        wizard = self._create_wizard(self.top_bom | self.mid_bom)
+        sink = RecordingSink()
+        wizard._run_report_sinks([sink])
+        header_size = len(wizard._get_report_header())
+        mid_rows = [
+            ('produto_principal', 0, 'MID', 1.0, 40.0),
+            ('subconjunto', 1, 'SUB', 1.0, 39.0),
+            ('operacao', 2, 'SUB', 0.0, 30.0),
+            ('componente', 2, 'R1', 2.0, 4.0),
+            ('componente', 2, 'R2', 1.0, 5.0),
+            ('componente', 1, 'R3', 1.0, 1.0),
+        ]
+        expected = [('start', header_size)]
+        for bom, rows in ((bom, TOP_ROWS if bom == self.top_bom else mid_rows) for bom in wizard.bom_ids):
+            expected += [('begin', bom.id)] + [('row', row) for row in rows] + [('end', bom.id)]
+        expected.append(('close',))
+        self.assertEqual(sink.events, expected)
+
+    def test_cycle_raises(self):
+        self._make_cycle()
+        wizard = self._create_wizard(self.top_bom)
+        with self.assertRaisesRegex(UserError, 'Estrutura cíclica'):
+            self._explode(wizard, self.top_bom)
+        with self.assertRaises(UserError):
+            BomCostMatrix(self.env).load(self.top_bom).solve()
+
+    def test_catalog_rollup_matrix(self):
+        boms = self.sub_bom | self.mid_bom | self.top_bom
+        costs = BomCostMatrix(self.env).load(boms).solve()
+        self.assertEqual({bom_id: round(cost, 2) for bom_id, cost in costs.items()},
+                         {self.sub_bom.id: 39.0, self.mid_bom.id: 40.0, self.top_bom.id: 122.0})
+        without_operations = BomCostMatrix(self.env, include_operations=False).load(boms).solve()
+        self.assertAlmostEqual(without_operations[self.top_bom.id], 32.0)
+
+        wizard = self._create_wizard(boms, catalog_rollup=True)
+        rows = [row for _bom, bom_rows in wizard._iter_bom_row_groups() for row in bom_rows]
+        self.assertEqual(sorted((row.item_code, row.total_cost) for row in rows),
+                         [('MID', 40.0), ('SUB', 39.0), ('TOP', 122.0)])
+        self.assertEqual({row.line_type for row in rows}, {'produto_principal'})
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import tagged
+
+from .common import TOP_ROWS, CostBomCase, row_key
+
+
+@tagged('post_install', '-at_install')
+class TestCostReport(CostBomCase):
+    """Relatório persistente: linhas gravadas em lote, caminhos, totais e compactação"""
+
+    def _generate(self, boms, **vals):
+        report = self._create_report(boms, **vals)
+        report.action_generate_report()
+        return report
+
+    def _line_snapshot(self, report):
+        lines = self.env['cost.report.line'].search([('report_id', '=', report.id)], order='id')
+        return [
+            (line.id, line.parent_id.id, line.path_id.id, line.level_name, row_key(line),
+             line.level_1, line.level_2, line.level_3, line.level_4)
+            for line in lines
+        ]
+
+    def test_generated_lines(self):
+        report = self._generate(self.top_bom)
+        lines = report.line_ids
+        self.assertEqual([row_key(line) for line in lines], TOP_ROWS)
+        self.assertEqual(len(report.section_ids), 1)
+        # Linhas superiores pela profundidade, na ordem do relatório
+        self.assertFalse(lines[0].parent_id)
+        self.assertEqual(lines[2].parent_id, lines[1])
+        self.assertEqual(lines[7].parent_id, lines[6])
+        self.assertEqual(lines[11].parent_id, lines[0])
+        # Níveis superiores gravados uma vez por caminho
+        self.assertEqual(lines[2].path_id, lines[3].path_id)
+        self.assertEqual(lines[3].level_name, '[R1] Produto R1')
+        self.assertEqual((lines[8].level_1, lines[8].level_2, lines[8].level_3, lines[8].level_4),
+                         ('[TOP] Produto TOP', '[MID] Produto MID', '[SUB] Produto SUB', '[R1] Produto R1'))
+        self.assertEqual(lines[7].operation_time, '00:30:00')
+
+    def test_sql_totals(self):
+        report = self._generate(self.top_bom)
+        self.assertEqual(
+            (report.total_cost, report.cost_main_products, report.cost_subassemblies,
+             report.cost_operations, report.cost_components),
+            (401.0, 122.0, 157.0, 90.0, 32.0))
+        self.assertEqual((report.total_products, report.total_operations, report.total_components), (4, 2, 6))
+
+        report._delete_report_lines()
+        self.assertEqual((report.total_cost, report.total_products), (0.0, 0))
+
+    def test_pack_and_unpack(self):
+        report = self._generate(self.top_bom | self.mid_bom)
+        before = self._line_snapshot(report)
+        totals = report.total_cost
+        report.action_archive_packed()
+        self.assertTrue(report.lines_packed)
+        attachment = report.packed_attachment_id
+        self.assertTrue(attachment.file_size)
+        self.assertFalse(self._line_snapshot(report))
+        self.assertFalse(self.env['cost.report.path'].search_count([('report_id', '=', report.id)]))
+        # Totais e seções continuam no banco
+        self.assertEqual(report.total_cost, totals)
+        self.assertEqual(len(report.section_ids), 2)
+
+        report._unpack_lines()
+        self.assertFalse(report.lines_packed)
+        self.assertFalse(attachment.exists())
+        self.assertEqual(self._line_snapshot(report), before)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import tagged
+
+from .common import CostBomCase
+
+
+@tagged('post_install', '-at_install')
+class TestCostSimulation(CostBomCase):
+    """Cenários "e se..." resolvidos de uma vez, sem alterar os cadastros"""
+
+    def test_scenarios(self):
+        simulation = self.env['cost.simulation'].create({
+            'name': 'Teste',
+            'bom_ids': [(6, 0, (self.sub_bom | self.mid_bom | self.top_bom).ids)],
+            'scenario_ids': [
+                (0, 0, {'name': 'R1 +50%', 'sequence': 1, 'override_ids': [(0, 0, {
+                    'target': 'product', 'product_id': self.raw_1.id, 'mode': 'percent', 'value': 50.0,
+                })]}),
+                (0, 0, {'name': 'Centro a 120/h', 'sequence': 2, 'override_ids': [(0, 0, {
+                    'target': 'workcenter', 'workcenter_id': self.workcenter.id, 'mode': 'value', 'value': 120.0,
+                })]}),
+            ],
+        })
+        simulation.action_run_simulation()
+        self.assertEqual(simulation.state, 'done')
+        results = {
+            (result.scenario_id.name, result.bom_id): (round(result.base_cost, 2), round(result.simulated_cost, 2),
+                                                       round(result.delta, 2))
+            for result in simulation.result_ids
+        }
+        self.assertEqual(results, {
+            ('R1 +50%', self.sub_bom): (39.0, 41.0, 2.0),
+            ('R1 +50%', self.mid_bom): (40.0, 42.0, 2.0),
+            ('R1 +50%', self.top_bom): (122.0, 128.0, 6.0),
+            ('Centro a 120/h', self.sub_bom): (39.0, 69.0, 30.0),
+            ('Centro a 120/h', self.mid_bom): (40.0, 70.0, 30.0),
+            ('Centro a 120/h', self.top_bom): (122.0, 212.0, 90.0),
+        })
+        # Os cadastros não são alterados
+        self.assertEqual(self.raw_1.standard_price, 2.0)
+        self.assertEqual(self.workcenter.costs_hour, 60.0)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import tagged
+
+from .common import CostBomCase
+
+
+@tagged('post_install', '-at_install')
+class TestCustomBomCost(CostBomCase):
+    """Custo consolidado gravado nos Custom BOMs e mantido pelas alterações"""
+
+    def _create_custom_bom(self, product, components):
+        return self.env['custom.bom'].create({
+            'product_id': product.id,
+            'bom_line_ids': [(0, 0, {
+                'product_id': component.id,
+                'product_qty': qty,
+                'product_uom_id': component.uom_id.id,
+            }) for component, qty in components],
+        })
+
+    def test_stored_costs_follow_changes(self):
+        # Criados de cima para baixo: as linhas são revinculadas quando os sub-BOMs surgem
+        top = self._create_custom_bom(self.top_product, [(self.sub_product, 2.0), (self.mid_product, 1.0),
+                                                         (self.raw_3, 4.0)])
+        mid = self._create_custom_bom(self.mid_product, [(self.sub_product, 1.0), (self.raw_3, 1.0)])
+        sub = self._create_custom_bom(self.sub_product, [(self.raw_1, 2.0), (self.raw_2, 1.0)])
+        self.assertEqual(top.bom_line_ids.mapped('sub_bom_id'), sub | mid)
+        # SUB = 2 x 2,00 + 5,00; MID = 9,00 + 1,00; TOP = 2 x 9,00 + 10,00 + 4 x 1,00
+        self.assertEqual((sub.cost, mid.cost, top.cost), (9.0, 10.0, 32.0))
+
+        self.raw_1.standard_price = 3.0
+        self.assertEqual((sub.cost, mid.cost, top.cost), (11.0, 12.0, 38.0))
+
+        top.bom_line_ids.filtered(lambda line: line.product_id == self.raw_3).product_qty = 2.0
+        self.assertEqual(top.cost, 36.0)
+        line = top.bom_line_ids.filtered(lambda line: line.product_id == self.sub_product)
+        self.assertEqual((line.unit_cost, line.extended_cost), (11.0, 22.0))
+
+        # Sem o BOM, SUB entra pelo custo padrão do produto (zero)
+        sub.unlink()
+        self.assertEqual((mid.cost, top.cost), (1.0, 3.0))
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import common, tagged
+
+from ..tools.benchmark import SHAPES, format_results, run_scaling
+
+
+@tagged('post_install', '-at_install')
+class TestQueryBudget(common.TransactionCase):
+    """As consultas dos relatórios não podem crescer com o número de linhas"""
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for shape in SHAPES:
+            with self.subTest(shape=shape):
+                results = run_scaling(self.env, shape)
+                failures = [result for result in results if not result['ok']]
+                self.assertFalse(failures, format_results(results))
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import tagged
+
+from .common import CostBomCase
+
+
+@tagged('post_install', '-at_install')
+class TestReportCache(CostBomCase):
+    """A chave do cache é compartilhada por usuários com os mesmos grupos e empresas"""
+
+    def _create_user(self, login, groups):
+        return self.env['res.users'].create({
+            'name': login,
+            'login': login,
+            'groups_id': [(6, 0, [self.env.ref(xml_id).id for xml_id in groups])],
+        })
+
+    def _make_key(self, user):
+        wizard = self._create_wizard(self.top_bom).with_user(user)
+        return self.env['cost.report.cache'].with_user(user)._make_key(wizard, {self.top_bom.id: 'fp'}, 'csv')
+
+    def test_key_shared_by_same_groups(self):
+        groups = ['base.group_user', 'mrp.group_mrp_user']
+        first = self._create_user('custo_a', groups)
+        second = self._create_user('custo_b', groups)
+        manager = self._create_user('custo_c', groups + ['mrp.group_mrp_manager'])
+        self.assertTrue(self._make_key(first))
+        self.assertEqual(self._make_key(first), self._make_key(second))
+        self.assertNotEqual(self._make_key(first), self._make_key(manager))
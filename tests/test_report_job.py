@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import time
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import CostBomCase
+
+
+@tagged('post_install', '-at_install')
+class TestReportJob(CostBomCase):
+    """Processamento em segundo plano: repetição e desistência de uma BOM"""
+
+    def _run_job(self, report):
+        # O processamento confirma a transação a cada BOM; no teste ela é mantida
+        with patch.object(self.env.cr, 'commit'):
+            return report._as_job_owner()._run_job(time.time() + 3600)
+
+    def test_interrupted_bom_is_retried(self):
+        report = self._create_report(self.top_bom)
+        # Execução anterior encerrada no meio da BOM
+        report.write({'state': 'running', 'job_bom_id': self.top_bom.id, 'job_bom_attempts': 1})
+        self.assertTrue(self._run_job(report))
+        self.assertEqual(report.state, 'generated')
+        self.assertEqual(report.job_bom_attempts, 2)
+        self.assertEqual(report.job_done_bom_ids, self.top_bom)
+        self.assertEqual(self.env['cost.report.line'].search_count([('report_id', '=', report.id)]), 12)
+        self.assertAlmostEqual(report.total_cost, 401.0)
+
+    def test_bom_over_budget_fails_job(self):
+        report = self._create_report(self.mid_bom | self.top_bom)
+        report.action_generate_report()
+        self.assertTrue(report.line_ids)
+        done_bom, failing_bom = report.bom_ids[0], report.bom_ids[1]
+        report.write({
+            'state': 'running',
+            'job_done_bom_ids': [(6, 0, done_bom.ids)],
+            'job_bom_id': failing_bom.id,
+            'job_bom_attempts': report._job_max_bom_attempts,
+        })
+        self.assertTrue(self._run_job(report))
+        self.assertEqual(report.state, 'draft')
+        self.assertIn(failing_bom.display_name, report.job_error)
+        self.assertIn('custom_bom.report_job_time_budget', report.job_error)
+        # Linhas parciais e progresso descartados, como no cancelamento
+        self.assertFalse(self.env['cost.report.line'].search_count([('report_id', '=', report.id)]))
+        self.assertFalse(report.job_done_bom_ids)
+        self.assertFalse(report.job_bom_id)
+        self.assertEqual(report.total_cost, 0.0)
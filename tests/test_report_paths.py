@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import tagged
+
+from .common import CostBomCase
+
+
+@tagged('post_install', '-at_install')
+class TestReportPaths(CostBomCase):
+    """Linhas gravadas em lote com os níveis superiores em cost.report.path"""
+
+    def _insert_lines(self, report, rows):
+        line_model = self.env['cost.report.line']
+        vals_list = []
+        for line_type, depth, levels in rows:
+            vals = {'report_id': report.id, 'line_type': line_type, 'depth': depth}
+            vals.update(('level_%s' % (index + 1), name) for index, name in enumerate(levels))
+            vals_list.append(vals)
+        line_model._bulk_create(vals_list)
+        return line_model.search([('report_id', '=', report.id)], order='id')
+
+    def test_blank_item_name_keeps_parent(self):
+        report = self._create_report(self.top_bom)
+        lines = self._insert_lines(report, [
+            ('produto_principal', 0, ['TOP']),
+            ('subconjunto', 1, ['TOP', 'SUB']),
+            ('componente', 2, ['TOP', 'SUB', '']),
+            ('componente', 1, ['TOP', 'R3']),
+        ])
+        blank_line = lines[2]
+        self.assertEqual(blank_line.level_name, '')
+        self.assertEqual(blank_line.path_id.name, 'SUB')
+        self.assertEqual((blank_line.level_1, blank_line.level_2, blank_line.level_3), ('TOP', 'SUB', ''))
+        self.assertEqual(blank_line.parent_id, lines[1])
+        self.assertEqual(lines[3].parent_id, lines[0])
+        # Linhas com o mesmo caminho compartilham o nó
+        self.assertEqual(lines[1].path_id, lines[3].path_id)
+
+    def test_item_beyond_display_levels(self):
+        report = self._create_report(self.top_bom, max_display_levels=2)
+        lines = self._insert_lines(report, [
+            ('produto_principal', 0, ['TOP']),
+            ('subconjunto', 1, ['TOP', 'MID']),
+            ('subconjunto', 2, ['TOP', 'MID > SUB']),
+        ])
+        self.assertEqual(lines[2].level_name, 'MID > SUB')
+        self.assertEqual(lines[2].path_id.name, 'TOP')
+        self.assertEqual(lines[2].parent_id, lines[1])
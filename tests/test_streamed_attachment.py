@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+from odoo.tests import tagged
+
+from .common import CostBomCase
+
+
+@tagged('post_install', '-at_install')
+class TestStreamedAttachment(CostBomCase):
+
+    def test_streamed_attachment_reads_back(self):
+        wizard = self._create_wizard(self.top_bom)
+        content = b'codigo;custo\n' + b'R1;2,00\n' * 5000
+        attachment = wizard._create_streamed_attachment(
+            'teste.csv', 'text/csv', lambda binary_file: binary_file.write(content))
+        self.assertEqual(attachment.raw, content)
+        self.assertEqual(attachment.file_size, len(content))
+        self.assertEqual(attachment.checksum, hashlib.sha1(content).hexdigest())
+        self.assertEqual((attachment.res_model, attachment.res_id), (wizard._name, wizard.id))
+
+        # Conteúdo idêntico reaproveita o arquivo do filestore
+        duplicate = wizard._create_streamed_attachment(
+            'copia.csv', 'text/csv', lambda binary_file: binary_file.write(content))
+        self.assertEqual(duplicate.raw, content)
+        if attachment.store_fname:
+            self.assertEqual(duplicate.store_fname, attachment.store_fname)
+
+    def test_export_returns_download_action(self):
+        wizard = self._create_wizard(self.top_bom)
+        action = wizard.generate_cost_report()
+        self.assertEqual(action['type'], 'ir.actions.act_url')
+        self.assertTrue(wizard.attachment_id)
+        lines = wizard.attachment_id.raw.decode('utf-8-sig').splitlines()
+        self.assertIn('Custo Total Linha Item/LdM', lines[0])
+        # Cabeçalho e as 12 linhas da estrutura
+        self.assertEqual(len(lines), 13)
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+from . import bom_graph
+from . import cost_matrix
+from . import parallel_explosion
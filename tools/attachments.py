@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+
+def create_streamed_attachment(env, filename, mimetype, write_content, res_model=False, res_id=False):
+    """Cria um anexo gravando o conteúdo direto no filestore, sem montá-lo em memória
+
+    ``write_content`` recebe um arquivo binário aberto para escrita; o anexo
+    pertence ao registro ``res_model``/``res_id`` informado.
+
+    Depende dos detalhes internos do ``ir.attachment`` do Odoo 14.0
+    (``_filestore``, ``_get_path``, ``_mark_for_gc`` e o cálculo de
+    ``file_size``/``checksum`` no inverso de ``datas``): o arquivo é movido
+    para o caminho do checksum, reaproveitando um arquivo idêntico já
+    existente, e o anexo é criado pelo ORM (com as verificações de acesso)
+    apenas com ``store_fname``. Revisar ao migrar de versão.
+    """
+    attachment_model = env['ir.attachment']
+    filestore = attachment_model._filestore()
+    os.makedirs(filestore, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=filestore, prefix='cost_report_', delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+        write_content(tmp_file)
+
+    try:
+        checksum = hashlib.sha1()
+        with open(tmp_path, 'rb') as tmp_file:
+            for block in iter(lambda: tmp_file.read(1024 * 1024), b''):
+                checksum.update(block)
+        checksum = checksum.hexdigest()
+        file_size = os.path.getsize(tmp_path)
+
+        attachment_vals = {
+            'name': filename,
+            'type': 'binary',
+            'mimetype': mimetype,
+            'res_model': res_model,
+            'res_id': res_id,
+        }
+        if attachment_model._storage() != 'file':
+            # Armazenamento em banco: não há como evitar a leitura completa
+            with open(tmp_path, 'rb') as tmp_file:
+                attachment_vals['raw'] = tmp_file.read()
+            return attachment_model.create(attachment_vals)
+
+        fname, full_path = attachment_model._get_path(None, checksum)
+        if os.path.exists(full_path):
+            os.unlink(tmp_path)
+        else:
+            shutil.move(tmp_path, full_path)
+        attachment_model._mark_for_gc(fname)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    attachment_vals['store_fname'] = fname
+    attachment = attachment_model.create(attachment_vals)
+    # file_size e checksum são ignorados pelo create quando não há conteúdo
+    attachment.flush()
+    env.cr.execute(
+        "UPDATE ir_attachment SET file_size = %s, checksum = %s WHERE id = %s",
+        (file_size, checksum, attachment.id)
+    )
+    attachment.invalidate_cache(['file_size', 'checksum'])
+    return attachment
+
+
+def open_attachment(attachment):
+    """Arquivo binário, aberto para leitura, com o conteúdo do anexo
+
+    No filestore o arquivo é aberto diretamente pelo caminho interno do
+    ``ir.attachment`` do Odoo 14.0 (``_full_path``), sem carregar o conteúdo
+    em memória; no banco, não há como evitar a leitura completa.
+    """
+    if attachment.store_fname:
+        return open(attachment._full_path(attachment.store_fname), 'rb')
+    return io.BytesIO(attachment.raw or b'')
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks dos relatórios de custo com estruturas sintéticas.
+
+Gera BOMs profundas, largas, compartilhadas e com muitas operações em duas
+escalas (a segunda com o dobro de linhas e os mesmos níveis), mede o tempo e o
+número de consultas de cada etapa e verifica que as consultas da escala maior
+não crescem com as linhas: o limite é o valor medido na escala menor mais uma
+folga. Os testes em ``tests/test_query_budget.py`` executam estas verificações;
+para ver a tabela completa em uma base de testes (os dados são desfeitos):
+
+    odoo-bin shell -d <base> --no-http <<'EOF'
+    from odoo.addons.customBom.tools.benchmark import main
+    main(env, scale=1)
+    EOF
+"""
+import io
+import logging
+import math
+import random
+import sys
+import time
+
+from .report_sinks import ReportLineSink, ReportSink
+
+_logger = logging.getLogger(__name__)
+
+# Consultas a mais toleradas na escala maior, por etapa: (folga fixa, por BOM principal
+# a mais, por lote de 1000 linhas a mais). O lote cobre o prefetch e um INSERT por lote;
+# ao dobrar a estrutura, uma regressão para consultas por linha soma centenas de consultas.
+QUERY_GROWTH_BUDGETS = {
+    'explosion': (10, 2, 10),
+    'csv_export': (10, 2, 10),
+    'report_lines': (10, 5, 14),
+    'csv_and_lines': (10, 5, 14),
+}
+
+SHAPES = ('deep', 'wide', 'shared', 'operations')
+
+
+class _Rollback(Exception):
+    """Desfaz o savepoint do benchmark"""
+
+
+class _CountingSink(ReportSink):
+    """Apenas conta as linhas, para medir a explosão isoladamente"""
+
+    def __init__(self):
+        self.row_count = 0
+
+    def write_row(self, row):
+        self.row_count += 1
+
+
+class SyntheticBomFactory(object):
+    """Cria estruturas de BOM sintéticas de tamanho configurável"""
+
+    def __init__(self, env, scale=1, seed=42):
+        self.env = env
+        self.scale = max(1, int(scale))
+        self.random = random.Random(seed)
+        self._sequence = 0
+        self._workcenters = None
+
+    def _products(self, count, prefix):
+        vals_list = []
+        for _index in range(count):
+            self._sequence += 1
+            vals_list.append({
+                'name': 'BENCH %s %s' % (prefix, self._sequence),
+                'default_code': 'BENCH-%s-%s' % (prefix, self._sequence),
+                'type': 'product',
+                'standard_price': round(self.random.uniform(0.5, 100.0), 2),
+            })
+        return self.env['product.product'].create(vals_list)
+
+    def _workcenter_list(self):
+        if self._workcenters is None:
+            self._workcenters = self.env['mrp.workcenter'].create([
+                {'name': 'BENCH WC %s' % index, 'costs_hour': 20.0 + 10 * index} for index in range(5)
+            ])
+        return self._workcenters
+
+    def _bom_vals(self, product, components, operations=1):
+        workcenters = self._workcenter_list()
+        return {
+            'product_tmpl_id': product.product_tmpl_id.id,
+            'product_id': product.id,
+            'product_qty': 1.0,
+            'type': 'normal',
+            'bom_line_ids': [
+                (0, 0, {'product_id': component.id, 'product_qty': self.random.choice([1.0, 2.0, 0.5, 3.0])})
+                for component in components
+            ],
+            'operation_ids': [
+                (0, 0, {
+                    'name': 'Operação %s' % index,
+                    'workcenter_id': workcenters[index % len(workcenters)].id,
+                    'time_cycle_manual': float(self.random.randint(1, 90)),
+                })
+                for index in range(operations)
+            ],
+        }
+
+    def build(self, shape):
+        """Cria a estrutura e retorna {'boms': BOMs principais}"""
+        return getattr(self, '_build_%s' % shape)()
+
+    def _build_deep(self):
+        # Cadeia de 20 subconjuntos; a escala aumenta as matérias-primas de cada nível
+        depth = 20
+        assemblies = self._products(depth, 'DEEP')
+        vals_list = []
+        for index, product in enumerate(assemblies):
+            components = self._products(5 * self.scale, 'DEEP-RAW')
+            if index + 1 < depth:
+                components |= assemblies[index + 1]
+            vals_list.append(self._bom_vals(product, components))
+        boms = self.env['mrp.bom'].create(vals_list)
+        return {'boms': boms[:1]}
+
+    def _build_wide(self):
+        # Uma BOM com muitos componentes e subconjuntos rasos
+        assemblies = self._products(20 * self.scale, 'WIDE-SUB')
+        vals_list = [self._bom_vals(product, self._products(10, 'WIDE-RAW')) for product in assemblies]
+        top = self._products(1, 'WIDE')
+        vals_list.append(self._bom_vals(top, self._products(200 * self.scale, 'WIDE-RAW') | assemblies))
+        boms = self.env['mrp.bom'].create(vals_list)
+        return {'boms': boms[-1:]}
+
+    def _build_shared(self):
+        # Camadas em que cada BOM usa várias BOMs da camada seguinte
+        layers, width, fan_out = 5, 10 * self.scale, 4
+        layer_products = [self._products(width, 'SHARED-L%s' % layer) for layer in range(layers)]
+        vals_list = []
+        for layer, products in enumerate(layer_products):
+            for product in products:
+                components = self._products(3, 'SHARED-RAW')
+                if layer + 1 < layers:
+                    next_layer = layer_products[layer + 1]
+                    for index in self.random.sample(range(len(next_layer)), fan_out):
+                        components |= next_layer[index]
+                vals_list.append(self._bom_vals(product, components))
+        boms = self.env['mrp.bom'].create(vals_list)
+        return {'boms': boms[:width]}
+
+    def _build_operations(self):
+        # Muitas operações por BOM, em dois níveis
+        count = 30 * self.scale
+        subassemblies = self._products(count, 'OPS-SUB')
+        vals_list = [
+            self._bom_vals(product, self._products(2, 'OPS-RAW'), operations=20) for product in subassemblies
+        ]
+        tops = self._products(max(1, count // 5), 'OPS')
+        for index, product in enumerate(tops):
+            vals_list.append(self._bom_vals(product, subassemblies[index * 5:index * 5 + 5], operations=20))
+        boms = self.env['mrp.bom'].create(vals_list)
+        return {'boms': boms[count:]}
+
+
+def _query_budget(step, baseline, extra_boms, extra_batches):
+    """Consultas permitidas na escala maior: as medidas na menor mais a folga da etapa"""
+    fixed, per_bom, per_batch = QUERY_GROWTH_BUDGETS[step]
+    return baseline + fixed + per_bom * max(extra_boms, 0) + per_batch * max(extra_batches, 0)
+
+
+def _batches(rows):
+    return int(math.ceil(rows / 1000.0))
+
+
+def _measure(env, function):
+    """Executa function com cache frio e retorna (resultado, segundos, consultas)"""
+    env['base'].flush()
+    env.invalidate_all()
+    cr = env.cr
+    queries_before = cr.sql_log_count
+    started = time.perf_counter()
+    result = function()
+    env['base'].flush()
+    return result, time.perf_counter() - started, cr.sql_log_count - queries_before
+
+
+def run_shape(env, shape, scale=1):
+    """Mede todas as etapas para uma estrutura; retorna uma lista de medições"""
+    structure = SyntheticBomFactory(env, scale=scale).build(shape)
+    boms = structure['boms']
+    wizard = env['cost.report.wizard'].create({
+        'name': 'Benchmark %s' % shape,
+        'bom_ids': [(6, 0, boms.ids)],
+        'parallel_workers': 0,
+    })
+    report = env['cost.report'].create({
+        'name': 'Benchmark %s' % shape,
+        'bom_ids': [(6, 0, boms.ids)],
+        'max_display_levels': wizard.max_display_levels,
+        'include_operations': wizard.include_operations,
+        'include_components': wizard.include_components,
+        'include_taxes': wizard.include_taxes,
+    })
+
+    counter = _CountingSink()
+
+    def write_lines(extra_file=False):
+        report._delete_report_lines()
+        if not extra_file:
+            return report._write_sections(wizard, boms)
+        explosion = wizard._prepare_explosion()
+        sink = ReportLineSink(report, wizard._get_bom_fingerprints(explosion), None)
+        wizard._write_export_file(io.BytesIO(), extra_sinks=[sink], explosion=explosion)
+        return sink
+
+    steps = [
+        ('explosion', lambda: wizard._run_report_sinks([counter])),
+        ('csv_export', lambda: wizard._write_export_file(io.BytesIO())),
+        ('report_lines', lambda: write_lines()),
+        ('csv_and_lines', lambda: write_lines(extra_file=True)),
+    ]
+    measures = []
+    for step, function in steps:
+        _result, seconds, queries = _measure(env, function)
+        measures.append({
+            'step': step,
+            'rows': counter.row_count,
+            'boms': len(boms),
+            'seconds': seconds,
+            'queries': queries,
+        })
+    return measures
+
+
+def run_scaling(env, shape, scale=1):
+    """Compara as consultas de cada etapa nas escalas scale e 2 * scale
+
+    O limite da escala maior é o número de consultas medido na menor mais a
+    folga de QUERY_GROWTH_BUDGETS, proporcional às BOMs principais e aos lotes
+    de linhas acrescentados; os níveis da estrutura não mudam entre as escalas.
+    """
+    small = run_shape(env, shape, scale=scale)
+    large = run_shape(env, shape, scale=2 * scale)
+    results = []
+    for baseline, measure in zip(small, large):
+        budget = _query_budget(
+            measure['step'], baseline['queries'], measure['boms'] - baseline['boms'],
+            _batches(measure['rows']) - _batches(baseline['rows']),
+        )
+        results.append(dict(
+            measure,
+            shape=shape,
+            baseline_rows=baseline['rows'],
+            baseline_queries=baseline['queries'],
+            budget=budget,
+            ok=measure['rows'] > baseline['rows'] and measure['queries'] <= budget,
+        ))
+    return results
+
+
+def run_benchmarks(env, scale=1, shapes=SHAPES):
+    """Executa os benchmarks em um savepoint desfeito ao final"""
+    results = []
+    try:
+        with env.cr.savepoint():
+            for shape in shapes:
+                results += run_scaling(env, shape, scale=scale)
+            raise _Rollback()
+    except _Rollback:
+        pass
+    env.invalidate_all()
+    return results
+
+
+def format_results(results):
+    lines = ['%-11s %-16s %15s %17s %9s %8s  %s' % (
+        'estrutura', 'etapa', 'linhas', 'consultas', 'segundos', 'limite', 'status')]
+    for result in results:
+        lines.append('%-11s %-16s %7d > %5d %8d > %6d %9.3f %8d  %s' % (
+            result['shape'], result['step'], result['baseline_rows'], result['rows'],
+            result['baseline_queries'], result['queries'], result['seconds'], result['budget'],
+            'ok' if result['ok'] else 'ESTOUROU'))
+    return '\n'.join(lines)
+
+
+def main(env, scale=1, shapes=SHAPES, exit_on_failure=True):
+    """Ponto de entrada para o odoo shell"""
+    results = run_benchmarks(env, scale=scale, shapes=shapes)
+    print(format_results(results))
+    failures = [result for result in results if not result['ok']]
+    if failures:
+        _logger.error('Benchmark: %s etapa(s) acima do orçamento de consultas', len(failures))
+        if exit_on_failure:
+            sys.exit(1)
+    return results
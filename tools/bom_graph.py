@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+
+class BomGraph(object):
+    """Índice em memória produto -> BOM usado durante a explosão dos relatórios.
+
+    As BOMs candidatas de todos os componentes de um nível são buscadas em uma
+    única consulta e resolvidas em Python com as mesmas regras do
+    ``mrp.bom._bom_find``: empresa, tipo de BOM e BOM da variante antes da BOM
+    do modelo (ordem ``sequence, product_id``).
+    """
+
+    def __init__(self, env):
+        self.env = env
+        # (product_id, company_id, bom_type) -> mrp.bom (vazio se não houver)
+        self._resolved = {}
+        # Produtos sem BOM em alguma das chaves resolvidas (matérias-primas)
+        self._leaf_product_ids = set()
+        # mrp.bom id -> chaves (produto, empresa, tipo) dos componentes
+        self._children_keys = {}
+
+    def _effective_company_id(self, company_id):
+        """Empresa considerada na busca, igual ao ``_bom_find``"""
+        return company_id or self.env.context.get('company_id') or False
+
+    def _key(self, product, company_id, bom_type):
+        return (product.id, self._effective_company_id(company_id), bom_type or False)
+
+    def load(self, root_boms):
+        """Carrega, nível a nível, todas as BOMs alcançáveis a partir de root_boms"""
+        frontier = root_boms.filtered(lambda bom: bom.id not in self._children_keys)
+        while frontier:
+            pending = {}
+            frontier_keys = set()
+            for bom in frontier:
+                children_keys = self._children_keys[bom.id] = []
+                for line in bom.bom_line_ids:
+                    if not line.product_id:
+                        continue
+                    key = self._key(line.product_id, bom.company_id.id, bom.type)
+                    children_keys.append(key)
+                    frontier_keys.add(key)
+                    if key not in self._resolved:
+                        pending[key] = line.product_id
+            if pending:
+                self._resolve(pending)
+            next_ids = {
+                self._resolved[key].id for key in frontier_keys
+                if self._resolved[key] and self._resolved[key].id not in self._children_keys
+            }
+            frontier = self.env['mrp.bom'].browse(sorted(next_ids))
+        return self
+
+    def _resolve(self, pending):
+        """Resolve em lote as BOMs de um conjunto de chaves (produto, empresa, tipo)"""
+        bom_model = self.env['mrp.bom']
+        products_by_tmpl = defaultdict(set)
+        for product in pending.values():
+            products_by_tmpl[product.product_tmpl_id.id].add(product.id)
+        product_ids = sorted({product.id for product in pending.values()})
+
+        domain = [
+            '|', ('product_id', 'in', product_ids),
+            '&', ('product_id', '=', False), ('product_tmpl_id', 'in', sorted(products_by_tmpl)),
+        ]
+        bom_types = {key[2] for key in pending}
+        if False not in bom_types:
+            domain += [('type', 'in', sorted(bom_types))]
+        candidates = bom_model.search(domain, order='sequence, product_id')
+
+        # Mantém a ordem da busca: é ela que dá prioridade à variante sobre o modelo
+        candidates_by_product = defaultdict(list)
+        for bom in candidates:
+            if bom.product_id:
+                candidates_by_product[bom.product_id.id].append(bom)
+            else:
+                for product_id in products_by_tmpl.get(bom.product_tmpl_id.id, ()):
+                    candidates_by_product[product_id].append(bom)
+
+        for key, product in pending.items():
+            product_id, company_id, bom_type = key
+            found = bom_model
+            if product.type != 'service':
+                for bom in candidates_by_product.get(product_id, ()):
+                    if bom_type and bom.type != bom_type:
+                        continue
+                    if company_id and bom.company_id and bom.company_id.id != company_id:
+                        continue
+                    found = bom
+                    break
+            self._resolved[key] = found
+            if not found:
+                self._leaf_product_ids.add(product_id)
+
+    def find(self, product, company_id=False, bom_type=False):
+        """Equivalente a ``_bom_find`` consultando apenas o índice em memória"""
+        if not product:
+            return self.env['mrp.bom']
+        key = self._key(product, company_id, bom_type)
+        if key not in self._resolved:
+            # Produto fora do grafo pré-carregado: resolve individualmente
+            self._resolve({key: product})
+        return self._resolved[key]
+
+    def bom_ids(self):
+        """Ids de todas as BOMs já carregadas no grafo"""
+        return set(self._children_keys)
+
+    def leaf_product_ids(self):
+        """Ids dos produtos que aparecem como matéria-prima no grafo carregado"""
+        return set(self._leaf_product_ids)
+
+    def closure_bom_ids(self, bom):
+        """Ids da BOM e de todas as sub-BOMs alcançáveis a partir dela"""
+        if bom.id not in self._children_keys:
+            self.load(bom)
+        closure = set()
+        stack = [bom.id]
+        while stack:
+            bom_id = stack.pop()
+            if bom_id in closure:
+                continue
+            closure.add(bom_id)
+            for key in self._children_keys.get(bom_id, ()):
+                child = self._resolved.get(key)
+                if child and child.id not in closure:
+                    if child.id not in self._children_keys:
+                        self.load(child)
+                    stack.append(child.id)
+        return closure
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+
+# Versão do formato gravado na primeira linha do arquivo
+FORMAT_VERSION = 1
+
+
+def write_chunks(binary_file, chunks):
+    """Grava blocos colunares em JSON compactado com gzip, um bloco por linha
+
+    chunks produz (tabela, colunas, linhas); cada bloco guarda uma lista de
+    valores por coluna, o que comprime bem as colunas repetitivas.
+    """
+    with gzip.GzipFile(fileobj=binary_file, mode='wb') as gz_file:
+        gz_file.write(json.dumps({'version': FORMAT_VERSION}).encode('utf-8') + b'\n')
+        for table, columns, rows in chunks:
+            chunk = {
+                'table': table,
+                'columns': list(columns),
+                'values': [list(values) for values in zip(*rows)],
+            }
+            # Colunas numeric chegam como Decimal e voltam convertidas pelo banco
+            gz_file.write(json.dumps(chunk, separators=(',', ':'), default=str).encode('utf-8') + b'\n')
+
+
+def read_chunks(binary_file):
+    """(tabela, colunas, linhas) de cada bloco gravado por write_chunks"""
+    with gzip.GzipFile(fileobj=binary_file, mode='rb') as gz_file:
+        header = json.loads(gz_file.readline() or b'{}')
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError('Formato de arquivo compactado desconhecido: %s' % header.get('version'))
+        for raw_line in gz_file:
+            chunk = json.loads(raw_line)
+            yield chunk['table'], chunk['columns'], list(zip(*chunk['values']))
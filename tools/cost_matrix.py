@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+from odoo import _
+from odoo.exceptions import UserError
+
+from .bom_graph import BomGraph
+from .cost_snapshot import CostSnapshot
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+
+class BomCostMatrix(object):
+    """Custo consolidado de muitas BOMs calculado de uma só vez.
+
+    A estrutura é montada como uma matriz esparsa A (BOM x sub-BOM, com a
+    quantidade do componente) e um vetor b com o custo direto de cada BOM
+    (operações e matérias-primas). O custo consolidado c = b + A·c é
+    acumulado por altura na árvore: primeiro as BOMs sem sub-BOMs, depois
+    as que dependem apenas delas, e assim por diante. Cada altura é um único
+    produto matriz-vetor quando NumPy/SciPy estão disponíveis; sem eles, o
+    mesmo cálculo é feito em Python puro.
+
+    Os valores seguem as mesmas regras da explosão do relatório: custo por
+    lote da BOM (``product_qty``), operações pelo custo/hora do centro de
+    trabalho e matérias-primas pelo custo padrão.
+    """
+
+    def __init__(self, env, include_operations=True, include_components=True, bom_graph=None, snapshot=None):
+        self.env = env
+        self.include_operations = include_operations
+        self.include_components = include_components
+        self.bom_graph = bom_graph or BomGraph(env)
+        self.snapshot = snapshot
+        self._bom_ids = []
+        self._index = {}
+        # Arestas BOM -> sub-BOM: (linha, coluna, quantidade)
+        self._edges = []
+        # Parcelas do custo direto: (linha, produto, quantidade) e (linha, centro, horas)
+        self._component_terms = []
+        self._operation_terms = []
+        self.product_prices = {}
+        self.workcenter_rates = {}
+
+    def load(self, boms):
+        """Monta a matriz para boms e todas as sub-BOMs alcançáveis"""
+        self.bom_graph.load(boms)
+        closure_ids = set()
+        for bom in boms:
+            if bom.id not in closure_ids:
+                closure_ids |= self.bom_graph.closure_bom_ids(bom)
+        self._bom_ids = sorted(closure_ids)
+        self._index = {bom_id: index for index, bom_id in enumerate(self._bom_ids)}
+        self._edges = []
+        self._component_terms = []
+        self._operation_terms = []
+        snapshot = self.snapshot or CostSnapshot(self.env)
+        snapshot.load(self._bom_ids)
+
+        for bom in self.env['mrp.bom'].browse(self._bom_ids):
+            row = self._index[bom.id]
+            if self.include_operations:
+                for operation in bom.operation_ids:
+                    op_time = snapshot.operation_time(operation)
+                    workcenter = operation.workcenter_id
+                    if workcenter and op_time > 0:
+                        self._operation_terms.append((row, workcenter.id, op_time / 60.0))
+                        self.workcenter_rates[workcenter.id] = max(snapshot.workcenter(workcenter.id)[1], 0.0)
+            if self.include_components:
+                for line in bom.bom_line_ids:
+                    sub_bom = self.bom_graph.find(line.product_id, company_id=bom.company_id.id, bom_type=bom.type)
+                    if sub_bom:
+                        self._edges.append((row, self._index[sub_bom.id], line.product_qty))
+                    elif line.product_id:
+                        self._component_terms.append((row, line.product_id.id, line.product_qty))
+                        self.product_prices[line.product_id.id] = snapshot.product(line.product_id.id)[2]
+        return self
+
+    def bom_ids(self):
+        """BOMs da matriz (selecionadas e sub-BOMs)"""
+        return list(self._bom_ids)
+
+    def _direct_costs(self, scenarios):
+        """Custo direto de cada BOM por cenário: lista de linhas com uma coluna por cenário"""
+        size = len(self._bom_ids)
+        columns = []
+        for scenario in scenarios:
+            prices = dict(self.product_prices)
+            prices.update(scenario.get('product_prices') or {})
+            rates = dict(self.workcenter_rates)
+            rates.update(scenario.get('workcenter_rates') or {})
+            column = [0.0] * size
+            for row, workcenter_id, hours in self._operation_terms:
+                column[row] += hours * rates[workcenter_id]
+            for row, product_id, qty in self._component_terms:
+                column[row] += qty * prices[product_id]
+            columns.append(column)
+        return [list(values) for values in zip(*columns)] if columns else [[] for _row in range(size)]
+
+    def _heights(self):
+        """Agrupa as BOMs por altura (0 = sem sub-BOMs); rejeita estruturas cíclicas"""
+        size = len(self._bom_ids)
+        parents = defaultdict(list)
+        pending_children = [0] * size
+        for row, col, _qty in self._edges:
+            parents[col].append(row)
+            pending_children[row] += 1
+
+        current = [index for index in range(size) if not pending_children[index]]
+        levels = []
+        done = 0
+        while current:
+            levels.append(current)
+            done += len(current)
+            following = []
+            for col in current:
+                for row in parents[col]:
+                    pending_children[row] -= 1
+                    if not pending_children[row]:
+                        following.append(row)
+            current = following
+
+        if done < size:
+            cyclic = self.env['mrp.bom'].browse(
+                [self._bom_ids[index] for index in range(size) if pending_children[index]][:5]
+            )
+            raise UserError(_('Estrutura cíclica detectada envolvendo as BOMs: %s')
+                            % ', '.join(cyclic.mapped('display_name')))
+        return levels
+
+    def solve(self):
+        """Retorna {mrp.bom id: custo consolidado do lote da BOM}"""
+        return self.solve_scenarios([{}])[0]
+
+    def solve_scenarios(self, scenarios):
+        """Resolve vários cenários de preço de uma só vez
+
+        Cada cenário é um dicionário com ``product_prices`` ({produto: custo})
+        e ``workcenter_rates`` ({centro de trabalho: custo/hora}) substituindo
+        os valores atuais, que não são alterados. Retorna, para cada cenário,
+        {mrp.bom id: custo consolidado}.
+        """
+        levels = self._heights()
+        direct_costs = self._direct_costs(scenarios)
+        if numpy is not None:
+            costs = self._solve_sparse(levels, direct_costs, len(scenarios))
+        else:
+            costs = self._solve_python(levels, direct_costs)
+        return [
+            dict(zip(self._bom_ids, (row[column] for row in costs)))
+            for column in range(len(scenarios))
+        ]
+
+    def _solve_sparse(self, levels, direct_costs, scenario_count):
+        size = len(self._bom_ids)
+        costs = numpy.array(direct_costs, dtype=float).reshape(size, scenario_count)
+        if not self._edges:
+            return costs.tolist()
+        rows, cols, quantities = zip(*self._edges)
+        # Componentes repetidos na mesma BOM são somados na conversão para CSR
+        matrix = sparse.csr_matrix((quantities, (rows, cols)), shape=(size, size), dtype=float)
+        for level in levels[1:]:
+            level_rows = numpy.array(level)
+            costs[level_rows] += matrix[level_rows].dot(costs)
+        return costs.tolist()
+
+    def _solve_python(self, levels, direct_costs):
+        costs = [list(row) for row in direct_costs]
+        children = defaultdict(list)
+        for row, col, qty in self._edges:
+            children[row].append((col, qty))
+        for level in levels[1:]:
+            for row in level:
+                row_costs = costs[row]
+                for col, qty in children[row]:
+                    for column, child_cost in enumerate(costs[col]):
+                        row_costs[column] += qty * child_cost
+        return costs
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# Rótulos dos tipos de linha, como aparecem nos arquivos exportados
+LINE_TYPE_LABELS = {
+    'produto_principal': 'Produto Principal',
+    'subconjunto': 'Subconjunto',
+    'operacao': 'Operação',
+    'componente': 'Componente',
+}
+
+# Quantidade máxima de níveis gravados em cost.report.line
+STORED_LEVELS = 10
+
+
+class CostRow(object):
+    """Uma linha do relatório de custo, com os valores sem formatação.
+
+    Os campos têm os mesmos nomes de cost.report.line; valores que não se
+    aplicam ao tipo da linha (ex.: quantidade de uma operação) ficam em None.
+    ``levels`` traz as colunas de nível já montadas, ``operation_time`` está
+    em minutos e ``depth`` é a profundidade do item na árvore (0 para a BOM
+    principal).
+    """
+    __slots__ = (
+        'bom_main_code', 'item_code', 'levels', 'bom_reference', 'item_qty', 'uom_name',
+        'unit_cost', 'total_cost', 'purchase_taxes', 'line_type', 'operation_name',
+        'workcenter_name', 'operation_time', 'operation_cost', 'depth',
+    )
+
+    def __init__(self, bom_main_code, item_code, levels, line_type, depth, bom_reference='',
+                 item_qty=None, uom_name='', unit_cost=None, total_cost=None, purchase_taxes='',
+                 operation_name='', workcenter_name='', operation_time=None, operation_cost=None):
+        self.bom_main_code = bom_main_code
+        self.item_code = item_code
+        self.levels = levels
+        self.line_type = line_type
+        self.depth = depth
+        self.bom_reference = bom_reference
+        self.item_qty = item_qty
+        self.uom_name = uom_name
+        self.unit_cost = unit_cost
+        self.total_cost = total_cost
+        self.purchase_taxes = purchase_taxes
+        self.operation_name = operation_name
+        self.workcenter_name = workcenter_name
+        self.operation_time = operation_time
+        self.operation_cost = operation_cost
+
+    def values(self):
+        """Valores na ordem das colunas do relatório (ver _get_report_header)"""
+        return [self.bom_main_code, self.item_code] + list(self.levels) + [
+            self.bom_reference,
+            self.item_qty,
+            self.uom_name,
+            self.unit_cost,
+            self.total_cost,
+            self.purchase_taxes,
+            LINE_TYPE_LABELS[self.line_type],
+            self.operation_name,
+            self.workcenter_name,
+            self.operation_time,
+            self.operation_cost,
+        ]
+
+    def to_line_vals(self):
+        """Valores para cost.report.line._bulk_create (sem relatório, seção e sequência)"""
+        vals = {
+            'bom_main_code': self.bom_main_code,
+            'item_code': self.item_code,
+            'bom_reference': self.bom_reference,
+            'item_qty': self.item_qty or 0.0,
+            'uom_name': self.uom_name,
+            'unit_cost': self.unit_cost or 0.0,
+            'total_cost': self.total_cost or 0.0,
+            'purchase_taxes': self.purchase_taxes,
+            'line_type': self.line_type,
+            'operation_name': self.operation_name,
+            'workcenter_name': self.workcenter_name,
+            'operation_cost': self.operation_cost or 0.0,
+            'depth': self.depth,
+        }
+        for index, level in enumerate(self.levels[:STORED_LEVELS], 1):
+            vals['level_%s' % index] = level
+        return vals
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from .operation_times import get_actual_operation_times
+
+
+class CostSnapshot(object):
+    """Atributos de produtos, unidades e centros de trabalho usados em uma execução.
+
+    Todos os ids das BOMs do grafo são lidos em poucas leituras em lote e os
+    valores ficam em dicionários por id durante a explosão, sem depender do
+    prefetch dos registros. O snapshot pode ser exportado (``to_data``) e
+    restaurado (``from_data``) para regenerar um relatório com os valores da
+    época; ids ausentes do snapshot restaurado são lidos dos cadastros atuais.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        # id -> (default_code, name, standard_price)
+        self.products = {}
+        self.templates = {}
+        # id -> nome
+        self.uom_names = {}
+        # id -> (name, costs_hour)
+        self.workcenters = {}
+        # mrp.routing.workcenter id -> minutos reais por unidade; None usa os tempos padrão
+        self.operation_times = None
+        # Indica que algum valor foi lido dos cadastros depois da restauração
+        self.changed = False
+
+    @classmethod
+    def from_data(cls, env, data):
+        """Restaura um snapshot exportado por to_data"""
+        snapshot = cls(env)
+        snapshot.products = {row[0]: tuple(row[1:]) for row in data.get('products', ())}
+        snapshot.templates = {row[0]: tuple(row[1:]) for row in data.get('templates', ())}
+        snapshot.uom_names = {row[0]: row[1] for row in data.get('uoms', ())}
+        snapshot.workcenters = {row[0]: tuple(row[1:]) for row in data.get('workcenters', ())}
+        if 'operation_times' in data:
+            snapshot.operation_times = {row[0]: row[1] for row in data['operation_times']}
+        return snapshot
+
+    def to_data(self):
+        """Valores serializáveis em JSON (listas de linhas com o id na primeira posição)"""
+        data = {
+            'products': [[record_id] + list(values) for record_id, values in sorted(self.products.items())],
+            'templates': [[record_id] + list(values) for record_id, values in sorted(self.templates.items())],
+            'uoms': [[record_id, name] for record_id, name in sorted(self.uom_names.items())],
+            'workcenters': [[record_id] + list(values) for record_id, values in sorted(self.workcenters.items())],
+        }
+        if self.operation_times is not None:
+            data['operation_times'] = [
+                [record_id, minutes] for record_id, minutes in sorted(self.operation_times.items())
+            ]
+        return data
+
+    def load(self, bom_ids, time_window=0, time_ttl=0):
+        """Lê de uma vez os atributos de tudo que as BOMs informadas referenciam
+
+        Com ``time_window`` (dias) também carrega os tempos reais das operações.
+        """
+        if not time_window:
+            self.operation_times = None
+        if not bom_ids:
+            return self
+        bom_ids = tuple(sorted(bom_ids))
+        self.env['mrp.bom'].flush(['product_id', 'product_tmpl_id', 'product_uom_id'])
+        self.env['mrp.bom.line'].flush(['bom_id', 'product_id', 'product_uom_id'])
+        self.env['mrp.routing.workcenter'].flush(['bom_id', 'workcenter_id'])
+        cr = self.env.cr
+        cr.execute("SELECT product_id, product_tmpl_id, product_uom_id FROM mrp_bom WHERE id IN %s", (bom_ids,))
+        bom_rows = cr.fetchall()
+        cr.execute("SELECT product_id, product_uom_id FROM mrp_bom_line WHERE bom_id IN %s", (bom_ids,))
+        line_rows = cr.fetchall()
+        cr.execute("SELECT id, workcenter_id FROM mrp_routing_workcenter WHERE bom_id IN %s", (bom_ids,))
+        operation_rows = cr.fetchall()
+
+        self.preload(
+            product_ids={row[0] for row in bom_rows} | {row[0] for row in line_rows},
+            template_ids={row[1] for row in bom_rows if not row[0]},
+            uom_ids={row[2] for row in bom_rows} | {row[1] for row in line_rows},
+            workcenter_ids={row[1] for row in operation_rows},
+        )
+        if time_window:
+            self.preload_operation_times({row[0] for row in operation_rows}, time_window, time_ttl)
+        return self
+
+    def preload_operation_times(self, operation_ids, time_window, time_ttl):
+        """Tempos reais das operações ainda ausentes, em uma consulta agrupada (com cache por TTL)"""
+        if self.operation_times is None:
+            self.operation_times = {}
+        missing_ids = {operation_id for operation_id in operation_ids if operation_id not in self.operation_times}
+        found = get_actual_operation_times(self.env, missing_ids, time_window, time_ttl)
+        if found:
+            self.changed = True
+            self.operation_times.update(found)
+
+    def preload(self, product_ids=(), template_ids=(), uom_ids=(), workcenter_ids=()):
+        """Lê em lote os ids ainda ausentes do snapshot"""
+        self._read_missing('product.product', self.products, product_ids, ['default_code', 'name', 'standard_price'])
+        self._read_missing('product.template', self.templates, template_ids, ['default_code', 'name', 'standard_price'])
+        self._read_missing('uom.uom', self.uom_names, uom_ids, ['name'])
+        self._read_missing('mrp.workcenter', self.workcenters, workcenter_ids, ['name', 'costs_hour'])
+
+    def _read_missing(self, model_name, values_by_id, record_ids, field_names):
+        missing_ids = sorted(record_id for record_id in record_ids if record_id and record_id not in values_by_id)
+        if not missing_ids:
+            return
+        self.changed = True
+        # read() calcula os campos dependentes da empresa (standard_price) para todos os ids de uma vez
+        for values in self.env[model_name].browse(missing_ids).read(field_names):
+            if len(field_names) == 1:
+                values_by_id[values['id']] = values[field_names[0]]
+            else:
+                values_by_id[values['id']] = tuple(values[name] for name in field_names)
+
+    def product(self, product_id):
+        """(default_code, name, standard_price) de um product.product"""
+        if product_id not in self.products:
+            self.preload(product_ids=[product_id])
+        return self.products.get(product_id, (False, False, 0.0))
+
+    def template(self, template_id):
+        """(default_code, name, standard_price) de um product.template"""
+        if template_id not in self.templates:
+            self.preload(template_ids=[template_id])
+        return self.templates.get(template_id, (False, False, 0.0))
+
+    def uom_name(self, uom_id):
+        if uom_id not in self.uom_names:
+            self.preload(uom_ids=[uom_id])
+        return self.uom_names.get(uom_id, '')
+
+    def operation_time(self, operation):
+        """Minutos por unidade: o tempo real médio quando carregado, senão o tempo padrão"""
+        if self.operation_times and operation.id in self.operation_times:
+            return self.operation_times[operation.id]
+        return float(operation.time_cycle_manual or operation.time_cycle or 0.0)
+
+    def workcenter(self, workcenter_id):
+        """(name, costs_hour) de um centro de trabalho"""
+        if workcenter_id not in self.workcenters:
+            self.preload(workcenter_ids=[workcenter_id])
+        return self.workcenters.get(workcenter_id, ('', 0.0))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from datetime import timedelta
+
+from odoo import fields
+
+# (banco, janela em dias) -> {operação: (minutos por unidade ou None, validade)}
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_actual_operation_times(env, operation_ids, window_days, ttl):
+    """Tempo real médio (minutos por unidade produzida) das operações informadas
+
+    Calculado com uma única consulta agrupada sobre as ordens de trabalho
+    concluídas nos últimos ``window_days`` dias. Os valores ficam em cache no
+    processo por ``ttl`` segundos; apenas operações ausentes ou vencidas são
+    consultadas. Operações sem histórico não aparecem no resultado.
+    """
+    operation_ids = {operation_id for operation_id in operation_ids if operation_id}
+    if not operation_ids:
+        return {}
+    now = time.monotonic()
+    key = (env.cr.dbname, window_days)
+    with _cache_lock:
+        entries = _cache.setdefault(key, {})
+        missing_ids = sorted(
+            operation_id for operation_id in operation_ids
+            if operation_id not in entries or entries[operation_id][1] <= now
+        )
+
+    if missing_ids:
+        env['mrp.workorder'].flush(['operation_id', 'state', 'date_finished', 'duration', 'qty_produced'])
+        env.cr.execute("""
+            SELECT operation_id, SUM(duration) / SUM(qty_produced)
+              FROM mrp_workorder
+             WHERE operation_id IN %s
+               AND state = 'done'
+               AND date_finished >= %s
+               AND qty_produced > 0
+             GROUP BY operation_id
+        """, (tuple(missing_ids), fields.Datetime.now() - timedelta(days=window_days)))
+        found = dict(env.cr.fetchall())
+        expires_at = now + ttl
+        with _cache_lock:
+            for operation_id in missing_ids:
+                entries[operation_id] = (found.get(operation_id), expires_at)
+
+    with _cache_lock:
+        return {
+            operation_id: entries[operation_id][0]
+            for operation_id in operation_ids
+            if entries.get(operation_id, (None,))[0] is not None
+        }
+
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# Executado com runpy.run_path no início dos processos filhos de
+# parallel_explosion. Um interpretador iniciado com "spawn" não conhece a
+# configuração do servidor nem o addons_path, necessários para importar o
+# módulo do addon. Recebe por init_globals SERVER_OPTIONS, WORKER_MODULE e
+# WORKER_ARGS; não é importado pelo pacote tools.
+import importlib
+
+import odoo.modules.module
+import odoo.netsvc
+import odoo.tools
+
+odoo.tools.config.options.update(SERVER_OPTIONS)  # noqa: F821
+odoo.netsvc.init_logger()
+odoo.modules.module.initialize_sys_path()
+importlib.import_module(WORKER_MODULE)._run_worker(*WORKER_ARGS)  # noqa: F821
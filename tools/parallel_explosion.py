@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+import multiprocessing
+import os
+import queue as queue_module
+import resource
+import runpy
+import signal
+
+import odoo
+from odoo import _, api
+from odoo.exceptions import UserError
+
+from .cost_snapshot import CostSnapshot
+
+_logger = logging.getLogger(__name__)
+
+# Script executado por runpy no início de cada processo filho
+_BOOTSTRAP_PATH = os.path.join(os.path.dirname(__file__), 'parallel_bootstrap.py')
+# Linhas (CostRow) por mensagem devolvida ao processo pai
+_BATCH_ROWS = 500
+# Mensagens pendentes por processo filho antes que ele espere o pai consumi-las
+_QUEUE_BATCHES = 4
+# Intervalo, em segundos, para verificar se o filho ainda está vivo
+_POLL_SECONDS = 5
+
+
+def _iter_batches(rows):
+    """Agrupa as linhas em listas de no máximo _BATCH_ROWS"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= _BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _run_worker(dbname, snapshot_id, uid, context, cost_data, wizard_vals, chunks, result_queue):
+    """Explode, em ordem, os lotes de BOMs recebidos pelo processo filho
+
+    Chamado pelo script de inicialização com a configuração do servidor já
+    carregada. Para cada BOM, envia ('rows', lote) até ('end', None);
+    uma falha interrompe o filho com ('error', mensagem).
+    """
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, signal.SIG_DFL)
+    # Mesmo limite de memória aplicado pelo servidor aos seus workers
+    if odoo.tools.config['limit_memory_hard']:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (odoo.tools.config['limit_memory_hard'], hard))
+    try:
+        registry = odoo.registry(dbname)
+        with api.Environment.manage(), registry.cursor() as cr:
+            cr.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+            cr.execute("SET TRANSACTION READ ONLY")
+            env = api.Environment(cr, uid, context)
+            snapshot = CostSnapshot.from_data(env, cost_data) if cost_data else None
+            for bom_ids in chunks:
+                # BOMs do mesmo lote compartilham o memo de sub-BOMs
+                wizard = env['cost.report.wizard'].new(dict(wizard_vals, bom_ids=[(6, 0, bom_ids)]))
+                explosion = wizard._prepare_explosion(snapshot=snapshot)
+                for bom in wizard.bom_ids:
+                    for batch in _iter_batches(wizard._iter_bom_rows(bom, explosion)):
+                        result_queue.put(('rows', batch))
+                    result_queue.put(('end', None))
+            cr.rollback()
+    except Exception as error:
+        _logger.exception("Falha ao explodir BOMs no processo filho")
+        message = error.args[0] if isinstance(error, UserError) else repr(error)
+        result_queue.put(('error', message))
+
+
+def _iter_worker_rows(process, result_queue):
+    """Linhas de uma BOM, lidas lote a lote da fila do processo filho"""
+    while True:
+        try:
+            kind, payload = result_queue.get(timeout=_POLL_SECONDS)
+        except queue_module.Empty:
+            if not process.is_alive():
+                raise UserError(_('O processo paralelo de explosão das BOMs terminou inesperadamente '
+                                  '(código %s).') % process.exitcode)
+            continue
+        if kind == 'end':
+            return
+        if kind == 'error':
+            raise UserError(payload)
+        yield from payload
+
+
+def explode_boms_in_parallel(wizard, boms, workers, snapshot=None):
+    """Distribui as BOMs principais informadas entre processos filhos
+
+    Os filhos são iniciados do zero (``spawn``), sem herdar conexões, locks ou
+    memória do servidor: cada um carrega seu próprio registro e lê o mesmo
+    snapshot do processo pai (``pg_export_snapshot``), somente leitura.
+    Gera pares (bom, linhas) na ordem original de ``boms``; as linhas voltam
+    em lotes por filas limitadas, de modo que um filho à frente do consumo
+    espera em vez de acumular a árvore inteira em memória.
+    Os valores do CostSnapshot do pai, quando informado, são herdados pelos filhos.
+    """
+    cr = wizard.env.cr
+    cr.execute("SELECT pg_export_snapshot()")
+    snapshot_id = cr.fetchone()[0]
+
+    wizard_vals = {
+        'name': wizard.name,
+        'max_display_levels': wizard.max_display_levels,
+        'include_operations': wizard.include_operations,
+        'include_components': wizard.include_components,
+        'include_taxes': wizard.include_taxes,
+        'operation_time_source': wizard.operation_time_source,
+        'actual_time_days': wizard.actual_time_days,
+    }
+    bom_ids = boms.ids
+    # Lotes menores que a divisão exata equilibram árvores de tamanhos diferentes
+    chunk_size = max(1, int(math.ceil(len(bom_ids) / float(workers * 2))))
+    chunks = [bom_ids[index:index + chunk_size] for index in range(0, len(bom_ids), chunk_size)]
+    workers = min(workers, len(chunks))
+
+    _logger.info("Explodindo %s BOMs em %s processos (%s lotes)", len(bom_ids), workers, len(chunks))
+    boms_by_id = {bom.id: bom for bom in boms}
+    cost_data = snapshot.to_data() if snapshot else None
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    try:
+        # Os lotes são distribuídos em rodízio; cada filho tem sua própria fila,
+        # lida pelo pai na mesma ordem dos lotes
+        for index in range(workers):
+            result_queue = context.Queue(_QUEUE_BATCHES)
+            worker_args = (cr.dbname, snapshot_id, wizard.env.uid, dict(wizard.env.context),
+                           cost_data, wizard_vals, chunks[index::workers], result_queue)
+            process = context.Process(
+                target=runpy.run_path,
+                args=(_BOOTSTRAP_PATH,),
+                kwargs={'init_globals': {
+                    'SERVER_OPTIONS': dict(odoo.tools.config.options),
+                    'WORKER_MODULE': __name__,
+                    'WORKER_ARGS': worker_args,
+                }},
+                daemon=True,
+            )
+            process.start()
+            processes.append((process, result_queue))
+
+        for index, chunk in enumerate(chunks):
+            process, result_queue = processes[index % workers]
+            for bom_id in chunk:
+                rows = _iter_worker_rows(process, result_queue)
+                yield boms_by_id[bom_id], rows
+                # Descarta o que o consumidor não leu para manter a fila alinhada
+                for _row in rows:
+                    pass
+    finally:
+        for process, result_queue in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
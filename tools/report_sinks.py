@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Destinos das linhas do relatório de custo.
+
+Uma única explosão alimenta todos os destinos da mesma execução
+(ver ``cost.report.wizard._run_report_sinks``). Cada destino recebe, em
+ordem: ``start(header)``, para cada BOM principal ``begin_bom(bom)``, as
+linhas (``CostRow``) em ``write_row(row)`` e ``end_bom(bom)``, e por fim
+``close()``.
+"""
+import csv
+import io
+
+from odoo import _
+from odoo.exceptions import UserError
+
+from .run_recorder import RunRecorder
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# Limite de linhas de uma planilha do Excel
+XLSX_MAX_ROWS = 1048576
+# Níveis de agrupamento (outline) suportados pelo Excel
+XLSX_MAX_OUTLINE_LEVEL = 7
+
+
+class ReportSink(object):
+    """Destino base: não faz nada"""
+
+    # Fase do RunRecorder em que o trabalho do destino é contabilizado
+    phase = 'serialization'
+
+    def start(self, header):
+        pass
+
+    def begin_bom(self, bom):
+        pass
+
+    def write_row(self, row):
+        pass
+
+    def end_bom(self, bom):
+        pass
+
+    def close(self):
+        pass
+
+
+class _FileSink(ReportSink):
+    """Base dos arquivos exportados, com a posição de cada coluna de valores"""
+
+    def __init__(self, wizard, binary_file):
+        self.wizard = wizard
+        self.binary_file = binary_file
+        self._detail_start = 2 + wizard.max_display_levels
+        self._bom_count = 0
+
+    def _quantity_columns(self):
+        return [self._detail_start + 1]
+
+    def _money_columns(self):
+        return [self._detail_start + 3, self._detail_start + 4, self._detail_start + 10]
+
+    def _time_column(self):
+        return self._detail_start + 9
+
+
+class CsvSink(_FileSink):
+    """CSV separado por ponto e vírgula, com a formatação brasileira"""
+
+    def start(self, header):
+        self._text_file = io.TextIOWrapper(self.binary_file, encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._text_file, delimiter=';', quoting=csv.QUOTE_ALL)
+        self._writer.writerow(header)
+        self._blank_row = [''] * len(header)
+        # Um formatador por coluna, definido uma única vez
+        self._formatters = [None] * len(header)
+        for col in self._quantity_columns() + self._money_columns():
+            self._formatters[col] = self.wizard._format_float
+        self._formatters[self._time_column()] = self.wizard._format_duration
+
+    def begin_bom(self, bom):
+        # Linha em branco separando as BOMs principais
+        if self._bom_count:
+            self._writer.writerow(self._blank_row)
+        self._bom_count += 1
+
+    def format_row(self, row):
+        return [
+            '' if value is None else formatter(value) if formatter else value
+            for value, formatter in zip(row.values(), self._formatters)
+        ]
+
+    def write_row(self, row):
+        self._writer.writerow(self.format_row(row))
+
+    def close(self):
+        self._text_file.flush()
+        self._text_file.detach()
+
+
+class XlsxSink(_FileSink):
+    """Planilha do Excel gravada linha a linha (modo de memória constante)
+
+    Números e tempos ficam como células numéricas e a profundidade de cada
+    linha vira o nível de agrupamento. O Excel suporta no máximo 7 níveis; os
+    mais profundos ficam no sétimo.
+    """
+
+    def start(self, header):
+        if xlsxwriter is None:
+            raise UserError(_('A biblioteca xlsxwriter não está instalada; exporte em CSV.'))
+        self._workbook = xlsxwriter.Workbook(self.binary_file, {'constant_memory': True})
+        self._worksheet = self._workbook.add_worksheet(_('Custos'))
+        # Os grupos ficam abaixo da linha da BOM, não acima
+        self._worksheet.outline_settings(True, False, True, False)
+        header_format = self._workbook.add_format({'bold': True, 'bg_color': '#D9D9D9', 'border': 1})
+        self._worksheet.write_row(0, 0, header, header_format)
+        self._worksheet.freeze_panes(1, 0)
+        self._worksheet.set_column(0, self._detail_start - 1, 18)
+        self._worksheet.set_column(self._detail_start, len(header) - 1, 14)
+
+        # Um formato por coluna, criado uma única vez
+        money = self._workbook.add_format({'num_format': '#,##0.00'})
+        quantity = self._workbook.add_format({'num_format': '#,##0.00##'})
+        self._formats = [None] * len(header)
+        for col in self._quantity_columns():
+            self._formats[col] = quantity
+        for col in self._money_columns():
+            self._formats[col] = money
+        self._formats[self._time_column()] = self._workbook.add_format({'num_format': '[h]:mm:ss'})
+        self._row_index = 0
+
+    def begin_bom(self, bom):
+        if self._bom_count:
+            self._row_index += 1
+        self._bom_count += 1
+
+    def write_row(self, row):
+        self._row_index += 1
+        if self._row_index >= XLSX_MAX_ROWS:
+            raise UserError(_('O relatório ultrapassa o limite de linhas do Excel (%s); exporte em CSV.')
+                            % XLSX_MAX_ROWS)
+        worksheet = self._worksheet
+        row_index = self._row_index
+        depth = min(row.depth, XLSX_MAX_OUTLINE_LEVEL)
+        if depth:
+            worksheet.set_row(row_index, None, None, {'level': depth})
+        time_col = self._time_column()
+        for col, value in enumerate(row.values()):
+            if value is None or value == '':
+                continue
+            if isinstance(value, str):
+                worksheet.write_string(row_index, col, value)
+                continue
+            if col == time_col:
+                # O Excel representa durações em dias
+                value = value / 1440.0
+            worksheet.write_number(row_index, col, value, self._formats[col])
+
+    def close(self):
+        self._workbook.close()
+
+
+class ReportLineSink(ReportSink):
+    """Grava as linhas em cost.report.line, em uma seção por BOM principal
+
+    As linhas são inseridas em lotes de ``_report_line_chunk_size``; os totais
+    do relatório devem ser recalculados pelo chamador ao final.
+    """
+
+    phase = 'insertion'
+
+    def __init__(self, report, fingerprints=None, recorder=None):
+        report.ensure_one()
+        self.report = report
+        self.fingerprints = fingerprints or {}
+        self.recorder = recorder or RunRecorder(report.env.cr)
+        # Seções gravadas por id da BOM principal
+        self.sections = {}
+        self.line_count = 0
+        self._line_model = report.env['cost.report.line']
+        self._path_cache = {}
+        self._parent_stacks = {}
+        self._chunk = []
+        self._section = None
+        self._sequence = 0
+
+    def begin_bom(self, bom):
+        self._section = self.report._create_section(bom, self.fingerprints.get(bom.id))
+        self.report.flush()
+        self._sequence = 0
+
+    def write_row(self, row):
+        self._sequence += 1
+        vals = row.to_line_vals()
+        vals.update({
+            'operation_time': self.report._format_operation_time(row.operation_time),
+            'report_id': self.report.id,
+            'section_id': self._section.id,
+            'section_sequence': self._section.sequence,
+            'sequence': self._sequence,
+        })
+        self._chunk.append(vals)
+        if len(self._chunk) >= self.report._report_line_chunk_size:
+            self._flush()
+
+    def end_bom(self, bom):
+        self._flush()
+        self._section.line_count = self._sequence
+        self.sections[bom.id] = self._section
+        self.line_count += self._sequence
+
+    def _flush(self):
+        if not self._chunk:
+            return
+        with self.recorder.phase('insertion'):
+            self._line_model._bulk_create(self._chunk, self._path_cache, self._parent_stacks)
+        self._chunk = []
+
+    def close(self):
+        self.report.invalidate_cache(['line_ids'], self.report.ids)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import cProfile
+import heapq
+import marshal
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class RunRecorder(object):
+    """Coleta as métricas de uma execução de relatório ou exportação.
+
+    Os tempos de cada fase são tempos próprios: o tempo de uma fase aninhada
+    (ex.: explosão consumida durante a inserção) é descontado da fase externa.
+    """
+
+    PHASES = ('resolution', 'explosion', 'taxes', 'insertion', 'aggregation', 'serialization')
+
+    def __init__(self, cr, profile=False, slowest_limit=10):
+        self.cr = cr
+        self.slowest_limit = slowest_limit
+        self.phase_times = defaultdict(float)
+        self.row_count = 0
+        self.peak_bom_rows = 0
+        # (BOM, segundos, linhas) por BOM principal, na ordem de processamento
+        self.bom_timings = []
+        # Heap com as sub-BOMs mais lentas: (segundos, id da BOM)
+        self._slowest_subtrees = []
+        self._stack = []
+        self._profiler = cProfile.Profile() if profile else None
+        self._started = time.perf_counter()
+        self._queries_start = cr.sql_log_count
+        self.duration = 0.0
+        self.query_count = 0
+        if self._profiler:
+            self._profiler.enable()
+
+    def _enter(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def _exit(self):
+        name, started, nested = self._stack.pop()
+        elapsed = time.perf_counter() - started
+        self.phase_times[name] += elapsed - nested
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    @contextmanager
+    def phase(self, name):
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def iter_bom_rows(self, bom, rows):
+        """Repassa as linhas de uma BOM principal medindo a explosão e a duração total"""
+        started = time.perf_counter()
+        bom_rows = 0
+        rows = iter(rows)
+        while True:
+            self._enter('explosion')
+            try:
+                row = next(rows)
+            except StopIteration:
+                break
+            finally:
+                self._exit()
+            bom_rows += 1
+            yield row
+        self.row_count += bom_rows
+        self.peak_bom_rows = max(self.peak_bom_rows, bom_rows)
+        self.bom_timings.append((bom, time.perf_counter() - started, bom_rows))
+
+    def subtree_done(self, bom, seconds):
+        """Registra o tempo de cálculo de uma sub-BOM, mantendo apenas as mais lentas"""
+        item = (seconds, bom.id)
+        if len(self._slowest_subtrees) < self.slowest_limit:
+            heapq.heappush(self._slowest_subtrees, item)
+        elif item > self._slowest_subtrees[0]:
+            heapq.heapreplace(self._slowest_subtrees, item)
+
+    def slowest_subtrees(self):
+        return sorted(self._slowest_subtrees, reverse=True)
+
+    def finish(self):
+        """Encerra a coleta; pode ser chamado mais de uma vez"""
+        if self._profiler:
+            self._profiler.disable()
+        self.duration = time.perf_counter() - self._started
+        self.query_count = self.cr.sql_log_count - self._queries_start
+        return self
+
+    def get_profile_data(self):
+        """Estatísticas do cProfile no formato de ``pstats``/``dump_stats``"""
+        if not self._profiler:
+            return None
+        self._profiler.create_stats()
+        return marshal.dumps(self._profiler.stats)
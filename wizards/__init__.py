@@ -1 +1,2 @@
 from . import cost_report_wizard
+from . import custom_bom_import_wizard
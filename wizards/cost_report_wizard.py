@@ -1,9 +1,75 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
-import base64
-import csv
-from io import StringIO
+import hashlib
+import io
+import time
+from datetime import timedelta
+
+from ..tools.attachments import create_streamed_attachment
+from ..tools.bom_graph import BomGraph
+from ..tools.cost_matrix import BomCostMatrix
+from ..tools.cost_row import CostRow
+from ..tools.cost_snapshot import CostSnapshot
+from ..tools.parallel_explosion import explode_boms_in_parallel
+from ..tools.report_sinks import CsvSink, ReportLineSink, XlsxSink
+from ..tools.run_recorder import RunRecorder
+
+
+class _ExplosionFrame(object):
+    """BOM em processamento na pilha da explosão"""
+    __slots__ = ('bom', 'rollup', 'comp_lines', 'position', 'pending_qty', 'started')
+
+    def __init__(self, bom, rollup, include_components):
+        self.bom = bom
+        self.rollup = rollup
+        self.comp_lines = bom.bom_line_ids if include_components else ()
+        self.position = 0
+        # Quantidade do componente cuja sub-BOM está sendo explodida
+        self.pending_qty = 0.0
+        self.started = time.perf_counter()
+
+    def add_sub_assembly(self, qty, child_rollup):
+        self.rollup['components'].append(('subconjunto', qty, child_rollup))
+        self.rollup['cost'] += qty * child_rollup['cost']
+
+
+class _PathNode(object):
+    """Colunas de nível compartilhadas por todos os itens de um mesmo pai"""
+    __slots__ = ('columns', 'depth')
+
+    def __init__(self, columns, depth):
+        self.columns = columns
+        self.depth = depth
+
+
+def _root_path_node(parent_names_path, max_levels):
+    columns = [''] * max_levels
+    for i, name in enumerate(parent_names_path[:max_levels]):
+        columns[i] = name
+    return _PathNode(tuple(columns), len(parent_names_path))
+
+
+def _child_path_node(path_node, item_name, max_levels):
+    if path_node.depth < max_levels:
+        columns = path_node.columns[:path_node.depth] + (item_name,) + path_node.columns[path_node.depth + 1:]
+    else:
+        # Além do último nível exibido o prefixo não muda
+        columns = path_node.columns
+    return _PathNode(columns, path_node.depth + 1)
+
+
+def _level_columns(path_node, item_name, max_levels):
+    """Colunas de nível de um item cujo pai é path_node"""
+    level_columns = list(path_node.columns)
+    if path_node.depth < max_levels:
+        level_columns[path_node.depth] = item_name
+    elif max_levels > 0:
+        if level_columns[max_levels - 1]:
+            level_columns[max_levels - 1] += " > " + item_name
+        else:
+            level_columns[max_levels - 1] = item_name
+    return level_columns
 
 
 class CostReportWizard(models.TransientModel):
@@ -16,17 +82,55 @@ class CostReportWizard(models.TransientModel):
     include_operations = fields.Boolean(string='Incluir Operações', default=True)
     include_components = fields.Boolean(string='Incluir Componentes', default=True)
     include_taxes = fields.Boolean(string='Incluir Taxas de Compra', default=True)
+    catalog_rollup = fields.Boolean(
+        string='Somente Custo Consolidado',
+        help='Calcula o custo de todas as BOMs selecionadas de uma só vez (cálculo matricial) e gera '
+             'uma linha por BOM, sem detalhar a estrutura. Indicado para custear o catálogo inteiro.')
+    operation_time_source = fields.Selection([
+        ('standard', 'Tempo Padrão da Operação'),
+        ('actual', 'Tempo Real das Ordens de Trabalho'),
+    ], string='Tempo das Operações', required=True, default='standard',
+        help='Tempo real: média de minutos por unidade das ordens de trabalho concluídas no período. '
+             'Operações sem histórico no período usam o tempo padrão.')
+    actual_time_days = fields.Integer(
+        string='Período do Tempo Real (dias)',
+        default=lambda self: int(self.env['ir.config_parameter'].sudo().get_param('custom_bom.actual_time_days', 90)))
+    export_format = fields.Selection([
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+    ], string='Formato', required=True, default='csv',
+        help='No Excel os valores são gravados como números, com a hierarquia em grupos recolhíveis.')
     filename = fields.Char(string='Nome do Arquivo', compute='_compute_filename')
-    csv_data = fields.Binary(string='Arquivo CSV', readonly=True)
+    stream_export = fields.Boolean(
+        string='Exportar em Streaming',
+        help='Grava o arquivo diretamente no filestore, sem montá-lo em memória. '
+             'Recomendado para relatórios grandes.')
+    attachment_id = fields.Many2one('ir.attachment', string='Anexo Exportado', readonly=True)
+    parallel_workers = fields.Integer(
+        string='Processos Paralelos',
+        default=lambda self: int(self.env['ir.config_parameter'].sudo().get_param('custom_bom.parallel_workers', 0)),
+        help='Quando maior que 1, as BOMs selecionadas são divididas entre processos filhos iniciados do zero, '
+             'cada um com seu próprio registro e conexão ao banco. Indicado para servidores dedicados a relatórios.')
+    profile_run = fields.Boolean(
+        string='Gerar Perfil (cProfile)', groups='base.group_system',
+        help='Grava o perfil de execução da exportação como anexo do registro de execução.')
+    save_report = fields.Boolean(
+        string='Salvar Relatório Persistente',
+        help='Grava também o relatório persistente, aproveitando a mesma explosão das BOMs usada no arquivo.')
+    run_in_background = fields.Boolean(
+        string='Gerar em Segundo Plano',
+        help='O relatório persistente é colocado na fila e gerado pelo processamento agendado, '
+             'sem ocupar a requisição do usuário.')
     
-    @api.depends('bom_ids')
+    @api.depends('bom_ids', 'export_format')
     def _compute_filename(self):
         for record in self:
+            extension = record.export_format or 'csv'
             if record.bom_ids:
                 bom_codes = [bom.code or bom.product_id.default_code or bom.product_id.name or 'BOM' for bom in record.bom_ids[:3]]
-                record.filename = f'estrutura_custo_detalhada_{"_".join(bom_codes)}.csv'
+                record.filename = f'estrutura_custo_detalhada_{"_".join(bom_codes)}.{extension}'
             else:
-                record.filename = 'estrutura_custo_detalhada.csv'
+                record.filename = f'estrutura_custo_detalhada.{extension}'
 
     def _format_float(self, value):
         """Formata valor numérico para string com 2 casas decimais usando vírgula"""
@@ -67,207 +171,264 @@ class CostReportWizard(models.TransientModel):
         except Exception:
             return ''
 
-    def _generate_level_columns(self, parent_names_path, current_item_name, item_display_level_index):
-        """Gera colunas de nível hierárquico"""
-        level_columns = [''] * self.max_display_levels
-        for i in range(len(parent_names_path)):
-            if i < self.max_display_levels:
-                level_columns[i] = parent_names_path[i]
-        if item_display_level_index < self.max_display_levels:
-            level_columns[item_display_level_index] = current_item_name
-        else:
-            if self.max_display_levels > 0:
-                if level_columns[self.max_display_levels - 1]:
-                    level_columns[self.max_display_levels - 1] += " > " + current_item_name
-                else:
-                    level_columns[self.max_display_levels - 1] = current_item_name
-        return level_columns
-
-    def _process_bom_recursively(self, top_level_main_product_code, parent_names_path_list, 
-                                bom_to_process, current_item_level, effective_qty_multiplier, 
-                                output_rows_list, use_formatting=True):
-        """Processa BOM recursivamente calculando custos"""
-        bom_product_record = bom_to_process.product_id if bom_to_process.product_id else bom_to_process.product_tmpl_id
-        bom_product_name_formatted = self._get_string_value("[{}] {}".format(
-            self._get_string_value(bom_product_record.default_code if bom_product_record else None),
-            self._get_string_value(bom_product_record.name if bom_product_record else None)
+    def _get_last_purchase_taxes_map(self, product_ids):
+        """Resolve em uma única consulta as taxas da última compra confirmada de cada produto"""
+        taxes_map = {}
+        if not product_ids:
+            return taxes_map
+
+        purchase_line_model = self.env['purchase.order.line']
+        purchase_line_model.flush(['product_id', 'state'])
+        query = purchase_line_model._where_calc([
+            ('product_id', 'in', sorted(product_ids)),
+            ('state', 'in', ['purchase', 'done'])
+        ])
+        purchase_line_model._apply_ir_rules(query, 'read')
+        from_clause, where_clause, where_params = query.get_sql()
+        self.env.cr.execute("""
+            SELECT DISTINCT ON ("purchase_order_line".product_id)
+                   "purchase_order_line".id, "purchase_order_line".product_id
+              FROM {}
+             WHERE {}
+          ORDER BY "purchase_order_line".product_id, "purchase_order_line".id DESC
+        """.format(from_clause, where_clause), where_params)
+        product_by_line_id = dict(self.env.cr.fetchall())
+
+        # Uma leitura para as taxas de todas as linhas encontradas
+        last_purchase_lines = purchase_line_model.browse(list(product_by_line_id))
+        for last_purchase_line in last_purchase_lines:
+            tax_names = [tax.name or '' for tax in last_purchase_line.taxes_id]
+            taxes_map[product_by_line_id[last_purchase_line.id]] = ", ".join(filter(None, tax_names))
+        return taxes_map
+
+    def _get_bom_product_name(self, default_code, name):
+        """Nome de exibição '[código] nome' de um produto ou modelo"""
+        return self._get_string_value("[{}] {}".format(
+            self._get_string_value(default_code),
+            self._get_string_value(name)
         ))
-        
-        product_level_columns = self._generate_level_columns(parent_names_path_list, bom_product_name_formatted, current_item_level - 1)
-        path_for_children = parent_names_path_list + [bom_product_name_formatted]
-        children_display_level = current_item_level + 1
-
-        rolled_up_cost_for_this_bom_level = 0.0
-        tipo_linha_produto = 'Produto Principal' if current_item_level == 1 else 'Subconjunto'
-        bom_product_uom_name = self._get_string_value(bom_to_process.product_uom_id.name if bom_to_process.product_uom_id else '')
 
-        # Valores para formatação ou valores brutos
-        qty_value = effective_qty_multiplier * bom_to_process.product_qty
-        unit_cost_value = bom_product_record.standard_price if bom_product_record else 0.0
-        
-        if use_formatting:
-            qty_display = self._format_float(qty_value)
-            unit_cost_display = self._format_float(unit_cost_value)
-        else:
-            qty_display = qty_value
-            unit_cost_display = unit_cost_value
-
-        product_row_part1 = [
-            self._get_string_value(top_level_main_product_code),
-            self._get_string_value(bom_product_record.default_code if bom_product_record else None),
-        ]
-        product_row_part3_placeholder = [
-            self._get_string_value("[{}] {}".format(
+    def _get_bom_product_values(self, bom, snapshot):
+        """(default_code, name, standard_price) do produto da BOM, ou do modelo quando não há variante"""
+        if bom.product_id:
+            return snapshot.product(bom.product_id.id)
+        if bom.product_tmpl_id:
+            return snapshot.template(bom.product_tmpl_id.id)
+        return None, None, 0.0
+
+    def _new_bom_rollup(self, bom_to_process, snapshot):
+        """Inicia o rollup da BOM (multiplicador unitário) com dados do produto e operações"""
+        product_code, product_name, product_price = self._get_bom_product_values(bom_to_process, snapshot)
+        rollup = {
+            'item_code': self._get_string_value(product_code),
+            'item_name': self._get_bom_product_name(product_code, product_name),
+            'bom_reference': self._get_string_value("[{}] {}".format(
                 self._get_string_value(bom_to_process.code),
-                self._get_string_value(bom_product_record.name if bom_product_record else None)
+                self._get_string_value(product_name)
             )),
-            qty_display,
-            bom_product_uom_name,
-            unit_cost_display,
-            "CALCULANDO...",
-            '',
-            tipo_linha_produto,
-            '', '', '', ''
-        ]
-        product_row = product_row_part1 + product_level_columns + product_row_part3_placeholder
-        output_rows_list.append(product_row)
-        product_row_index_in_output = len(output_rows_list) - 1
+            'bom_qty': bom_to_process.product_qty,
+            'uom_name': self._get_string_value(
+                snapshot.uom_name(bom_to_process.product_uom_id.id) if bom_to_process.product_uom_id else ''),
+            'unit_cost': product_price,
+            'cost': 0.0,
+            'operations': [],
+            'components': [],
+        }
 
-        # Processa Operações se habilitado
+        # Operações por unidade do multiplicador
         if self.include_operations and bom_to_process.operation_ids:
             for op_line in bom_to_process.operation_ids:
-                op_name = self._get_string_value(op_line.name)
-                op_workcenter_name = self._get_string_value(op_line.workcenter_id.name if op_line.workcenter_id else '')
-                
-                op_time_per_unit_of_parent = float(op_line.time_cycle_manual or op_line.time_cycle or 0.0)
+                op_time_per_unit_of_parent = snapshot.operation_time(op_line)
                 op_cost_per_unit_of_parent = 0.0
-                if op_line.workcenter_id and op_line.workcenter_id.costs_hour > 0 and op_time_per_unit_of_parent > 0:
-                    op_cost_per_unit_of_parent = (op_time_per_unit_of_parent / 60.0) * op_line.workcenter_id.costs_hour
-                
-                effective_total_op_time = op_time_per_unit_of_parent * effective_qty_multiplier
-                effective_total_op_cost = op_cost_per_unit_of_parent * effective_qty_multiplier
-                rolled_up_cost_for_this_bom_level += effective_total_op_cost
-                
-                op_level_columns = self._generate_level_columns(path_for_children, op_name, children_display_level - 1)
-
-                op_row_part1 = [
-                    self._get_string_value(top_level_main_product_code),
-                    self._get_string_value(bom_product_record.default_code if bom_product_record else None),
-                ]
-                
-                if use_formatting:
-                    op_cost_display = self._format_float(effective_total_op_cost)
-                    op_time_display = self._format_duration(effective_total_op_time)
-                else:
-                    op_cost_display = effective_total_op_cost
-                    op_time_display = effective_total_op_cost  # Para dados brutos, usamos o custo
-
-                op_row_part3 = [
-                    '', '', '', '',
-                    op_cost_display,
-                    '',
-                    'Operação',
-                    op_name, op_workcenter_name,
-                    op_time_display,
-                    op_cost_display
-                ]
-                op_row = op_row_part1 + op_level_columns + op_row_part3
-                output_rows_list.append(op_row)
-
-        # Processa Componentes se habilitado
-        if self.include_components:
-            for comp_line in bom_to_process.bom_line_ids:
-                component_product = comp_line.product_id
-                qty_of_comp_in_this_bom = comp_line.product_qty
-                next_level_effective_qty = qty_of_comp_in_this_bom * effective_qty_multiplier
-                
-                component_uom_name = self._get_string_value(comp_line.product_uom_id.name if comp_line.product_uom_id else '')
-
-                actual_sub_bom = self.env['mrp.bom']._bom_find(
-                    product=component_product,
-                    company_id=bom_to_process.company_id.id,
-                    bom_type=bom_to_process.type
+                workcenter_name, costs_hour = ('', 0.0)
+                if op_line.workcenter_id:
+                    workcenter_name, costs_hour = snapshot.workcenter(op_line.workcenter_id.id)
+                if costs_hour > 0 and op_time_per_unit_of_parent > 0:
+                    op_cost_per_unit_of_parent = (op_time_per_unit_of_parent / 60.0) * costs_hour
+
+                rollup['operations'].append((
+                    self._get_string_value(op_line.name),
+                    self._get_string_value(workcenter_name),
+                    op_time_per_unit_of_parent,
+                    op_cost_per_unit_of_parent,
+                ))
+                rollup['cost'] += op_cost_per_unit_of_parent
+        return rollup
+
+    def _add_raw_component(self, rollup, comp_line, taxes_map, snapshot):
+        """Adiciona uma matéria-prima ao rollup"""
+        component_product = comp_line.product_id
+        if component_product:
+            component_code, component_name, component_unit_cost = snapshot.product(component_product.id)
+        else:
+            component_code, component_name, component_unit_cost = None, None, 0.0
+        rollup['components'].append(('componente', comp_line.product_qty, {
+            'item_code': self._get_string_value(component_code),
+            'item_name': self._get_bom_product_name(component_code, component_name),
+            'uom_name': self._get_string_value(
+                snapshot.uom_name(comp_line.product_uom_id.id) if comp_line.product_uom_id else ''),
+            'unit_cost': component_unit_cost,
+            'taxes': taxes_map.get(component_product.id, '') if self.include_taxes and component_product else '',
+        }))
+        rollup['cost'] += comp_line.product_qty * component_unit_cost
+
+    def _get_max_bom_depth(self):
+        """Profundidade máxima permitida para a explosão de uma BOM"""
+        return int(self.env['ir.config_parameter'].sudo().get_param('custom_bom.max_bom_depth', 100))
+
+    def _get_bom_rollup(self, bom_to_process, explosion):
+        """Calcula o rollup da BOM para multiplicador unitário usando uma pilha explícita
+
+        Cada BOM é explodida uma única vez por relatório (memo). Estruturas cíclicas
+        ou mais profundas que o limite configurado interrompem a geração com erro.
+        """
+        rollup_memo = explosion['rollup_memo']
+        if bom_to_process.id in rollup_memo:
+            return rollup_memo[bom_to_process.id]
+
+        bom_graph = explosion['bom_graph']
+        taxes_map = explosion['taxes_map']
+        snapshot = explosion['snapshot']
+        max_depth = explosion['max_depth']
+        recorder = explosion.get('recorder')
+        stack = [_ExplosionFrame(bom_to_process, self._new_bom_rollup(bom_to_process, snapshot),
+                                 self.include_components)]
+        on_stack = {bom_to_process.id}
+        while stack:
+            frame = stack[-1]
+            child_frame = None
+            while frame.position < len(frame.comp_lines):
+                comp_line = frame.comp_lines[frame.position]
+                frame.position += 1
+
+                actual_sub_bom = bom_graph.find(
+                    comp_line.product_id,
+                    company_id=frame.bom.company_id.id,
+                    bom_type=frame.bom.type
                 )
-                
-                if actual_sub_bom:
-                    cost_from_sub_assembly = self._process_bom_recursively(
-                        self._get_string_value(top_level_main_product_code),
-                        path_for_children,
-                        actual_sub_bom,
-                        children_display_level,
-                        next_level_effective_qty,
-                        output_rows_list,
-                        use_formatting
-                    )
-                    rolled_up_cost_for_this_bom_level += cost_from_sub_assembly
-                else:
+                if not actual_sub_bom:
                     # É uma matéria-prima
-                    last_purchase_taxes_str = ''
-                    if self.include_taxes and component_product:
-                        purchase_line_model = self.env['purchase.order.line']
-                        last_purchase_lines = purchase_line_model.search([
-                            ('product_id', '=', component_product.id),
-                            ('state', 'in', ['purchase', 'done'])
-                        ], order='id desc', limit=1)
-                        
-                        if last_purchase_lines:
-                            last_purchase_line = last_purchase_lines[0]
-                            if last_purchase_line.taxes_id:
-                                tax_names = [tax.name or '' for tax in last_purchase_line.taxes_id]
-                                last_purchase_taxes_str = ", ".join(filter(None, tax_names))
-                    
-                    comp_item_name_formatted = self._get_string_value("[{}] {}".format(
-                        self._get_string_value(component_product.default_code if component_product else None),
-                        self._get_string_value(component_product.name if component_product else None)
-                    ))
-                    comp_level_columns = self._generate_level_columns(path_for_children, comp_item_name_formatted, children_display_level - 1)
-                    
-                    effective_component_line_cost = next_level_effective_qty * (component_product.standard_price if component_product else 0.0)
-                    rolled_up_cost_for_this_bom_level += effective_component_line_cost
-
-                    raw_material_row_part1 = [
-                        self._get_string_value(top_level_main_product_code),
-                        self._get_string_value(component_product.default_code if component_product else None),
-                    ]
-                    
-                    if use_formatting:
-                        qty_display = self._format_float(next_level_effective_qty)
-                        unit_cost_display = self._format_float(component_product.standard_price if component_product else 0.0)
-                        total_cost_display = self._format_float(effective_component_line_cost)
-                    else:
-                        qty_display = next_level_effective_qty
-                        unit_cost_display = component_product.standard_price if component_product else 0.0
-                        total_cost_display = effective_component_line_cost
-
-                    raw_material_row_part3 = [
-                        '',
-                        qty_display,
-                        component_uom_name,
-                        unit_cost_display,
-                        total_cost_display,
-                        last_purchase_taxes_str,
-                        'Componente',
-                        '', '', '', ''
-                    ]
-                    raw_material_row = raw_material_row_part1 + comp_level_columns + raw_material_row_part3
-                    output_rows_list.append(raw_material_row)
-
-        # Atualiza o custo total na linha do produto/subconjunto
-        cost_column_index = 2 + self.max_display_levels + 4
-        if product_row_index_in_output < len(output_rows_list) and len(output_rows_list[product_row_index_in_output]) > cost_column_index:
-            if use_formatting:
-                output_rows_list[product_row_index_in_output][cost_column_index] = self._format_float(rolled_up_cost_for_this_bom_level)
-            else:
-                output_rows_list[product_row_index_in_output][cost_column_index] = rolled_up_cost_for_this_bom_level
-        
-        return rolled_up_cost_for_this_bom_level
-
-    def _generate_report_data_raw(self, output_rows_list):
-        """Gera os dados do relatório sem formatação - usado pelo modelo CostReport"""
-        if not self.bom_ids:
-            return
-        
-        # Cabeçalho
+                    self._add_raw_component(frame.rollup, comp_line, taxes_map, snapshot)
+                    continue
+                if actual_sub_bom.id in rollup_memo:
+                    frame.add_sub_assembly(comp_line.product_qty, rollup_memo[actual_sub_bom.id])
+                    continue
+                if actual_sub_bom.id in on_stack:
+                    self._raise_bom_cycle(stack, actual_sub_bom)
+                if len(stack) >= max_depth:
+                    raise UserError(_(
+                        'A estrutura da BOM %s ultrapassa o limite de %s níveis. '
+                        'Verifique a estrutura ou ajuste o parâmetro custom_bom.max_bom_depth.'
+                    ) % (stack[0].rollup['item_name'], max_depth))
+
+                frame.pending_qty = comp_line.product_qty
+                child_frame = _ExplosionFrame(actual_sub_bom, self._new_bom_rollup(actual_sub_bom, snapshot),
+                                              self.include_components)
+                break
+
+            if child_frame is not None:
+                stack.append(child_frame)
+                on_stack.add(child_frame.bom.id)
+                continue
+
+            # Todos os componentes processados: a BOM está completa
+            stack.pop()
+            on_stack.discard(frame.bom.id)
+            rollup_memo[frame.bom.id] = frame.rollup
+            if recorder:
+                recorder.subtree_done(frame.bom, time.perf_counter() - frame.started)
+            if stack:
+                stack[-1].add_sub_assembly(stack[-1].pending_qty, frame.rollup)
+
+        return rollup_memo[bom_to_process.id]
+
+    def _raise_bom_cycle(self, stack, repeated_bom):
+        """Interrompe a explosão informando a cadeia de BOMs que forma o ciclo"""
+        stack_bom_ids = [frame.bom.id for frame in stack]
+        chain = [frame.rollup['item_name'] for frame in stack[stack_bom_ids.index(repeated_bom.id):]]
+        chain.append(chain[0])
+        raise UserError(_('Estrutura cíclica detectada nas BOMs: %s') % ' > '.join(chain))
+
+    def _iter_rollup_rows(self, top_level_main_product_code, parent_names_path_list, rollup,
+                          current_item_level, effective_qty_multiplier):
+        """Gera as linhas (CostRow) de um rollup com uma pilha explícita, escalando os valores unitários"""
+        top_level_code = self._get_string_value(top_level_main_product_code)
+        max_levels = self.max_display_levels
+        stack = []
+        pending_bom = (rollup, _root_path_node(parent_names_path_list, max_levels),
+                       current_item_level, effective_qty_multiplier)
+        while True:
+            if pending_bom is not None:
+                rollup, path_node, item_level, qty_multiplier = pending_bom
+                pending_bom = None
+                children_node = _child_path_node(path_node, rollup['item_name'], max_levels)
+                yield self._make_bom_row(top_level_code, rollup, path_node, item_level, qty_multiplier)
+                for operation in rollup['operations']:
+                    yield self._make_operation_row(top_level_code, rollup, operation, children_node,
+                                                   qty_multiplier)
+                stack.append((iter(rollup['components']), children_node, item_level + 1, qty_multiplier))
+
+            if not stack:
+                break
+            components, children_node, children_level, qty_multiplier = stack[-1]
+            component_item = next(components, None)
+            if component_item is None:
+                stack.pop()
+                continue
+
+            component_kind, qty_of_comp_in_this_bom, component = component_item
+            next_level_effective_qty = qty_of_comp_in_this_bom * qty_multiplier
+            if component_kind == 'subconjunto':
+                pending_bom = (component, children_node, children_level, next_level_effective_qty)
+                continue
+            yield self._make_component_row(top_level_code, component, children_node, next_level_effective_qty)
+
+    def _make_bom_row(self, top_level_code, rollup, path_node, item_level, qty_multiplier):
+        """Linha do produto principal ou subconjunto"""
+        return CostRow(
+            top_level_code, rollup['item_code'],
+            _level_columns(path_node, rollup['item_name'], self.max_display_levels),
+            'produto_principal' if item_level == 1 else 'subconjunto',
+            path_node.depth,
+            bom_reference=rollup['bom_reference'],
+            item_qty=qty_multiplier * rollup['bom_qty'],
+            uom_name=rollup['uom_name'],
+            unit_cost=rollup['unit_cost'],
+            total_cost=qty_multiplier * rollup['cost'],
+        )
+
+    def _make_operation_row(self, top_level_code, rollup, operation, path_node, qty_multiplier):
+        """Linha de uma operação da BOM"""
+        op_name, op_workcenter_name, op_time_per_unit, op_cost_per_unit = operation
+        effective_total_op_cost = op_cost_per_unit * qty_multiplier
+        return CostRow(
+            top_level_code, rollup['item_code'],
+            _level_columns(path_node, op_name, self.max_display_levels),
+            'operacao',
+            path_node.depth,
+            total_cost=effective_total_op_cost,
+            operation_name=op_name,
+            workcenter_name=op_workcenter_name,
+            operation_time=op_time_per_unit * qty_multiplier,
+            operation_cost=effective_total_op_cost,
+        )
+
+    def _make_component_row(self, top_level_code, component, path_node, next_level_effective_qty):
+        """Linha de uma matéria-prima"""
+        return CostRow(
+            top_level_code, component['item_code'],
+            _level_columns(path_node, component['item_name'], self.max_display_levels),
+            'componente',
+            path_node.depth,
+            item_qty=next_level_effective_qty,
+            uom_name=component['uom_name'],
+            unit_cost=component['unit_cost'],
+            total_cost=next_level_effective_qty * component['unit_cost'],
+            purchase_taxes=component['taxes'],
+        )
+
+    def _get_report_header(self):
+        """Retorna a linha de cabeçalho do relatório"""
         header_data_part1 = ['Código LdM Principal', 'Código Item']
         header_level_cols = []
         for i in range(1, self.max_display_levels + 1):
@@ -279,74 +440,228 @@ class CostReportWizard(models.TransientModel):
             'Operação: Nome (Detalhe)', 'Operação: Centro Trabalho (Detalhe)',
             'Operação: Tempo (HH:MM:SS)', 'Operação: Custo (Detalhe)'
         ]
-        header_data = header_data_part1 + header_level_cols + header_data_part3
-        output_rows_list.append(header_data)
-
-        # Processa cada BOM
-        for bom_record_main in self.bom_ids:
-            main_product_rec = bom_record_main.product_id if bom_record_main.product_id else bom_record_main.product_tmpl_id
-            top_level_code = self._get_string_value(main_product_rec.default_code if main_product_rec else None)
-            
-            initial_multiplier = bom_record_main.product_qty if bom_record_main.product_qty > 0 else 1.0
+        return header_data_part1 + header_level_cols + header_data_part3
+
+    def _prepare_explosion(self, recorder=None, snapshot=None):
+        """Carrega as estruturas compartilhadas por todas as BOMs do relatório
+
+        Um snapshot restaurado fornece os custos e nomes gravados; sem ele, os
+        valores atuais são lidos em lote para toda a estrutura.
+        """
+        recorder = recorder or RunRecorder(self.env.cr)
+        # Carrega de uma vez o índice produto -> BOM de toda a estrutura
+        with recorder.phase('resolution'):
+            bom_graph = BomGraph(self.env).load(self.bom_ids)
+            snapshot = (snapshot or CostSnapshot(self.env)).load(bom_graph.bom_ids(), *self._get_actual_time_params())
+        if self.catalog_rollup:
+            with recorder.phase('explosion'):
+                catalog_costs = self._get_catalog_costs(bom_graph, snapshot)
+            return {
+                'bom_graph': bom_graph,
+                'taxes_map': {},
+                'snapshot': snapshot,
+                'catalog_costs': catalog_costs,
+                'recorder': recorder,
+            }
+        taxes_map = {}
+        if self.include_taxes and self.include_components:
+            with recorder.phase('taxes'):
+                taxes_map = self._get_last_purchase_taxes_map(bom_graph.leaf_product_ids())
+        return {
+            'bom_graph': bom_graph,
+            'taxes_map': taxes_map,
+            'snapshot': snapshot,
+            # Rollups por BOM compartilhados entre todas as ocorrências do relatório
+            'rollup_memo': {},
+            'max_depth': self._get_max_bom_depth(),
+            'recorder': recorder,
+        }
 
-            self._process_bom_recursively(
-                top_level_code, [], bom_record_main, 1, initial_multiplier, output_rows_list, use_formatting=False
+    def _get_actual_time_params(self):
+        """(dias, TTL em segundos) dos tempos reais das operações; (0, 0) para os tempos padrão"""
+        if self.operation_time_source != 'actual' or not self.include_operations:
+            return 0, 0
+        ttl = int(self.env['ir.config_parameter'].sudo().get_param('custom_bom.actual_time_cache_ttl', 900))
+        return max(self.actual_time_days, 1), ttl
+
+    def _get_catalog_costs(self, bom_graph=None, snapshot=None):
+        """Custo consolidado de todas as BOMs selecionadas, calculado de uma vez"""
+        return BomCostMatrix(
+            self.env,
+            include_operations=self.include_operations,
+            include_components=self.include_components,
+            bom_graph=bom_graph,
+            snapshot=snapshot,
+        ).load(self.bom_ids).solve()
+
+    def _iter_bom_rows(self, bom_record_main, explosion):
+        """Gera as linhas de uma BOM principal do relatório
+
+        É um gerador: a explosão só começa no consumo da primeira linha, dentro
+        da fase 'explosion' e do tempo da BOM medidos pelo RunRecorder.
+        """
+        snapshot = explosion['snapshot']
+        top_level_code = self._get_string_value(self._get_bom_product_values(bom_record_main, snapshot)[0])
+
+        initial_multiplier = bom_record_main.product_qty if bom_record_main.product_qty > 0 else 1.0
+
+        if 'catalog_costs' in explosion:
+            # Apenas a linha da BOM, com o custo já consolidado
+            rollup = self._new_bom_rollup(bom_record_main, snapshot)
+            rollup['cost'] = explosion['catalog_costs'][bom_record_main.id]
+            row = self._make_bom_row(
+                top_level_code, rollup, _root_path_node([], self.max_display_levels), 1, initial_multiplier
             )
-            
-            if len(self.bom_ids) > 1 and bom_record_main != self.bom_ids[-1]:
-                output_rows_list.append([''] * len(header_data))
-
-    def _generate_report_data(self, output_rows_list):
-        """Gera os dados do relatório com formatação - usado para CSV"""
-        if not self.bom_ids:
+            yield row
             return
-        
-        # Cabeçalho
-        header_data_part1 = ['Código LdM Principal', 'Código Item']
-        header_level_cols = []
-        for i in range(1, self.max_display_levels + 1):
-            header_level_cols.append(f'Nível {i}')
-        
-        header_data_part3 = [
-            'Ref. LdM Item', 'Qtd Item', 'Unidade de Medida', 'Custo Unit. Item',
-            'Custo Total Linha Item/LdM', 'Taxas Última Compra', 'Tipo de Linha',
-            'Operação: Nome (Detalhe)', 'Operação: Centro Trabalho (Detalhe)',
-            'Operação: Tempo (HH:MM:SS)', 'Operação: Custo (Detalhe)'
-        ]
-        header_data = header_data_part1 + header_level_cols + header_data_part3
-        output_rows_list.append(header_data)
 
-        # Processa cada BOM
-        for bom_record_main in self.bom_ids:
-            main_product_rec = bom_record_main.product_id if bom_record_main.product_id else bom_record_main.product_tmpl_id
-            top_level_code = self._get_string_value(main_product_rec.default_code if main_product_rec else None)
-            
-            initial_multiplier = bom_record_main.product_qty if bom_record_main.product_qty > 0 else 1.0
+        rollup = self._get_bom_rollup(bom_record_main, explosion)
+        yield from self._iter_rollup_rows(top_level_code, [], rollup, 1, initial_multiplier)
 
-            self._process_bom_recursively(
-                top_level_code, [], bom_record_main, 1, initial_multiplier, output_rows_list, use_formatting=True
-            )
-            
-            if len(self.bom_ids) > 1 and bom_record_main != self.bom_ids[-1]:
-                output_rows_list.append([''] * len(header_data))
+    def _iter_bom_row_groups(self, boms=None, explosion=None, recorder=None):
+        """Gera pares (BOM principal, linhas) na ordem de bom_ids
 
-    def create_persistent_report(self):
-        """Cria um relatório persistente que pode ser visualizado em tela"""
-        if not self.bom_ids:
-            raise UserError(_('Selecione pelo menos um BOM para criar o relatório.'))
-        
-        # Cria o relatório persistente
-        cost_report = self.env['cost.report'].create({
+        Com um RunRecorder, as linhas de cada BOM são medidas ao serem consumidas.
+        """
+        boms = self.bom_ids if boms is None else boms
+        if self.parallel_workers > 1 and len(boms) > 1 and not self.catalog_rollup:
+            snapshot = explosion['snapshot'] if explosion else None
+            row_groups = explode_boms_in_parallel(self, boms, self.parallel_workers, snapshot=snapshot)
+        else:
+            if explosion is None:
+                explosion = self._prepare_explosion(recorder)
+            row_groups = (
+                (bom_record_main, self._iter_bom_rows(bom_record_main, explosion))
+                for bom_record_main in boms
+            )
+        if recorder is None:
+            return row_groups
+        return ((bom, recorder.iter_bom_rows(bom, rows)) for bom, rows in row_groups)
+
+    def _get_bom_fingerprints(self, explosion, boms=None):
+        """Calcula, por BOM principal, uma impressão digital de tudo que afeta suas linhas
+
+        Considera as datas de alteração das BOMs, linhas e operações da estrutura,
+        o custo padrão dos produtos, o custo/hora dos centros de trabalho, as taxas
+        de compra e as opções do relatório.
+        """
+        boms = self.bom_ids if boms is None else boms
+        bom_graph = explosion['bom_graph']
+        closures = {bom.id: bom_graph.closure_bom_ids(bom) for bom in boms}
+        all_bom_ids = tuple(sorted(set().union(*closures.values()))) if closures else ()
+        if not all_bom_ids:
+            return {}
+
+        self.env['mrp.bom'].flush(['write_date'])
+        self.env['mrp.bom.line'].flush(['bom_id', 'product_id', 'write_date'])
+        self.env['mrp.routing.workcenter'].flush(['bom_id', 'workcenter_id', 'write_date'])
+        cr = self.env.cr
+        cr.execute("SELECT id, write_date, product_id, product_tmpl_id FROM mrp_bom WHERE id IN %s", (all_bom_ids,))
+        bom_rows = cr.fetchall()
+        cr.execute("""
+            SELECT bom_id, id, write_date, product_id FROM mrp_bom_line
+             WHERE bom_id IN %s ORDER BY bom_id, id
+        """, (all_bom_ids,))
+        line_rows = cr.fetchall()
+        cr.execute("""
+            SELECT bom_id, id, write_date, workcenter_id FROM mrp_routing_workcenter
+             WHERE bom_id IN %s ORDER BY bom_id, id
+        """, (all_bom_ids,))
+        operation_rows = cr.fetchall()
+
+        # Custos do snapshot da execução (os gravados, quando o relatório tem custos congelados)
+        snapshot = explosion['snapshot']
+        snapshot.preload(
+            product_ids={row[2] for row in bom_rows} | {row[3] for row in line_rows},
+            template_ids={row[3] for row in bom_rows if not row[2]},
+            workcenter_ids={row[3] for row in operation_rows},
+        )
+        time_window, time_ttl = self._get_actual_time_params()
+        if time_window:
+            snapshot.preload_operation_times({row[1] for row in operation_rows}, time_window, time_ttl)
+        operation_times = snapshot.operation_times or {}
+        product_prices = {product_id: price for product_id, (_code, _name, price) in snapshot.products.items()}
+        template_prices = {template_id: price for template_id, (_code, _name, price) in snapshot.templates.items()}
+        workcenter_costs = {workcenter_id: rate for workcenter_id, (_name, rate) in snapshot.workcenters.items()}
+        taxes_map = explosion['taxes_map']
+
+        signatures = {}
+        for bom_id, write_date, product_id, product_tmpl_id in bom_rows:
+            price = product_prices.get(product_id) if product_id else template_prices.get(product_tmpl_id)
+            signatures[bom_id] = ['bom:%s:%s:%r' % (bom_id, write_date, price)]
+        for bom_id, line_id, write_date, product_id in line_rows:
+            signatures[bom_id].append('line:%s:%s:%r:%s' % (
+                line_id, write_date, product_prices.get(product_id), taxes_map.get(product_id, '')))
+        for bom_id, operation_id, write_date, workcenter_id in operation_rows:
+            signatures[bom_id].append('op:%s:%s:%r:%r' % (
+                operation_id, write_date, workcenter_costs.get(workcenter_id), operation_times.get(operation_id)))
+
+        options = 'options:%s:%s:%s:%s:%s:%s' % (
+            self.max_display_levels, self.include_operations, self.include_components, self.include_taxes,
+            self.catalog_rollup, self._get_actual_time_params()[0])
+        fingerprints = {}
+        for top_bom_id, closure in closures.items():
+            digest = hashlib.sha1(options.encode('utf-8'))
+            for bom_id in sorted(closure):
+                digest.update('\n'.join(signatures.get(bom_id, [])).encode('utf-8'))
+            fingerprints[top_bom_id] = digest.hexdigest()
+        return fingerprints
+
+    def _run_report_sinks(self, sinks, boms=None, explosion=None, recorder=None):
+        """Explode as BOMs uma única vez repassando cada linha a todos os destinos
+
+        O tempo fora da explosão é contabilizado na fase dos destinos: inserção
+        quando algum grava no banco, serialização para os arquivos.
+        """
+        recorder = recorder or RunRecorder(self.env.cr)
+        phase = 'insertion' if any(sink.phase == 'insertion' for sink in sinks) else 'serialization'
+        with recorder.phase(phase):
+            header = self._get_report_header()
+            for sink in sinks:
+                sink.start(header)
+            for bom, rows in self._iter_bom_row_groups(boms=boms, explosion=explosion, recorder=recorder):
+                for sink in sinks:
+                    sink.begin_bom(bom)
+                if len(sinks) == 1:
+                    write_row = sinks[0].write_row
+                    for row in rows:
+                        write_row(row)
+                else:
+                    for row in rows:
+                        for sink in sinks:
+                            sink.write_row(row)
+                for sink in sinks:
+                    sink.end_bom(bom)
+            for sink in sinks:
+                sink.close()
+
+    def _create_cost_report(self):
+        """Relatório persistente, ainda sem linhas, com as opções do assistente"""
+        return self.env['cost.report'].create({
             'name': self.name,
             'bom_ids': [(6, 0, self.bom_ids.ids)],
             'max_display_levels': self.max_display_levels,
             'include_operations': self.include_operations,
             'include_components': self.include_components,
             'include_taxes': self.include_taxes,
+            'catalog_rollup': self.catalog_rollup,
+            'operation_time_source': self.operation_time_source,
+            'actual_time_days': self.actual_time_days,
         })
+
+    def create_persistent_report(self):
+        """Cria um relatório persistente que pode ser visualizado em tela"""
+        if not self.bom_ids:
+            raise UserError(_('Selecione pelo menos um BOM para criar o relatório.'))
+        
+        # Cria o relatório persistente
+        cost_report = self._create_cost_report()
         
-        # Gera o relatório
-        cost_report.action_generate_report()
+        # Gera o relatório (ou agenda a geração)
+        if self.run_in_background:
+            cost_report.action_enqueue()
+        else:
+            cost_report.action_generate_report()
         
         # Retorna para o relatório criado
         return {
@@ -357,38 +672,108 @@ class CostReportWizard(models.TransientModel):
             'target': 'current',
         }
 
+    def _create_streamed_attachment(self, filename, mimetype, write_content):
+        """Anexo do assistente gravado direto no filestore (ver tools.attachments)"""
+        return create_streamed_attachment(self.env, filename, mimetype, write_content,
+                                          res_model=self._name, res_id=self.id)
+
+    def _new_file_sink(self, binary_file):
+        """Destino do arquivo exportado, no formato escolhido"""
+        if self.export_format == 'xlsx':
+            return XlsxSink(self, binary_file)
+        return CsvSink(self, binary_file)
+
+    def _write_export_file(self, binary_file, recorder=None, extra_sinks=(), explosion=None):
+        """Escreve o arquivo linha a linha; extra_sinks recebem as mesmas linhas na mesma passada"""
+        self._run_report_sinks([self._new_file_sink(binary_file)] + list(extra_sinks),
+                               explosion=explosion, recorder=recorder)
+
+    def _get_export_mimetype(self):
+        if self.export_format == 'xlsx':
+            return 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return 'text/csv'
+
+    def _generate_cost_report_stream(self, recorder=None, extra_sinks=(), explosion=None):
+        """Exporta o arquivo para um anexo gravado direto no filestore"""
+        return self._create_streamed_attachment(
+            self.filename, self._get_export_mimetype(),
+            lambda binary_file: self._write_export_file(binary_file, recorder, extra_sinks, explosion)
+        )
+
+    def _get_download_action(self, attachment):
+        """Ação de download por streaming do anexo exportado"""
+        self.write({'attachment_id': attachment.id})
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/custom_bom/cost_report/download/%s' % attachment.id,
+            'target': 'self',
+        }
+
+    def _new_run_recorder(self):
+        """Coletor de métricas da execução; o perfil é restrito a administradores"""
+        profile = self.env.user.has_group('base.group_system') and self.sudo().profile_run
+        return RunRecorder(self.env.cr, profile=profile)
+
+    @api.autovacuum
+    def _gc_export_attachments(self):
+        """Remove anexos exportados por assistentes já descartados"""
+        limit_date = fields.Datetime.now() - timedelta(days=1)
+        self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('create_date', '<', limit_date),
+        ]).unlink()
+
     def generate_cost_report(self):
-        """Gera o relatório de custo detalhado"""
+        """Gera o relatório de custo detalhado
+
+        Resultados idênticos já gerados (mesmas BOMs, opções e impressões
+        digitais) são reaproveitados do cache: o arquivo é devolvido e as
+        linhas do relatório persistente são copiadas, sem nova explosão.
+        """
         if not self.bom_ids:
             raise UserError(_('Selecione pelo menos um BOM para gerar o relatório.'))
 
-        csv_data_rows = []
-        
-        # Gera os dados do relatório
-        self._generate_report_data(csv_data_rows)
-
-        # Gera CSV
-        output = StringIO()
-        writer = csv.writer(output, delimiter=';', quoting=csv.QUOTE_ALL)
-        for row in csv_data_rows:
-            writer.writerow(row)
-        
-        csv_content = output.getvalue()
-        output.close()
-
-        # Codifica em base64 para download
-        csv_data = base64.b64encode(csv_content.encode('utf-8-sig'))
-        
-        # Atualiza o wizard com os dados
-        self.write({
-            'csv_data': csv_data,
-        })
-
-        # Retorna ação para download
-        return {
-            'type': 'ir.actions.act_window',
-            'res_model': 'cost.report.wizard',
-            'view_mode': 'form',
-            'res_id': self.id,
-            'target': 'new',
-        }
+        recorder = self._new_run_recorder()
+        explosion = self._prepare_explosion(recorder)
+        with recorder.phase('resolution'):
+            fingerprints = self._get_bom_fingerprints(explosion)
+        cache_model = self.env['cost.report.cache']
+        file_key = cache_model._make_key(self, fingerprints, self.export_format)
+        attachment = cache_model._lookup(file_key).attachment_id
+
+        cost_report = self.env['cost.report']
+        extra_sinks = []
+        if self.save_report:
+            # O relatório persistente é gravado na mesma explosão do arquivo
+            cost_report = self._create_cost_report()
+            if not cost_report._copy_lines_from_cache(self, fingerprints, recorder):
+                extra_sinks.append(ReportLineSink(cost_report, fingerprints, recorder))
+
+        if not attachment:
+            if self.stream_export:
+                attachment = self._generate_cost_report_stream(recorder, extra_sinks, explosion)
+            else:
+                output = io.BytesIO()
+                self._write_export_file(output, recorder, extra_sinks, explosion)
+                attachment = self.env['ir.attachment'].create({
+                    'name': self.filename,
+                    'type': 'binary',
+                    'mimetype': self._get_export_mimetype(),
+                    'raw': output.getvalue(),
+                    'res_model': self._name,
+                    'res_id': self.id,
+                })
+                output.close()
+            cache_model._store(file_key, self.export_format, self.name, attachment=attachment)
+        elif extra_sinks:
+            self._run_report_sinks(extra_sinks, explosion=explosion, recorder=recorder)
+
+        if cost_report:
+            if extra_sinks:
+                with recorder.phase('aggregation'):
+                    cost_report._recompute_report_totals()
+                cost_report._store_in_cache(self, fingerprints)
+            cost_report.write({'state': 'generated'})
+        self.env['cost.report.run']._log_run(recorder, 'export', self.name, report=cost_report or None)
+
+        return self._get_download_action(attachment)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+import base64
+import csv
+import io
+import json
+import logging
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+from ..tools.attachments import open_attachment
+
+_logger = logging.getLogger(__name__)
+
+# Caracteres lidos por vez do arquivo JSON
+_JSON_READ_SIZE = 64 * 1024
+
+
+class CustomBomImportWizard(models.TransientModel):
+    _name = 'custom.bom.import.wizard'
+    _description = 'Importação em Massa de Custom BOMs'
+
+    import_file = fields.Binary(string='Arquivo', required=True)
+    filename = fields.Char(string='Nome do Arquivo')
+    file_format = fields.Selection([
+        ('csv', 'CSV'),
+        ('json', 'JSON'),
+    ], string='Formato', default='csv', required=True,
+        help='CSV: colunas bom_code, product, component, quantity, uom e notes, uma linha por componente; '
+             'linhas consecutivas com o mesmo bom_code (ou o mesmo product) formam um BOM.\n'
+             'JSON: lista de objetos {"code", "product", "lines": [{"product", "quantity", "uom", "notes"}]} '
+             'ou JSON Lines, um objeto por linha. O arquivo é lido um BOM por vez.')
+    delimiter = fields.Char(string='Separador', default=';', size=1)
+    chunk_size = fields.Integer(string='BOMs por Lote', default=500,
+                                help='BOMs gravados (e confirmados no banco) a cada lote')
+    commit_chunks = fields.Boolean(string='Confirmar a Cada Lote', default=True,
+                                   help='Lotes já importados são mantidos mesmo que um lote posterior falhe')
+    state = fields.Selection([
+        ('draft', 'Rascunho'),
+        ('done', 'Concluído'),
+    ], string='Status', default='draft')
+    bom_count = fields.Integer(string='BOMs Importados', readonly=True)
+    line_count = fields.Integer(string='Linhas Importadas', readonly=True)
+    error_log = fields.Text(string='Erros', readonly=True)
+
+    @api.onchange('filename')
+    def _onchange_filename(self):
+        if self.filename and self.filename.lower().endswith('.json'):
+            self.file_format = 'json'
+        elif self.filename:
+            self.file_format = 'csv'
+
+    def action_import(self):
+        """Importa o arquivo em lotes e mostra o resumo"""
+        self.ensure_one()
+        if self.chunk_size < 1:
+            raise UserError(_("O número de BOMs por lote deve ser maior que zero."))
+        lookups = self._build_lookups()
+        bom_count = line_count = 0
+        errors = []
+        chunk = []
+        for payload in self._iter_payloads():
+            chunk.append(payload)
+            if len(chunk) >= self.chunk_size:
+                boms, lines = self._import_chunk(chunk, lookups, errors)
+                bom_count += boms
+                line_count += lines
+                chunk = []
+        if chunk:
+            boms, lines = self._import_chunk(chunk, lookups, errors)
+            bom_count += boms
+            line_count += lines
+
+        self.write({
+            'state': 'done',
+            'bom_count': bom_count,
+            'line_count': line_count,
+            'error_log': '\n'.join(errors) or False,
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'custom.bom.import.wizard',
+            'view_mode': 'form',
+            'res_id': self.id,
+            'target': 'new',
+        }
+
+    def _iter_payloads(self):
+        """BOMs do arquivo, um por vez: {'row', 'code', 'product', 'lines': [...]}"""
+        with self._open_import_file() as binary_file:
+            if self.file_format == 'json':
+                yield from self._iter_json_payloads(binary_file)
+            else:
+                yield from self._iter_csv_payloads(binary_file)
+
+    def _open_import_file(self):
+        """Arquivo enviado, lido do anexo do campo sem decodificá-lo inteiro em memória"""
+        attachment = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('res_field', '=', 'import_file'),
+        ], limit=1)
+        if attachment:
+            return open_attachment(attachment)
+        return io.BytesIO(base64.b64decode(self.import_file or b''))
+
+    def _iter_csv_payloads(self, binary_file):
+        """Lê o CSV linha a linha, agrupando as linhas consecutivas de cada BOM"""
+        text_file = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(text_file, delimiter=self.delimiter or ';')
+        missing = {'product', 'component', 'quantity'} - set(reader.fieldnames or ())
+        if missing:
+            raise UserError(_("Colunas obrigatórias ausentes no CSV: %s") % ', '.join(sorted(missing)))
+        payload = None
+        for row_number, row in enumerate(reader, start=2):
+            code = (row.get('bom_code') or '').strip()
+            product = (row.get('product') or '').strip()
+            key = (code, product)
+            if payload is None or payload['key'] != key:
+                if payload is not None:
+                    yield payload
+                payload = {'key': key, 'row': row_number, 'code': code, 'product': product, 'lines': []}
+            if (row.get('component') or '').strip():
+                payload['lines'].append({
+                    'row': row_number,
+                    'product': row['component'].strip(),
+                    'quantity': row.get('quantity'),
+                    'uom': (row.get('uom') or '').strip(),
+                    'notes': row.get('notes') or False,
+                })
+        if payload is not None:
+            yield payload
+
+    def _iter_json_values(self, text_file):
+        """Objetos do arquivo JSON, decodificados um por vez
+
+        Aceita uma lista de objetos ou JSON Lines (um objeto por linha); só o
+        objeto em leitura fica em memória.
+        """
+        decoder = json.JSONDecoder()
+        buffer = ''
+        in_list = None
+        eof = False
+        while True:
+            buffer = buffer.lstrip(' \t\r\n,' if in_list else ' \t\r\n')
+            if not buffer and not eof:
+                chunk = text_file.read(_JSON_READ_SIZE)
+                eof = not chunk
+                buffer = chunk
+                continue
+            if in_list is None:
+                in_list = buffer.startswith('[')
+                buffer = buffer[1:] if in_list else buffer
+                continue
+            if not buffer or (in_list and buffer.startswith(']')):
+                if in_list and not buffer:
+                    raise UserError(_("Arquivo JSON inválido: lista não terminada."))
+                return
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except ValueError as e:
+                if eof:
+                    raise UserError(_("Arquivo JSON inválido: %s") % e)
+                # Objeto incompleto: lê o próximo bloco
+                chunk = text_file.read(_JSON_READ_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            if not isinstance(value, dict):
+                raise UserError(_("Arquivo JSON inválido: cada BOM deve ser um objeto."))
+            yield value
+            buffer = buffer[end:]
+
+    def _iter_json_payloads(self, binary_file):
+        text_file = io.TextIOWrapper(binary_file, encoding='utf-8-sig')
+        for index, item in enumerate(self._iter_json_values(text_file), start=1):
+            yield {
+                'row': index,
+                'code': (item.get('code') or '').strip(),
+                'product': (item.get('product') or '').strip(),
+                'lines': [{
+                    'row': index,
+                    'product': (line.get('product') or '').strip(),
+                    'quantity': line.get('quantity'),
+                    'uom': (line.get('uom') or '').strip(),
+                    'notes': line.get('notes') or False,
+                } for line in item.get('lines') or []],
+            }
+
+    def _build_lookups(self):
+        """Mapas de referência montados uma única vez: produtos por código interno e
+        código de barras, unidade padrão de cada produto e unidades por nome"""
+        company = self.env.company
+        self.env['product.product'].flush(['default_code', 'barcode', 'active', 'product_tmpl_id'])
+        self.env['product.template'].flush(['uom_id', 'company_id'])
+        self.env.cr.execute("""
+            SELECT product.id, product.default_code, product.barcode, template.uom_id
+              FROM product_product product
+              JOIN product_template template ON template.id = product.product_tmpl_id
+             WHERE product.active
+               AND (template.company_id IS NULL OR template.company_id = %s)
+        """, (company.id,))
+        products = {}
+        product_uoms = {}
+        for product_id, default_code, barcode, uom_id in self.env.cr.fetchall():
+            product_uoms[product_id] = uom_id
+            if barcode:
+                products.setdefault(barcode, product_id)
+            if default_code:
+                # O código interno prevalece sobre um código de barras igual
+                products[default_code] = product_id
+        uoms = {}
+        for uom in self.env['uom.uom'].search_read([], ['name']):
+            uoms.setdefault(uom['name'].strip().lower(), uom['id'])
+        return {'products': products, 'product_uoms': product_uoms, 'uoms': uoms, 'company': company}
+
+    def _prepare_bom_vals(self, payload, lookups, errors):
+        """Valores do BOM e das suas linhas; None quando alguma referência não é resolvida"""
+        products = lookups['products']
+        product_id = products.get(payload['product'])
+        if not product_id:
+            errors.append(_("Linha %s: produto '%s' não encontrado.") % (payload['row'], payload['product']))
+            return None
+        line_vals_list = []
+        for line in payload['lines']:
+            component_id = products.get(line['product'])
+            if not component_id:
+                errors.append(_("Linha %s: componente '%s' não encontrado.") % (line['row'], line['product']))
+                return None
+            try:
+                quantity = float(str(line['quantity'] or 0).replace(',', '.'))
+            except ValueError:
+                errors.append(_("Linha %s: quantidade inválida '%s'.") % (line['row'], line['quantity']))
+                return None
+            if line['uom']:
+                uom_id = lookups['uoms'].get(line['uom'].lower())
+                if not uom_id:
+                    errors.append(_("Linha %s: unidade '%s' não encontrada.") % (line['row'], line['uom']))
+                    return None
+            else:
+                uom_id = lookups['product_uoms'][component_id]
+            line_vals_list.append({
+                'product_id': component_id,
+                'product_qty': quantity,
+                'product_uom_id': uom_id,
+                'sequence': (len(line_vals_list) + 1) * 10,
+                'notes': line['notes'],
+            })
+        bom_vals = {
+            'product_id': product_id,
+            'company_id': lookups['company'].id,
+        }
+        if payload['code']:
+            bom_vals['code'] = payload['code']
+        return bom_vals, line_vals_list
+
+    def _import_chunk(self, payloads, lookups, errors):
+        """Grava um lote: cabeçalhos em um create e todas as linhas em outro
+
+        Os custos consolidados são recalculados uma única vez por lote, depois
+        das linhas (skip_bom_cost_recompute). Um erro de banco descarta só o
+        lote atual; com commit_chunks os lotes anteriores já estão confirmados.
+        """
+        prepared = []
+        for payload in payloads:
+            vals = self._prepare_bom_vals(payload, lookups, errors)
+            if vals:
+                prepared.append(vals)
+        if not prepared:
+            return 0, 0
+        try:
+            with self.env.cr.savepoint():
+                import_env = self.with_context(skip_bom_cost_recompute=True).env
+                boms = import_env['custom.bom'].create([bom_vals for bom_vals, _lines in prepared])
+                line_vals_list = []
+                for bom, (_bom_vals, bom_line_vals) in zip(boms, prepared):
+                    for line_vals in bom_line_vals:
+                        line_vals['bom_id'] = bom.id
+                        line_vals_list.append(line_vals)
+                import_env['custom.bom.line'].create(line_vals_list)
+                # Inclui os BOMs já existentes que passaram a usar os novos como sub-BOM
+                boms.with_env(self.env)._recompute_costs()
+        except Exception as e:
+            _logger.exception("Falha ao importar lote de BOMs a partir da linha %s", payloads[0]['row'])
+            errors.append(_("Lote a partir da linha %s descartado: %s") % (payloads[0]['row'], e))
+            return 0, 0
+        if self.commit_chunks:
+            self.env.cr.commit()
+        return len(boms), len(line_vals_list)